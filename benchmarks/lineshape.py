@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+
+'''\
+Measure how long each line shape kernel takes to sum the Voigt profiles.
+
+A random system of uncoupled peaks spread over the plot window is
+summed with each kernel by voigt_sum, and the fastest of several runs
+is kept.  The error of each kernel is the largest difference from the
+exact sum, relative to the largest value of the spectrum.  The Gaussian
+width sets how far most points are from every peak, in units of the
+width, which is what the approximate kernels depend on for their speed.
+'''
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+from os.path import abspath, dirname
+from sys import path
+from time import time
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+
+# Non-std. lib imports
+from numpy import abs, linspace
+from numpy.random import RandomState
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+
+# Local imports
+from rapid.common.lineshape import KERNELS
+from rapid.common.spectrum import voigt_sum
+
+
+def main():
+    parser = ArgumentParser(description=__doc__,
+                            formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument('--peaks', '-p', type=int, default=500,
+                        help='The number of peaks.  Default %(default)s.')
+    parser.add_argument('--points', '-n', type=int, default=100000,
+                        help='The number of points.  Default %(default)s.')
+    parser.add_argument('--gauss', '-g', type=float, default=1.0,
+                        help='The Gaussian standard deviation of each peak '
+                             'in wavenumbers, over a window 100 wide.  '
+                             'Default %(default)s.')
+    parser.add_argument('--repeat', '-r', type=int, default=3,
+                        help='How many times to run each kernel.  '
+                             'Default %(default)s.')
+    args = parser.parse_args()
+
+    random = RandomState(0)
+    omega = linspace(1900, 2000, args.points)
+    vib = random.uniform(1900, 2000, args.peaks)
+    HWHM = random.uniform(0.1, 5, args.peaks)
+    sigma = args.gauss * random.uniform(0.5, 1.5, args.peaks)
+    heights = random.uniform(0.1, 1, args.peaks) \
+            + 0.1j * random.randn(args.peaks)
+
+    exact = None
+    print('{0:>10}{1:>12}{2:>12}{3:>12}'.format('Kernel', 'Time (s)',
+                                                'Speedup', 'Error'))
+    for kernel in sorted(KERNELS, key=lambda x: x != 'exact'):
+        best = float('inf')
+        for _ in range(args.repeat):
+            start = time()
+            I = voigt_sum(omega, heights, vib, HWHM, sigma, kernel=kernel)
+            best = min(best, time() - start)
+        if exact is None:
+            exact, reference = I, best
+        error = abs(I - exact).max() / abs(exact).max()
+        print('{0:>10}{1:12.3f}{2:12.2f}{3:12.1e}'.format(kernel, best,
+                                                         reference / best,
+                                                         error))
+
+
+if __name__ == '__main__':
+    main()
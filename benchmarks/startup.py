@@ -0,0 +1,224 @@
+#! /usr/bin/env python
+
+'''\
+Measure how long the rapid command takes to import what it needs.
+
+Each command is run several times with "python -X importtime".  The
+median of the total import times of the runs is checked against the
+budget stored in startup_budget.json, as are the modules that the
+command must not import at all (i.e. "rapid --version" must not import
+NumPy).  The fastest time of each module is kept to show the slowest.  The exit code is nonzero if
+any command is over its budget, or if it fails.
+
+The "gui" command opens the GUI with $RAPID_FIRST_FRAME=exit, so that
+it closes once the window is first drawn, and also checks the time to
+that first frame.  It needs a display, so it is only run when asked for.
+
+The times depend on the machine, so after a deliberate change (or on a
+new machine) store a new budget with --update.  It is the measured time
+with some margin, so measure it over plenty of runs (i.e. -r 15).  -X importtime needs Python 3.7 or later.
+'''
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+import json
+import re
+from sys import executable, exit
+from os import environ, pathsep
+from os.path import abspath, dirname, join
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from subprocess import PIPE, Popen
+
+HERE = dirname(abspath(__file__))
+ROOT = dirname(HERE)
+BUDGET = join(HERE, 'startup_budget.json')
+
+# The commands to time, as the arguments given to rapid
+COMMANDS = {'version' : ['--version'],
+            'help' : ['--help'],
+            'params' : [join(ROOT, 'template.inp'), '--params'],
+            'gui' : [],
+           }
+
+# The commands run when none are given
+DEFAULT = ['help', 'params', 'version']
+
+# The modules each command must not import.  A module also counts if
+# only its submodules are imported.
+FORBIDDEN = {'version' : ['numpy', 'scipy', 'input_reader', 'matplotlib',
+                          'PySide'],
+             'help' : ['numpy', 'scipy', 'input_reader', 'matplotlib',
+                       'PySide'],
+             'params' : ['matplotlib', 'PySide', 'scipy.optimize',
+                         'multiprocessing'],
+             'gui' : ['matplotlib', 'scipy.optimize', 'numpy.testing',
+                      'rapid.pyqtgraph.canvas', 'rapid.pyqtgraph.console',
+                      'rapid.pyqtgraph.dockarea', 'rapid.pyqtgraph.exporters',
+                      'rapid.pyqtgraph.flowchart', 'rapid.pyqtgraph.imageview',
+                      'rapid.pyqtgraph.multiprocess',
+                      'rapid.pyqtgraph.opengl',
+                      'rapid.pyqtgraph.parametertree'],
+            }
+
+# The budget is the measured time times this
+MARGIN = 1.5
+
+# i.e. "import time:       160 |       7550 |   runpy"
+LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)\s*$')
+
+# As printed by rapid.gui.driver.run_gui
+FRAME = re.compile(r'^RAPID: first frame after ([\d.]+) s$')
+
+
+class CommandError(Exception):
+    '''A timed command did not exit successfully'''
+    pass
+
+
+def import_times(args):
+    '''Run rapid with args and return the self and cumulative import
+    time in microseconds of each module, and its depth in the tree,
+    and the time to the first frame of the GUI in milliseconds
+    (or None).  A CommandError holding what the command printed to
+    stderr is raised if it exits with a nonzero status, since its
+    times would then not be those of the command.'''
+    env = dict(environ)
+    env['PYTHONPATH'] = pathsep.join(filter(None, [ROOT,
+                                                   env.get('PYTHONPATH')]))
+    env['RAPID_FIRST_FRAME'] = 'exit'
+    process = Popen([executable, '-X', 'importtime', '-m', 'rapid'] + args,
+                    stdout=PIPE, stderr=PIPE, env=env, cwd=ROOT)
+    out, err = process.communicate()
+    times, frame, messages = {}, None, []
+    for line in err.decode('utf-8', 'replace').splitlines():
+        m = LINE.match(line)
+        if m:
+            own, total, indent, name = m.groups()
+            times[name] = (int(own), int(total), len(indent) // 2)
+            continue
+        m = FRAME.match(line)
+        if m:
+            frame = float(m.group(1)) * 1000
+        elif not line.startswith('import time:'):
+            messages.append(line)
+    if process.returncode != 0:
+        raise CommandError('rapid {0} exited with status {1}:\n{2}'.format(
+                           ' '.join(args), process.returncode,
+                           '\n'.join(messages)))
+    return times, frame
+
+
+def measure(args, repeat):
+    '''Return the fastest times of each module over repeat runs, the
+    median of the total time of each run, and the fastest time to the
+    first frame.  The median of the totals is steadier than the sum of
+    the fastest times, which no single run reaches.'''
+    best, totals, frames = {}, [], []
+    for _ in range(repeat):
+        times, frame = import_times(args)
+        totals.append(total_ms(times))
+        for name, (own, total, depth) in times.items():
+            if name not in best or total < best[name][1]:
+                best[name] = (own, total, depth)
+        if frame is not None:
+            frames.append(frame)
+    totals.sort()
+    middle = len(totals) // 2
+    median = ( totals[middle] if len(totals) % 2 else
+               ( totals[middle-1] + totals[middle] ) / 2 )
+    return best, median, min(frames) if frames else None
+
+
+def total_ms(times):
+    '''The time to import everything, in milliseconds'''
+    return sum(t for o, t, depth in times.values() if depth == 0) / 1000
+
+
+def imported(times, module):
+    '''Whether the module (or any of its submodules) was imported'''
+    return any(name == module or name.startswith(module + '.')
+               for name in times)
+
+
+def main():
+    """Time each command and check it against the budget."""
+    parser = ArgumentParser(formatter_class=RawDescriptionHelpFormatter,
+                            description=__doc__)
+    parser.add_argument('commands', nargs='*',
+        help='The commands to time, out of {0}.  The default is {1}.'.format(
+             ', '.join(sorted(COMMANDS)), ', '.join(DEFAULT)))
+    parser.add_argument('--repeat', '-r', type=int, default=5,
+        help='The number of times to run each command.  The default is 5.')
+    parser.add_argument('--top', '-t', type=int, default=10,
+        help='The number of slowest modules to show for each command.  '
+             'The default is 10.')
+    parser.add_argument('--update', action='store_true', default=False,
+        help='Store the measured times as the new budget.')
+    args = parser.parse_args()
+    for command in args.commands:
+        if command not in COMMANDS:
+            parser.error('unknown command: {0}'.format(command))
+
+    try:
+        with open(BUDGET) as fl:
+            budget = json.load(fl)
+    except (IOError, OSError):
+        budget = {}
+
+    status = 0
+    for command in args.commands or DEFAULT:
+        try:
+            times, ms, frame = measure(COMMANDS[command], args.repeat)
+        except CommandError as e:
+            print('{0}: FAIL: {1}'.format(command, e))
+            status = 1
+            continue
+        if not times:
+            print('{0}: no import times; is this Python 3.7 or '
+                  'later?'.format(command))
+            return 1
+        limit = budget.get(command)
+
+        print('{0}: {1:.1f} ms of imports (budget {2})'.format(command, ms,
+              '{0:.1f} ms'.format(limit) if limit else 'none'))
+        slowest = sorted(times.items(), key=lambda x: -x[1][0])[:args.top]
+        for name, (own, total, depth) in slowest:
+            print('    {0:8.1f} ms {1:8.1f} ms  {2}'.format(own / 1000,
+                                                        total / 1000, name))
+
+        if command == 'gui':
+            key = 'gui first frame'
+            if frame is None:
+                print('    FAIL: the GUI did not report its first frame')
+                status = 1
+            else:
+                print('    first frame after {0:.1f} ms (budget {1})'.format(
+                      frame, '{0:.1f} ms'.format(budget[key])
+                             if key in budget else 'none'))
+                if args.update:
+                    budget[key] = round(frame * MARGIN, 1)
+                elif key in budget and frame > budget[key]:
+                    print('    FAIL: over budget by {0:.1f} ms'.format(
+                          frame - budget[key]))
+                    status = 1
+
+        for module in FORBIDDEN[command]:
+            if imported(times, module):
+                print('    FAIL: {0} was imported'.format(module))
+                status = 1
+        if args.update:
+            budget[command] = round(ms * MARGIN, 1)
+        elif limit and ms > limit:
+            print('    FAIL: over budget by {0:.1f} ms'.format(ms - limit))
+            status = 1
+
+    if args.update:
+        with open(BUDGET, 'w') as fl:
+            json.dump(budget, fl, indent=2, sort_keys=True)
+            fl.write('\n')
+        print('Budget written to {0}'.format(BUDGET))
+    return status
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,100 @@
+from __future__ import print_function, division, absolute_import
+
+# Non-std lib imports
+import pytest
+from numpy import column_stack, linspace
+from numpy.random import RandomState
+
+# Local imports
+from rapid.common.read_input import read_input
+from rapid.common.spectrum import ZMat, spectrum
+
+# The lines of a small input file, as in template.inp
+INPUT = ['rate 1.54 THz',
+         'peak 1949.8 0.38 l=5.6 g=1.2',
+         'peak 1970.3 0.35 l=5.6 g=0.9',
+         'peak 2027.6 0.27 l=2.6 g=0.7',
+         'exchange 1 2 1.0',
+         'xlim 1900 2050']
+
+
+@pytest.fixture
+def input_lines():
+    '''The lines of a small input file'''
+    return list(INPUT)
+
+
+@pytest.fixture
+def write_input(tmp_path):
+    '''A function writing lines (by default those of a small input file)
+    to a file of the given name in a temporary directory, returning its
+    path as a string'''
+    def write(name, lines=INPUT):
+        path = tmp_path / name
+        path.write_text(u'\n'.join(lines) + u'\n')
+        return str(path)
+    return write
+
+
+@pytest.fixture
+def random():
+    '''A seeded random number generator'''
+    return RandomState(1234)
+
+
+@pytest.fixture
+def omega():
+    '''A domain covering the peaks of random_system'''
+    return linspace(1850, 2050, 801)
+
+
+@pytest.fixture
+def random_system(random):
+    '''A function of the number of peaks (and optionally the exchanging
+    pairs, by default every pair, and the symmetry) returning the inputs
+    of spectrum for a random system'''
+    def system(npeaks, pairs=None, symmetric=True):
+        if pairs is None:
+            pairs = [(i, j) for i in range(npeaks)
+                     for j in range(i + 1, npeaks)]
+        rates = random.uniform(0.05, 0.3, len(pairs))
+        Z = ZMat(npeaks, pairs, rates, symmetric)
+        vib = random.uniform(1900, 2000, npeaks)
+        GL = random.uniform(2, 8, npeaks)
+        GG = random.uniform(2, 8, npeaks)
+        h = random.uniform(0.2, 1, npeaks)
+        return Z, vib, GL, GG, h
+    return system
+
+
+@pytest.fixture
+def synthetic_raw(random):
+    '''A function returning raw data of the spectrum of an input file
+    (by default the small one), scaled and shifted, with Gaussian noise
+    of the given standard deviation'''
+    def raw(lines=INPUT, scale=3.0, baseline=0.5, noise=0.0):
+        args = read_input(lines)
+        omega = linspace(args.xlim[0] + 1, args.xlim[1] - 1, 297)
+        Z = ZMat(len(args.vib), args.exchanges, args.exchange_rates,
+                 args.symmetric_exchange)
+        I = spectrum(Z, args.k, args.vib, args.Gamma_Lorentz,
+                     args.Gamma_Gauss, args.heights, omega)[0]
+        I = scale * I + baseline
+        if noise:
+            I += random.normal(0, noise, len(I))
+        return column_stack([omega, I])
+    return raw
+
+
+@pytest.fixture
+def job():
+    '''A request for the GUI's spectrum worker, for the small input
+    file'''
+    args = read_input(INPUT)
+    return {'generation' : 1,
+            'omega' : linspace(1900, 2050, 801),
+            'Z' : ZMat(len(args.vib), args.exchanges, args.exchange_rates,
+                       args.symmetric_exchange),
+            'k' : args.k,
+            'params' : (args.vib, args.Gamma_Lorentz, args.Gamma_Gauss,
+                        args.heights)}
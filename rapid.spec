@@ -6,7 +6,38 @@ import sys
 # each user will place pyinstaller.
 a = Analysis(['rapid/__main__.py'],
              pathex=[],
-             hiddenimports=['scipy.special._ufuncs_cxx'],
+             # rapid, rapid.common and rapid.cl import what they
+             # export by name when first used, so list those modules
+             hiddenimports=['scipy.special._ufuncs_cxx',
+                            'rapid.common.spectrum',
+                            'rapid.common.window',
+                            'rapid.common.model',
+                            'rapid.common.sweep',
+                            'rapid.common.jacobian',
+                            'rapid.common.fit',
+                            'rapid.common.globalfit',
+                            'rapid.common.uncertainty',
+                            'rapid.common.sample',
+                            'rapid.common.utils',
+                            'rapid.common.save_script',
+                            'rapid.common.read_input',
+                            'rapid.cl.driver',
+                            'rapid.cl.batch',
+                            'rapid.cl.stream',
+                            'rapid.cl.fit',
+                            'rapid.cl.globalfit',
+                            'rapid.cl.uncertainty',
+                            'rapid.cl.sample'],
+             # Parts of the bundled pyqtgraph that RAPID never uses
+             excludes=['rapid.pyqtgraph.canvas',
+                       'rapid.pyqtgraph.console',
+                       'rapid.pyqtgraph.dockarea',
+                       'rapid.pyqtgraph.flowchart',
+                       'rapid.pyqtgraph.multiprocess',
+                       'rapid.pyqtgraph.opengl',
+                       'rapid.pyqtgraph.tests',
+                       'rapid.pyqtgraph.widgets.MatplotlibWidget',
+                       'rapid.pyqtgraph.widgets.RemoteGraphicsView'],
              hookspath=None)
 pyz = PYZ(a.pure)
 
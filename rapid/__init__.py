@@ -1,9 +1,24 @@
 from __future__ import print_function, division, absolute_import
 
-from rapid.common import spectrum, ZMat, SpectrumError
+# The exported names are imported when first used, so that
+# i.e. "rapid --version" doesn't wait for SciPy to load.
+from rapid._lazy import lazy_exports
+
+lazy_exports(__name__, {'spectrum' : 'rapid.common.spectrum',
+                        'spectrum_batch' : 'rapid.common.spectrum',
+                        'SpectrumModel' : 'rapid.common.model',
+                        'rate_sweep' : 'rapid.common.sweep',
+                        'spectrum_jacobian' : 'rapid.common.jacobian',
+                        'ZMat' : 'rapid.common.spectrum',
+                        'SpectrumError' : 'rapid.common.spectrum',
+                       })
 
 
 __all__ = ['spectrum',
+           'spectrum_batch',
+           'SpectrumModel',
+           'rate_sweep',
+           'spectrum_jacobian',
            'ZMat',
            'SpectrumError',
           ]
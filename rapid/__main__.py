@@ -5,14 +5,23 @@ Spectral exchange can be run from the command line non-interactively
 by giving it a text-based input file and having it generate data from
 the input, or it can be run as an interactive GUI.
 
+To calculate many input files at once, use "rapid batch"
+(see "rapid batch --help").  To keep a server running so that each
+calculation doesn't have to start Python again, use "rapid serve"
+(see "rapid serve --help") and give --via-server.  To calculate
+parameter sets generated by another program, use "rapid stream"
+(see "rapid stream --help").  To fit spectra measured at several
+temperatures together, use "rapid global" (see "rapid global --help").
+
 Authors: Seth M. Morton, Lasse Jensen
 '''
 from __future__ import print_function, division, absolute_import
 
 # Std. lib imports
-from sys import argv, exit, stderr, executable
+from time import time
+START = time()  # To time how long the GUI takes to start
+from sys import argv, exit
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
-from subprocess import call
 
 # Local imports
 from rapid._version import __version__
@@ -21,6 +30,24 @@ from rapid._version import __version__
 def main():
     """Main Driver."""
 
+    # Subcommands are given as the first argument
+    if argv[1:2] == ['batch']:
+        args = batch_parser().parse_args(argv[2:])
+        from rapid.cl import run_batch
+        exit(run_batch(args))
+    elif argv[1:2] == ['stream']:
+        args = stream_parser().parse_args(argv[2:])
+        from rapid.cl.stream import run_stream
+        exit(run_stream(args.jobs, args.inflight, args.binary))
+    elif argv[1:2] == ['global']:
+        args = parse_fit_arguments(global_parser(), argv[2:])
+        from rapid.cl.globalfit import run_global
+        exit(run_global(args))
+    elif argv[1:2] == ['serve']:
+        args = serve_parser().parse_args(argv[2:])
+        from rapid.cl.server import serve
+        exit(serve(args.socket, args.stdio, args.jobs))
+
     # Set up an argument parser so that command line help can be given
     parser = ArgumentParser(formatter_class=RawDescriptionHelpFormatter,
                             description=__doc__,
@@ -45,12 +72,91 @@ def main():
              'fine-tune to look of the plot. No plot will be shown on the screen.  '
              'You can run the resulting script with "rapid yourscript.py" '
              '("rapid.exe yourscript" on Windows).')
-    args = parser.parse_args()
+    meg.add_argument('--fit', '-f',
+        help='Fit the parameters to the raw data given in the input file, and '
+             'write an input file with the fitted parameters to this file.  '
+             'The spectrum is calculated at the x-values of the raw data, '
+             'and scaled and shifted by a fitted scale and baseline to match '
+             'the raw data as it is plotted.  No plot will be shown on the '
+             'screen.')
+    meg.add_argument('--sample',
+        help='Sample the posterior of the parameters given the raw data in '
+             'the input file with an ensemble MCMC sampler, and write a '
+             'summary of it to this file.  The parameters are chosen as for '
+             '--fit, and their priors are given in the input file as i.e. '
+             '"prior peak 1 vib normal 1950 2" (normal, uniform or '
+             'loguniform, with the rate in the unit of the input file).  '
+             'The chain is written as it is sampled to a NumPy file of the '
+             'same name ending in .chain.npy.  No plot will be shown on the '
+             'screen.')
+    add_fit_arguments(parser)
+    unc = parser.add_argument_group('uncertainty',
+        'With --fit, the uncertainty of the fitted parameters can be '
+        'estimated by refitting resamples of the residuals of the fit '
+        '(a residual bootstrap), and by refitting with the rate held at '
+        'points about its fitted value (a profile likelihood).  Each refit '
+        'starts from the fit, and they are run on --jobs processes.')
+    unc.add_argument('--uncertainty', '-u', metavar='FILE',
+        help='Write the intervals of the refined parameters to this file.  '
+             'Each refit is written to a table as it finishes, in files of '
+             'the same name ending in .bootstrap.dat and .profile.dat.')
+    unc.add_argument('--bootstrap', type=int, default=200, metavar='N',
+        help='The number of bootstrap resamples.  The default is 200.')
+    unc.add_argument('--profile', type=int, default=21, metavar='N',
+        help='The number of points in the profile of the rate, spanning four '
+             'standard errors on each side of the fitted rate.  The default '
+             'is 21.')
+    unc.add_argument('--confidence', type=float, default=0.95,
+        help='The fraction of the distribution inside each interval, also '
+             'for --sample.  The default is 0.95.')
+    unc.add_argument('--seed', type=int, default=0,
+        help='The seed of the bootstrap resamples, or of the sampler with '
+             '--sample.  The default is 0.')
+    unc.add_argument('--resume', action='store_true', default=False,
+        help='Keep the refits already in the tables of an interrupted run '
+             'with the same input, and only do the rest.')
+    mcmc = parser.add_argument_group('sampling',
+        'With --sample, the walkers start in a small ball about the fit, '
+        'and the spectra of each half of them are calculated together in '
+        'one batch at each step.')
+    mcmc.add_argument('--walkers', type=int, metavar='N',
+        help='The number of walkers, which is made even.  The default is '
+             'twice the number of parameters plus two, and at least 16.')
+    mcmc.add_argument('--steps', type=int, default=2000, metavar='N',
+        help='The number of steps of each walker.  The default is 2000.')
+    mcmc.add_argument('--burn', type=int, metavar='N',
+        help='The number of steps at the start left out of the summary.  '
+             'The default is a quarter of the steps.')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+        help='The number of processes used to calculate the spectra when the '
+             'input file sweeps over several values, or to do the refits of '
+             '--uncertainty.  0 uses one per CPU.  The default is 1.')
+    parser.add_argument('--via-server', action='store_true', default=False,
+        help='Have a running "rapid serve" do the calculation.  If no server '
+             'is running, or the plot is to be shown, the calculation is '
+             'done here instead.  It is an error if the server does not '
+             'answer within a minute.')
+    parser.add_argument('--socket',
+        help='The socket of the server to use with --via-server.  The default '
+             'is $RAPID_SOCKET, or rapid-<user>.sock in the temporary '
+             'directory.')
+    args = parse_fit_arguments(parser, argv[1:])
+    if args.uncertainty and not args.fit:
+        parser.error('--uncertainty is only used with --fit')
+    if not 0 < args.confidence < 1:
+        parser.error('--confidence must be between 0 and 1')
+
+    # Try the server first if asked to
+    if args.input_file and args.via_server:
+        from rapid.cl.client import run_via_server
+        status = run_via_server(args, args.socket)
+        if status is not None:
+            exit(status)
 
     # If no argument was given, then run in GUI mode
     if not args.input_file:
         from rapid.gui import run_gui
-        exit(run_gui())
+        exit(run_gui(START))
 
     # Otherwise, run non-interactively
     else:
@@ -58,5 +164,155 @@ def main():
         exit(run_non_interactive(args))
 
 
+def add_fit_arguments(parser):
+    """Add the arguments that choose the parameters of a fit."""
+    group = parser.add_argument_group('fitting',
+        'The parameters are named "rate", "exchange 1 2" (the relative '
+        'exchange rate of peaks 1 and 2), "peak 1 vib", "peak 1 l", '
+        '"peak 1 g", "peak 1 height", "baseline" and "scale".  A name may '
+        'also be a kind of parameter (rate, exchange, vib, l, g, height, '
+        'baseline or scale) or a peak ("peak 1") to mean all of them.  '
+        'Names with spaces must be quoted.  In a global fit, a parameter '
+        'local to each spectrum is named i.e. "peak 1 l [2]" for the '
+        'second spectrum, and "peak 1 l" means all of them.')
+    group.add_argument('--refine', nargs='+', metavar='NAME',
+        help='The parameters to refine.  The default is all but the '
+             'relative exchange rates.  The heights are relative, so if '
+             'all are refined along with the scale, the first is fixed.')
+    group.add_argument('--fix', nargs='+', metavar='NAME',
+        help='Parameters to hold fixed.')
+    group.add_argument('--bound', nargs=3, action='append',
+                       metavar=('NAME', 'LOW', 'HIGH'),
+        help='Keep a parameter between two values.  The bounds of the '
+             'rate are in the unit of the input file.  Give "inf" for no '
+             'bound.  May be given more than once.')
+    group.add_argument('--tie', nargs=2, action='append',
+                       metavar=('NAME', 'OTHER'),
+        help='Hold a parameter equal to another, i.e. --tie g "peak 1 g" '
+             'to fit one Gaussian width for all peaks.  May be given more '
+             'than once.')
+
+
+def parse_fit_arguments(parser, arguments):
+    """Parse the arguments, making the bounds of --bound numbers."""
+    args = parser.parse_args(arguments)
+    if args.bound:
+        try:
+            args.bound = [(name, float(low), float(high))
+                          for name, low, high in args.bound]
+        except ValueError:
+            parser.error('the bounds of --bound must be numbers')
+    return args
+
+
+def global_parser():
+    """Return the argument parser for the global subcommand."""
+    parser = ArgumentParser(prog='RAPID global',
+        description='Fit the spectra of the same system at several '
+                    'temperatures together.  The manifest is an input file '
+                    'whose raw data is instead given by a line "spectrum '
+                    'FILE TEMPERATURE" for each spectrum (in K).  The rate '
+                    'at each temperature follows from the rate at the '
+                    'reference temperature ("reference T", by default the '
+                    'mean) and the activation energy ("activation VALUE" in '
+                    'kJ/mol) by Arrhenius or Eyring ("kinetics eyring") '
+                    'kinetics.  The peak parameters are shared by all '
+                    'spectra, except those given on a "local NAME" line, '
+                    'i.e. "local g", which are fit to each spectrum on its '
+                    'own.  Each spectrum has its own baseline and scale.  '
+                    'The activation energy is named "activation", and is '
+                    'refined by default.')
+    parser.add_argument('manifest',
+        help='The manifest of the spectra to fit.')
+    parser.add_argument('--output', '-o', required=True,
+        help='Write the manifest with the fitted parameters to this file.  '
+             'The parameters local to each spectrum are given their mean.')
+    parser.add_argument('--outdir',
+        help='Also write an input file with the fitted parameters of each '
+             'spectrum to this directory, named after its raw data file.  '
+             'If two raw data files have the same name, the number of the '
+             'spectrum is put in front of each.')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+        help='The number of processes the spectra are calculated on.  '
+             '0 uses one per CPU.  The default is 1.')
+    add_fit_arguments(parser)
+    return parser
+
+
+def batch_parser():
+    """Return the argument parser for the batch subcommand."""
+    parser = ArgumentParser(prog='RAPID batch',
+        description='Calculate the spectra of many input files on a pool of '
+                    'worker processes.  The output of each file is written '
+                    'as soon as it is done, and the files that failed are '
+                    'summarized at the end.  The exit code is nonzero only '
+                    'if a file failed.')
+    parser.add_argument('inputs', nargs='*',
+        help='The input files, or glob patterns matching them '
+             '(i.e. "runs/*.inp").')
+    parser.add_argument('--file-list', '-f',
+        help='A file listing more input files, one per line.  Give "-" to '
+             'read the list from standard input.')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+        help='The number of worker processes.  0 uses one per CPU.  '
+             'The default is 1.')
+    parser.add_argument('--params', '-p', action='store_true', default=False,
+        help='Print the modified peak parameters of each input file to the '
+             'screen instead of writing the data points of each to a file of '
+             'the same name ending in .dat.')
+    parser.add_argument('--outdir', '-o', default='',
+        help='The directory to write the data files to.  The default is '
+             'the directory of each input file.')
+    return parser
+
+
+def serve_parser():
+    """Return the argument parser for the serve subcommand."""
+    parser = ArgumentParser(prog='RAPID serve',
+        description='Keep a server running that calculates spectra for other '
+                    'processes, so that they don\'t each pay for starting '
+                    'Python and importing SciPy.  Each request and response '
+                    'is a line of JSON.  A request gives an "input" file or '
+                    'a "record" of parameters, and may ask for "data", '
+                    '"script" or "params" as on the command line; otherwise '
+                    'the spectra themselves are returned.  Send '
+                    '{"command": "shutdown"} to stop the server.')
+    parser.add_argument('--socket',
+        help='The path of the Unix socket to listen on.  The default is '
+             '$RAPID_SOCKET, or rapid-<user>.sock in the temporary directory.')
+    parser.add_argument('--stdio', action='store_true', default=False,
+        help='Read requests from standard input and write the responses to '
+             'standard output instead of listening on a socket.')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+        help='The number of worker processes, so that requests from several '
+             'clients are calculated at once.  0 uses one per CPU.  '
+             'The default is 1.')
+    return parser
+
+
+def stream_parser():
+    """Return the argument parser for the stream subcommand."""
+    parser = ArgumentParser(prog='RAPID stream',
+        description='Read parameter sets from standard input, one JSON object '
+                    'per line, and write the spectrum of each to standard '
+                    'output as one line of JSON, in the same order.  The keys '
+                    'of each object are those of the input file, i.e. '
+                    '{"rate": [1.54, "THz"], "peak": [[1949.8, 0.38, {"l": '
+                    '5.6}], [1970.3, 0.35]], "exchange": [[1, 2]], "xlim": '
+                    '[1900, 2050]}, plus an optional "id" that is copied to '
+                    'the result.')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+        help='The number of worker processes.  0 uses one per CPU.  '
+             'The default is 1.')
+    parser.add_argument('--inflight', type=int,
+        help='The most parameter sets to read ahead of the result being '
+             'written.  The default is twice the number of jobs.')
+    parser.add_argument('--binary', action='store_true', default=False,
+        help='Follow each line of JSON with the arrays as raw little-endian '
+             'float64 values instead of including them in the JSON.  The '
+             'JSON gives their "shapes" and total "nbytes".')
+    return parser
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,54 @@
+from __future__ import print_function, division, absolute_import
+
+# Only the standard library is used here, so that importing rapid
+# (i.e. for "rapid --version") doesn't import NumPy and SciPy.
+
+# Std. lib imports
+import sys
+from importlib import import_module
+from types import ModuleType
+
+__all__ = ['lazy_exports']
+
+
+class LazyModule(ModuleType):
+    '''A package whose exported names are imported on first use.
+    Subclasses give the exported names in _exports, a dictionary of
+    each name to the module that defines it.'''
+
+    _exports = {}
+
+    def __getattr__(self, name):
+        try:
+            source = self._exports[name]
+        except KeyError:
+            raise AttributeError('module {0!r} has no attribute '
+                                 '{1!r}'.format(self.__name__, name))
+        value = getattr(import_module(source), name)
+        ModuleType.__setattr__(self, name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        # Importing a submodule sets it as an attribute of its package.
+        # Some submodules share their name with the function they export
+        # (i.e. rapid.common.spectrum), and the function must win.
+        if isinstance(value, ModuleType) and name in self._exports:
+            return
+        ModuleType.__setattr__(self, name, value)
+
+    def __dir__(self):
+        return sorted(set(ModuleType.__dir__(self)) | set(self._exports))
+
+
+def lazy_exports(package, exports):
+    '''Make each name in exports (a dictionary of each name to the module
+    that defines it) an attribute of package that is imported the first
+    time it is used.'''
+    module = sys.modules[package]
+    if sys.version_info < (3, 5):
+        # The class of a module can't be changed, so import everything now
+        for name, source in exports.items():
+            setattr(module, name, getattr(import_module(source), name))
+    else:
+        module.__class__ = type('LazyModule', (LazyModule,),
+                                {'_exports' : dict(exports)})
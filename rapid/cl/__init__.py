@@ -1,6 +1,12 @@
 from __future__ import print_function, division, absolute_import
 
-# Local imports
-from rapid.cl.driver import run_non_interactive
+# Local imports.  Each is imported when first used.
+from rapid._lazy import lazy_exports
 
-__all__ = ['run_non_interactive']
+lazy_exports(__name__, {'run_non_interactive' : 'rapid.cl.driver',
+                        'run_batch' : 'rapid.cl.batch',
+                        'run_stream' : 'rapid.cl.stream',
+                        'run_global' : 'rapid.cl.globalfit',
+                       })
+
+__all__ = ['run_non_interactive', 'run_batch', 'run_stream', 'run_global']
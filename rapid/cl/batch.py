@@ -0,0 +1,141 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+from sys import stderr, stdout, stdin
+from os import makedirs
+from os.path import basename, dirname, isdir, join, splitext
+from glob import glob
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+from multiprocessing import Pool, cpu_count
+
+# Non-std. lib imports
+from input_reader import ReaderError
+
+# Local imports
+from rapid.common import SpectrumError, numerics, write_data, read_input
+from rapid.cl.driver import calculate, data_header, tables
+
+
+def run_batch(cmd_line_args):
+    '''Driver to calculate the spectra of many input files on a pool of
+    worker processes.  The output for each file is written as soon as it
+    is done, and a summary of the files that failed is printed at the
+    end.  Returns 1 if any file failed, otherwise 0.
+    '''
+
+    # Expand the globs and add the files from the list, if given
+    files = input_files(cmd_line_args.inputs, cmd_line_args.file_list)
+    if not files:
+        print('No input files were found', file=stderr)
+        return 1
+
+    # Make sure the output directory exists
+    outdir = cmd_line_args.outdir
+    if outdir and not isdir(outdir):
+        try:
+            makedirs(outdir)
+        except OSError as e:
+            print(str(e), file=stderr)
+            return 1
+
+    # Calculate each file on the pool, reporting each as it finishes
+    mode = 'params' if cmd_line_args.params else 'data'
+    jobs = [(f, mode, outdir) for f in files]
+    njobs = min(cmd_line_args.jobs if cmd_line_args.jobs > 0
+                else cpu_count(), len(jobs))
+    failed = []
+    if njobs > 1:
+        pool = Pool(njobs)
+        results = pool.imap_unordered(process_file, jobs)
+    else:
+        pool = None
+        results = (process_file(job) for job in jobs)
+    try:
+        for input_file, error, output, warnings in results:
+            for line in warnings.splitlines():
+                print('{0}: {1}'.format(input_file, line), file=stderr)
+            if error is None:
+                print(output, end='', file=stdout)
+                stdout.flush()
+            else:
+                failed.append((input_file, error))
+                print('{0}: {1}'.format(input_file, error), file=stderr)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    # Summarize
+    print('{0} of {1} input files succeeded'.format(len(files) - len(failed),
+                                                    len(files)), file=stderr)
+    for input_file, error in failed:
+        first = ( error.splitlines() or [''] )[0]
+        print('  FAILED {0}: {1}'.format(input_file, first), file=stderr)
+    return 1 if failed else 0
+
+
+def input_files(patterns, file_list=None):
+    '''Return the input files matching the patterns (or given directly),
+    followed by those listed one per line in file_list ('-' for stdin).
+    Duplicates are removed.'''
+    files = []
+    for pattern in patterns:
+        # Keep names that don't match anything so that they are reported
+        files.extend(sorted(glob(pattern)) or [pattern])
+    if file_list:
+        f = stdin if file_list == '-' else open(file_list)
+        try:
+            files.extend(line.strip() for line in f if line.strip())
+        finally:
+            if f is not stdin:
+                f.close()
+    seen = set()
+    return [f for f in files if not ( f in seen or seen.add(f) )]
+
+
+def process_file(job):
+    '''Calculate and write the output for one input file.
+
+    Returns the input file, an error message (None if it succeeded), the
+    text to print and any warnings.  In 'data' mode the spectra are
+    written to a data file named after the input file, and in 'params'
+    mode the text is the table of the new parameters.
+    '''
+    input_file, mode, outdir = job
+    warnings = StringIO()
+    try:
+        args = read_input(input_file)
+        omega, labels, I_omega, new_params = calculate(args, err=warnings)
+    except (OSError, IOError, ReaderError, SpectrumError) as e:
+        return input_file, str(e), '', warnings.getvalue()
+    except Exception as e:
+        # Don't let one bad file stop the whole batch
+        return input_file, '{0}: {1}'.format(type(e).__name__, e), '', \
+               warnings.getvalue()
+
+    if mode == 'params':
+        old_params = (args.vib,
+                      args.Gamma_Lorentz,
+                      args.Gamma_Gauss,
+                      args.heights)
+        out = StringIO()
+        print('## {0}'.format(input_file), file=out)
+        if len(labels) > 1:
+            tables(old_params, labels, new_params, out)
+        else:
+            numerics(old_params, new_params[0], out)
+        return input_file, None, out.getvalue(), warnings.getvalue()
+    else:
+        # Write the data next to the input file or in outdir
+        name = splitext(basename(input_file))[0] + '.dat'
+        datafile = join(outdir or dirname(input_file), name)
+        try:
+            write_data(omega, I_omega if len(labels) > 1 else I_omega[0],
+                       datafile, header=data_header(labels))
+        except (IOError, OSError) as e:
+            return input_file, str(e), '', warnings.getvalue()
+        return input_file, None, 'Data written to file {0}\n'.format(
+               datafile), warnings.getvalue()
@@ -0,0 +1,87 @@
+from __future__ import print_function, division, absolute_import
+
+# Only the standard library is used here, so that a client
+# starts quickly.
+
+# Std. lib imports
+import json
+import socket
+from sys import stderr, stdout
+from os import environ, getcwd
+from os.path import abspath, join
+from getpass import getuser
+from tempfile import gettempdir
+
+__all__ = ['default_address', 'request', 'run_via_server']
+
+# How many seconds to wait for the server to answer
+TIMEOUT = 60.0
+
+
+def default_address():
+    '''Return the socket path of the server.  It is $RAPID_SOCKET
+    if set, or else rapid-<user>.sock in the temporary directory.'''
+    try:
+        return environ['RAPID_SOCKET']
+    except KeyError:
+        return join(gettempdir(), 'rapid-{0}.sock'.format(getuser()))
+
+
+def request(message, address=None, timeout=None):
+    '''Send one request (a dictionary) to the server and return its
+    response.  Raises socket.error (OSError) if the server can't be
+    reached or closes the connection.'''
+    if not hasattr(socket, 'AF_UNIX'):
+        raise socket.error('Unix sockets are not available')
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(address or default_address())
+        sock.sendall(( json.dumps(message) + '\n' ).encode('utf-8'))
+        reply = sock.makefile('rb').readline()
+    finally:
+        sock.close()
+    if not reply:
+        raise socket.error('The server closed the connection')
+    return json.loads(reply.decode('utf-8'))
+
+
+def run_via_server(cmd_line_args, address=None, timeout=TIMEOUT):
+    '''Ask the server to do what run_non_interactive would do with
+    cmd_line_args, and print what it prints.  Relative paths in the input
+    file are taken from this process's working directory.
+
+    Returns the exit status, or None if the request could not be made
+    (no server is running, or the plot was asked for, which must be
+    shown by this process), in which case the caller should calculate
+    the spectrum itself.  If the server does not answer within timeout
+    seconds it is an error, since it may still write the output, and
+    calculating it here as well would race it.
+    '''
+    message = {'input' : abspath(cmd_line_args.input_file),
+               'cwd' : getcwd()}
+    if cmd_line_args.data:
+        message['data'] = abspath(cmd_line_args.data)
+    elif cmd_line_args.script:
+        message['script'] = abspath(cmd_line_args.script)
+    elif cmd_line_args.params:
+        message['params'] = True
+    else:
+        return None
+
+    try:
+        response = request(message, address, timeout)
+    except socket.timeout:
+        print('The server did not answer within {0:g} seconds'.format(
+              timeout), file=stderr)
+        return 1
+    except socket.error:
+        return None
+    except ValueError:
+        print('The server sent an invalid response', file=stderr)
+        return 1
+    stdout.write(response.get('stdout', ''))
+    stderr.write(response.get('stderr', ''))
+    if response.get('error') and not response.get('stderr'):
+        print(response['error'], file=stderr)
+    return response.get('status', 1)
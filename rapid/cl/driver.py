@@ -4,50 +4,58 @@ from __future__ import print_function, division, absolute_import
 from sys import stderr, stdout
 
 # Non-std. lib imports
-from numpy import arange
+from numpy import arange, array
 from input_reader import ReaderError
 
 # Local imports
-from rapid.common import spectrum, SpectrumError, ZMat, normalize, clip, \
-                     numerics, write_data, save_script, read_input
+from rapid.common import spectrum, spectrum_window, rate_sweep, \
+                         sweep_points, SpectrumError, ZMat, normalize, clip, \
+                         numerics, write_data, save_script, read_input
 from rapid.cl.plot import plot
 
+# Z is made sparse for systems of more peaks than this.  For fewer,
+# building and splitting a sparse matrix costs more than it saves.
+SPARSE_PEAKS = 250
 
-def run_non_interactive(cmd_line_args):
+
+def run_non_interactive(cmd_line_args, args=None, out=stdout, err=stderr):
     '''Driver to calculate the spectra non-interactively
     (i.e. from the command line).
+
+    If args is given it is used in place of reading the input file.
+    Messages are written to out and errors to err.
     '''
 
     # Read in the input file that is given
-    try:
-        args = read_input(cmd_line_args.input_file)
-    except (OSError, IOError) as e:
-        print(str(e), file=stderr) # An error occurred when locating the file
-        return 1
-    except ReaderError as r:
-        print(str(r), file=stderr) # An error occurred when reading the file
-        return 1
+    if args is None:
+        try:
+            args = read_input(cmd_line_args.input_file)
+        except (OSError, IOError) as e:
+            print(str(e), file=err) # An error occurred when locating the file
+            return 1
+        except ReaderError as r:
+            print(str(r), file=err) # An error occurred when reading the file
+            return 1
 
-    # Generate the Z matrix
-    Z = ZMat(len(args.num), args.exchanges, args.exchange_rates,
-             args.symmetric_exchange)
+    # Fit the parameters to the raw data instead if asked to
+    if getattr(cmd_line_args, 'fit', None):
+        from rapid.cl.fit import run_fit
+        return run_fit(cmd_line_args, args, out, err)
 
-    # Generate the frequency domain
-    omega = arange(args.xlim[0]-10, args.xlim[1]+10, 0.5)
+    # Or sample their posterior
+    if getattr(cmd_line_args, 'sample', None):
+        from rapid.cl.sample import run_sample
+        return run_sample(cmd_line_args, args, out, err)
 
-    # Calculate the spectrum
+    # Calculate every spectrum in the input
     try:
-        I_omega, new_params = spectrum(Z,
-                                       args.k,
-                                       args.vib,
-                                       args.Gamma_Lorentz,
-                                       args.Gamma_Gauss,
-                                       args.heights,
-                                       omega
-                                      )
+        omega, labels, I_omega, new_params = calculate(args,
+                                                       cmd_line_args.jobs,
+                                                       err)
     except SpectrumError as se:
-        print(str(se), file=stderr)
+        print(str(se), file=err)
         return 1
+    sweep = len(labels) > 1
 
     # Make a tuple of the old parameters
     old_params = (args.vib,
@@ -55,28 +63,178 @@ def run_non_interactive(cmd_line_args):
                   args.Gamma_Gauss,
                   args.heights)
 
-    # Normalize the generated data
-    I_omega = normalize(I_omega)
-    # Repeat for the raw data if given.  Clip according to the xlimits
-    if args.raw is not None:
-        args.raw = clip(args.raw, args.xlim)
-        args.raw[:,1] = normalize(args.raw[:,1])
+    # Without a sweep there is just the one spectrum
+    if not sweep:
+        I_omega, new_params = I_omega[0], new_params[0]
 
     # Plot the data or write to file
     if cmd_line_args.data:
         try:
-            write_data(omega, I_omega, cmd_line_args.data)
+            write_data(omega, I_omega, cmd_line_args.data,
+                       header=data_header(labels))
         except (IOError, OSError) as e:
-            print(str(e), file=stderr)
+            print(str(e), file=err)
             return 1
         else:
-            print('Data written to file {0}'.format(cmd_line_args.data))
+            print('Data written to file {0}'.format(cmd_line_args.data),
+                  file=out)
             return 0
+    elif cmd_line_args.script and sweep:
+        print('A script cannot be saved for a sweep', file=err)
+        return 1
     elif cmd_line_args.script:
-        return save_script(omega, I_omega, args.raw, args.xlim, args.reverse,
-                           old_params, new_params, cmd_line_args.script,
-                           msg=True)
+        status = save_script(omega, I_omega, args.raw, args.xlim,
+                             args.reverse, old_params, new_params,
+                             cmd_line_args.script)
+        print('Data written to file {0}'.format(cmd_line_args.script),
+              file=out)
+        return status
+    elif cmd_line_args.params and sweep:
+        return tables(old_params, labels, new_params, out)
     elif cmd_line_args.params:
-        return numerics(old_params, new_params, stdout)
+        return numerics(old_params, new_params, out)
     else:
         return plot(args, omega, I_omega)
+
+
+def calculate(args, njobs=1, err=stderr):
+    '''Calculate every spectrum asked for by the input file args, using
+    njobs processes for a sweep.  Warnings are written to err.
+
+    Returns the domain, a label for each spectrum, the normalized
+    intensities as a (number of spectra x M) array, and a list of the
+    new parameters of each spectrum.  A SpectrumError is raised if any
+    spectrum could not be calculated.
+    '''
+
+    # Generate the frequency domain
+    omega = arange(args.xlim[0]-10, args.xlim[1]+10, 0.5)
+
+    # Expand any sweep into the points to calculate, and
+    # calculate the spectra for each
+    k_values = args.k_values if args.k_values is not None else [args.k]
+    jobs = [make_job(args, omega, k, settings)
+            for k, settings in sweep_points(k_values, args.sweeps,
+                                            args.combine)]
+    results = run_jobs(jobs, njobs)
+    for result in results:
+        if isinstance(result, str):
+            raise SpectrumError(result)
+    for I, params, warnings in results:
+        for warning in warnings:
+            print(warning, file=err)
+
+    # Collect the spectra, their new parameters and a label for each
+    labels, I_omega, new_params = [], [], []
+    for job, (I, params, warnings) in zip(jobs, results):
+        for i, k in enumerate(job['k_values']):
+            labels.append(', '.join(['k = {0:g} cm^-1'.format(k)] +
+                                    ['{0} = {1:g}'.format(name, value)
+                                     for name, attr, index, value
+                                     in job['settings']]))
+            I_omega.append(I[i])
+            new_params.append([p[i] for p in params])
+
+    # Normalize the generated data.  Each spectrum of a
+    # sweep is normalized on its own.
+    I_omega = array([normalize(I) for I in I_omega])
+
+    # Repeat for the raw data if given.  Clip according to the xlimits
+    if args.raw is not None:
+        args.raw = clip(args.raw, args.xlim)
+        args.raw[:,1] = normalize(args.raw[:,1])
+
+    return omega, labels, I_omega, new_params
+
+
+def data_header(labels):
+    '''Return the header naming the columns of a data file
+    holding several spectra'''
+    if len(labels) < 2:
+        return ''
+    return '\n'.join('column {0}: {1}'.format(i+2, label)
+                     for i, label in enumerate(labels))
+
+
+def tables(old_params, labels, new_params, out):
+    '''Write a table of the old and new parameters for each spectrum'''
+    for label, params in zip(labels, new_params):
+        print('# ' + label, file=out)
+        numerics(old_params, params, out)
+    return 0
+
+
+def make_job(args, omega, k_values, settings):
+    '''Return the parameters to calculate one point of a sweep as a
+    dictionary that can be sent to another process.'''
+    params = {'Gamma_Lorentz' : args.Gamma_Lorentz.copy(),
+              'Gamma_Gauss' : args.Gamma_Gauss.copy(),
+              'heights' : args.heights.copy(),
+              'exchange_rates' : args.exchange_rates.copy()}
+    for name, attr, index, value in settings:
+        params[attr][index] = value
+    params.update(npeaks=len(args.num), exchanges=args.exchanges,
+                  symmetric=args.symmetric_exchange, vib=args.vib,
+                  k_values=k_values, settings=settings, omega=omega,
+                  xlim=args.xlim, eigensolver=args.eigensolver,
+                  options={'kernel' : args.lineshape,
+                           'tol' : args.tolerance})
+    return params
+
+
+def run_jobs(jobs, njobs=1):
+    '''Calculate each job, using a pool of njobs processes if more than
+    one (0 means one per CPU).  The results are in the same order as the
+    jobs.  multiprocessing is slow to import, so it is only imported
+    when it is used.'''
+    if njobs <= 0:
+        from multiprocessing import cpu_count
+        njobs = cpu_count()
+    njobs = min(njobs, len(jobs))
+    if njobs <= 1:
+        return [compute(job) for job in jobs]
+    from multiprocessing import Pool
+    pool = Pool(njobs)
+    try:
+        return pool.map(compute, jobs,
+                        chunksize=max(len(jobs) // ( 4 * njobs ), 1))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def compute(job):
+    '''Calculate the spectra for one job.  Returns the intensities and the
+    new parameters, each with a leading axis over the rates, and a list
+    of warnings, or an error message.  The warnings are returned rather
+    than printed since the job may run in another process.'''
+
+    # Generate the Z matrix.  Keep it sparse for large systems, since
+    # most peaks only exchange with a few others.
+    Z = ZMat(job['npeaks'], job['exchanges'], job['exchange_rates'],
+             job['symmetric'], sparse=job['npeaks'] > SPARSE_PEAKS)
+
+    # Calculate the spectrum
+    k_values, omega, options = job['k_values'], job['omega'], job['options']
+    params = (job['vib'], job['Gamma_Lorentz'], job['Gamma_Gauss'],
+              job['heights'], omega)
+    warnings = []
+    try:
+        if len(k_values) > 1:
+            # One spectrum for each rate
+            return rate_sweep(Z, k_values, *params, **options) + (warnings,)
+        elif job['eigensolver'] == 'window':
+            I_omega, new_params, omitted = spectrum_window(Z, k_values[0],
+                                                           *params,
+                                                           xlim=job['xlim'],
+                                                           **options)
+            if omitted.count:
+                warnings.append('{0} eigenvalues outside of the window were '
+                                'omitted. They could add up to {1:.3g} to '
+                                'the intensity.'.format(omitted.count,
+                                                        omitted.intensity))
+        else:
+            I_omega, new_params = spectrum(Z, k_values[0], *params, **options)
+    except SpectrumError as se:
+        return str(se)
+    return I_omega[None], tuple(p[None] for p in new_params), warnings
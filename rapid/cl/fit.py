@@ -0,0 +1,81 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+from sys import stderr, stdout
+
+# Local imports
+from rapid.common import SpectrumError
+from rapid.common.fit import fit_spectrum, set_parameters, FitError, REFINE
+from rapid.common.read_input import input_record, record_lines, k_to_rate
+
+
+def run_fit(cmd_line_args, args, out=stdout, err=stderr):
+    '''Fit the parameters of the input file args to its raw data, print
+    the fitted parameters, and write the fitted input file to
+    cmd_line_args.fit.  If cmd_line_args.uncertainty is given, the
+    uncertainty of the fitted parameters is then estimated (see
+    run_uncertainty).  Messages are written to out and errors to err.
+    '''
+    bounds = dict((name, (low, high))
+                  for name, low, high in cmd_line_args.bound or [])
+    ties = dict(cmd_line_args.tie or [])
+    options = {'refine' : cmd_line_args.refine or REFINE,
+               'fix' : cmd_line_args.fix or (), 'bounds' : bounds,
+               'ties' : ties}
+    try:
+        result = fit_spectrum(args, **options)
+    except (FitError, SpectrumError) as e:
+        print(str(e), file=err)
+        return 1
+    if not result.success:
+        print('The fit did not converge: {0}'.format(result.message),
+              file=err)
+
+    # The rate is shown in the unit of the input file
+    unit = args.lifetime[1] if 'lifetime' in args else args.rate[1]
+    summary = ['Fit to {0}'.format(args.rawName),
+               '{0} evaluations, RMS residual {1:.4g}'.format(result.nfev,
+                                                              result.rms)]
+    print('# ' + '\n# '.join(summary), file=out)
+    print('# {0:20}{1:>16}{2:>16}'.format('Parameter', 'Initial', 'Fitted'),
+          file=out)
+    for i, name in enumerate(result.names):
+        initial, value = result.initial[i], result.values[i]
+        if name == 'rate':
+            name = '{0} ({1})'.format('lifetime' if 'lifetime' in args
+                                      else 'rate', unit)
+            initial, value = k_to_rate(initial, unit), k_to_rate(value, unit)
+        if result.free[i]:
+            note = ''
+        elif result.tied[i] != i:
+            note = '  (tied to {0})'.format(result.names[result.tied[i]])
+        else:
+            note = '  (fixed)'
+        print('  {0:20}{1:16.6g}{2:16.6g}{3}'.format(name, initial, value,
+                                                     note), file=out)
+
+    # Write the input file with the fitted values
+    set_parameters(args, result)
+    baseline, scale = result.values[-2:]
+    summary.append('baseline {0!r}, scale {1!r}'.format(float(baseline),
+                                                        float(scale)))
+    try:
+        with open(cmd_line_args.fit, 'w') as fl:
+            for line in summary:
+                print('# ' + line, file=fl)
+            for line in record_lines(input_record(args)):
+                print(line, file=fl)
+    except (IOError, OSError) as e:
+        print(str(e), file=err)
+        return 1
+    print('Fitted input written to file {0}'.format(cmd_line_args.fit),
+          file=out)
+    if not result.success:
+        return 1
+
+    # Estimate the uncertainty of the fitted parameters if asked to
+    if getattr(cmd_line_args, 'uncertainty', None):
+        from rapid.cl.uncertainty import run_uncertainty
+        return run_uncertainty(cmd_line_args, args, result, options, out,
+                               err)
+    return 0
@@ -0,0 +1,133 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+from os import makedirs
+from os.path import basename, isdir, join, splitext
+from sys import stderr, stdout
+
+# Non-std. lib imports
+from numpy import sqrt
+from input_reader import ReaderError
+
+# Local imports
+from rapid.common import SpectrumError
+from rapid.common.fit import FitError
+from rapid.common.globalfit import global_fit, spectrum_args, \
+                                   kinetic_prefactor, REFINE
+from rapid.common.read_input import read_manifest, input_record, \
+                                    manifest_record, record_lines, k_to_rate
+
+
+def run_global(cmd_line_args, out=stdout, err=stderr):
+    '''Fit the parameters of the manifest cmd_line_args.manifest to the
+    raw data of all of its spectra, print the fitted parameters, and
+    write the fitted manifest to cmd_line_args.output.  If
+    cmd_line_args.outdir is given, an input file for each spectrum is
+    written there too.  Messages are written to out and errors to err.
+    '''
+    try:
+        args = read_manifest(cmd_line_args.manifest)
+    except (OSError, IOError, ReaderError) as e:
+        print(str(e), file=err)
+        return 1
+    bounds = dict((name, (low, high))
+                  for name, low, high in cmd_line_args.bound or [])
+    ties = dict(cmd_line_args.tie or [])
+    try:
+        result = global_fit(args, refine=cmd_line_args.refine or REFINE,
+                            fix=cmd_line_args.fix or (), bounds=bounds,
+                            ties=ties, njobs=cmd_line_args.jobs)
+    except (FitError, SpectrumError) as e:
+        print(str(e), file=err)
+        return 1
+    if not result.success:
+        print('The fit did not converge: {0}'.format(result.message),
+              file=err)
+
+    # The rates are shown in the unit of the manifest
+    unit = args.lifetime[1] if 'lifetime' in args else args.rate[1]
+    kind = 'lifetime' if 'lifetime' in args else 'rate'
+    k, activation = result.values[:2]
+    prefactor = kinetic_prefactor(k, activation, args.reference,
+                                  args.kinetics)
+    if args.kinetics == 'eyring':
+        derived = 'activation entropy {0:.6g} J/mol/K'.format(prefactor)
+    else:
+        derived = 'prefactor {0:.6g} Hz'.format(prefactor)
+    summary = ['Global fit to {0} spectra'.format(len(args.spectra)),
+               '{0} evaluations, RMS residual {1:.4g}'.format(result.nfev,
+                                                              result.rms),
+               '{0} kinetics, {1}'.format(args.kinetics.capitalize(),
+                                          derived)]
+    print('# ' + '\n# '.join(summary), file=out)
+    print('# {0:24}{1:>16}{2:>16}'.format('Parameter', 'Initial', 'Fitted'),
+          file=out)
+    for i, name in enumerate(result.names):
+        initial, value = result.initial[i], result.values[i]
+        if name == 'rate':
+            name = '{0} ({1}, {2:g} K)'.format(kind, unit, args.reference)
+            initial, value = k_to_rate(initial, unit), k_to_rate(value, unit)
+        elif name == 'activation':
+            name = 'activation (kJ/mol)'
+        if result.free[i]:
+            note = ''
+        elif result.tied[i] != i:
+            note = '  (tied to {0})'.format(result.names[result.tied[i]])
+        else:
+            note = '  (fixed)'
+        print('  {0:24}{1:16.6g}{2:16.6g}{3}'.format(name, initial, value,
+                                                     note), file=out)
+
+    # The rate and how well each spectrum is fit
+    label = '{0} ({1})'.format(kind, unit)
+    print('# {0:>4} {1:>10}{2:>16}{3:>12}  {4}'.format('', 'T (K)', label,
+                                                       'RMS', 'Raw data'),
+          file=out)
+    for s, name in enumerate(args.spectra):
+        rms = sqrt(( ( result.model[s] - result.data[s] )**2 ).mean())
+        print('  [{0:>2}] {1:10.6g}{2:16.6g}{3:12.4g}  {4}'.format(
+              s+1, result.temperatures[s], k_to_rate(result.rates[s], unit),
+              rms, name), file=out)
+
+    # Write the manifest with the fitted values.  Parameters local to
+    # each spectrum are given their mean.
+    try:
+        record = manifest_record(spectrum_args(args, result, None))
+        with open(cmd_line_args.output, 'w') as fl:
+            for line in summary:
+                print('# ' + line, file=fl)
+            for line in record_lines(record):
+                print(line, file=fl)
+        print('Fitted manifest written to file {0}'.format(
+              cmd_line_args.output), file=out)
+
+        # Write an input file for each spectrum
+        if cmd_line_args.outdir:
+            if not isdir(cmd_line_args.outdir):
+                makedirs(cmd_line_args.outdir)
+            names = input_file_names(args.spectra)
+            for s, name in enumerate(names):
+                filename = join(cmd_line_args.outdir, name)
+                record = input_record(spectrum_args(args, result, s))
+                with open(filename, 'w') as fl:
+                    print('# Spectrum {0} of the global fit at {1:g} '
+                          'K'.format(s+1, result.temperatures[s]), file=fl)
+                    for line in record_lines(record):
+                        print(line, file=fl)
+            print('Fitted input files written to directory {0}'.format(
+                  cmd_line_args.outdir), file=out)
+    except (IOError, OSError) as e:
+        print(str(e), file=err)
+        return 1
+    return 0 if result.success else 1
+
+
+def input_file_names(spectra):
+    '''Return the names of the input files written for the raw data files
+    spectra.  Each is named after its raw data file, but if two of those
+    have the same name (i.e. in different directories), each is prefixed
+    with the number of its spectrum instead.'''
+    names = [splitext(basename(name))[0] for name in spectra]
+    if len(set(names)) < len(names):
+        names = ['{0}-{1}'.format(s+1, name) for s, name in enumerate(names)]
+    return [name + '.inp' for name in names]
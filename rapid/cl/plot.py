@@ -17,8 +17,13 @@ def plot(args, x, y):
     # 14 point font size
     rc('font', **{'size': 14})
 
-    # Plot the data and set the data window
-    if args.raw is not None:
+    # Plot the data and set the data window.  Each spectrum of
+    # a sweep is plotted in its own color.
+    if y.ndim > 1:
+        plot(x, y.T, lw=1.5)
+        if args.raw is not None:
+            plot(args.raw[:,0], args.raw[:,1], 'g-', lw=1.5)
+    elif args.raw is not None:
         plot(x, y, 'b-', args.raw[:,0], args.raw[:,1], 'g-', lw=1.5)
     else:
         plot(x, y, 'b-', lw=1.5)
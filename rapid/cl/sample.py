@@ -0,0 +1,140 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+from os.path import splitext
+from sys import stderr, stdout
+from time import time
+
+# Non-std. lib imports
+from numpy import isfinite, nan, percentile, zeros
+from numpy.lib.format import open_memmap
+from numpy.random import RandomState
+
+# Local imports
+from rapid.common import SpectrumError
+from rapid.common.fit import fit_spectrum, FitError, REFINE
+from rapid.common.read_input import k_to_rate
+from rapid.common.sample import Posterior, ensemble_sampler, \
+                                autocorrelation_time
+from rapid.common.uncertainty import standard_errors
+
+
+def run_sample(cmd_line_args, args, out=stdout, err=stderr):
+    '''Sample the posterior of the parameters of the input file args given
+    its raw data, and write a summary of it to cmd_line_args.sample.
+
+    The parameters are first fit (see fit_spectrum), and the walkers of
+    the ensemble sampler start about the fit.  The chain is written to a
+    memory mapped NumPy file of the same name ending in .chain.npy as it
+    is sampled.  It is (steps x walkers x parameters + 1), with all the
+    parameters (the rate in the unit of the input file) followed by the
+    log posterior, and steps not yet sampled are NaN.  Messages are
+    written to out and errors to err.
+    '''
+    bounds = dict((name, (low, high))
+                  for name, low, high in cmd_line_args.bound or [])
+    ties = dict(cmd_line_args.tie or [])
+    options = {'refine' : cmd_line_args.refine or REFINE,
+               'fix' : cmd_line_args.fix or (), 'bounds' : bounds,
+               'ties' : ties}
+    nsteps = cmd_line_args.steps
+    burn = nsteps // 4 if cmd_line_args.burn is None else cmd_line_args.burn
+    if not 0 <= burn < nsteps:
+        print('The burn-in must be fewer steps than are sampled', file=err)
+        return 1
+    random = RandomState(cmd_line_args.seed)
+    try:
+        best = fit_spectrum(args, **options)
+        posterior = Posterior(args, best, **options)
+        nwalkers = cmd_line_args.walkers or max(2 * posterior.ndim + 2, 16)
+        nwalkers += nwalkers % 2
+        errors = standard_errors(best)[posterior.index]
+        walkers, logp = posterior.start(nwalkers, errors, random)
+    except (FitError, SpectrumError) as e:
+        print(str(e), file=err)
+        return 1
+
+    # The rate is kept in the unit of the input file
+    unit = posterior.unit
+    kind = 'lifetime' if 'lifetime' in args else 'rate'
+    names = ['{0} ({1})'.format(kind, unit)] + posterior.names[1:]
+    chainfile = splitext(cmd_line_args.sample)[0] + '.chain.npy'
+    try:
+        chain = open_memmap(chainfile, mode='w+', dtype=float,
+                            shape=(nsteps, nwalkers, len(names) + 1))
+    except (IOError, OSError, ValueError) as e:
+        print(str(e), file=err)
+        return 1
+    chain[:] = nan
+    print('Sampling {0} parameters with {1} walkers for {2} steps'.format(
+          posterior.ndim, nwalkers, nsteps), file=out)
+
+    # Write each step to the chain as it is sampled
+    start = time()
+    every = max(nsteps // 10, 1)
+    steps = ensemble_sampler(posterior, walkers, nsteps, logp, random)
+    # The moves accepted during the burn-in, kept since the count of
+    # accepted moves is updated in place
+    burnt = zeros(nwalkers, dtype=int)
+    for step, (walkers, logp, accepted) in enumerate(steps):
+        values = posterior.values(walkers)
+        values[:,0] = k_to_rate(values[:,0], unit)
+        chain[step,:,:-1] = values
+        chain[step,:,-1] = logp
+        if step + 1 == burn:
+            burnt = accepted.copy()
+        if ( step + 1 ) % every == 0:
+            chain.flush()
+            print('Step {0} of {1}, acceptance {2:.3f}, {3:.0f} samples/s'
+                  ''.format(step + 1, nsteps, accepted.mean() / ( step + 1 ),
+                            nwalkers * ( step + 1 ) / ( time() - start )),
+                  file=out)
+    chain.flush()
+
+    # The diagnostics, after the burn-in
+    acceptance = ( accepted - burnt ) / ( nsteps - burn )
+    samples = chain[burn:,:,posterior.index]
+    tau = autocorrelation_time(samples)
+    longest = tau[isfinite(tau)].max() if isfinite(tau).any() else nan
+    nsamples = samples.shape[0] * samples.shape[1]
+    summary = ['Posterior of the fit to {0}'.format(args.rawName),
+               '{0} walkers, {1} steps after {2} of burn-in, seed '
+               '{3}'.format(nwalkers, nsteps - burn, burn,
+                            cmd_line_args.seed),
+               'Acceptance {0:.3f} (walkers from {1:.3f} to '
+               '{2:.3f})'.format(acceptance.mean(), acceptance.min(),
+                                 acceptance.max()),
+               'Longest autocorrelation time {0:.4g} steps, about {1:.0f} '
+               'independent samples'.format(longest, nsamples / longest),
+               '{0:g}% intervals'.format(100 * cmd_line_args.confidence)]
+    if not nsteps - burn > 50 * longest:
+        summary.append('The chain is shorter than 50 autocorrelation '
+                       'times; sample more steps for reliable intervals')
+    tail = 50 * ( 1 - cmd_line_args.confidence )
+    lines = ['{0:20}{1:>14}{2:>14}{3:>14}{4:>14}{5:>10}'.format(
+             'Parameter', 'Median', 'Low', 'High', 'Std. dev.', 'Tau')]
+    for j, i in enumerate(posterior.index):
+        x = samples[:,:,j].ravel()
+        low, median, high = percentile(x, [tail, 50, 100 - tail])
+        lines.append('{0:20}{1:14.6g}{2:14.6g}{3:14.6g}{4:14.6g}'
+                     '{5:10.4g}'.format(names[i], median, low, high, x.std(),
+                                        tau[j]))
+    print('# ' + '\n# '.join(summary + lines[:1]), file=out)
+    for line in lines[1:]:
+        print('  ' + line, file=out)
+
+    # Write the summary, with the columns of the chain
+    columns = 'Columns of {0}: {1}, log posterior'.format(chainfile,
+                                                          ', '.join(names))
+    try:
+        with open(cmd_line_args.sample, 'w') as fl:
+            for line in summary + [columns] + lines[:1]:
+                print('# ' + line, file=fl)
+            for line in lines[1:]:
+                print('  ' + line, file=fl)
+    except (IOError, OSError) as e:
+        print(str(e), file=err)
+        return 1
+    print('Summary written to file {0}, and the chain to {1}'.format(
+          cmd_line_args.sample, chainfile), file=out)
+    return 0
@@ -0,0 +1,218 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+import json
+import socket
+from sys import stderr, stdin, stdout
+from os import remove, umask
+from os.path import exists
+from argparse import Namespace
+from threading import Thread
+from multiprocessing import Pool, cpu_count
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+try:
+    from socketserver import ThreadingMixIn, UnixStreamServer, \
+                             StreamRequestHandler
+except ImportError:
+    from SocketServer import ThreadingMixIn, UnixStreamServer, \
+                             StreamRequestHandler
+
+# Non-std. lib imports
+from input_reader import ReaderError
+
+# Local imports
+from rapid._version import __version__
+from rapid.common import SpectrumError, read_input, read_record
+from rapid.common.read_input import absolute_path
+from rapid.cl.driver import run_non_interactive, calculate
+from rapid.cl.client import default_address
+
+__all__ = ['serve', 'handle_request']
+
+
+def serve(address=None, use_stdio=False, njobs=1):
+    '''Run a server that calculates spectra for other processes.
+
+    Each request is one line of JSON (see handle_request) and each
+    response is one line of JSON.  The server listens on a Unix socket
+    at address (see rapid.cl.client.default_address), or if use_stdio
+    is True, reads requests from standard input and writes the responses
+    to standard output in order.  Requests are calculated on a pool of
+    njobs processes (0 means one per CPU); with one job they are
+    calculated by this process.
+    '''
+    njobs = njobs if njobs > 0 else cpu_count()
+    pool = Pool(njobs) if njobs > 1 else None
+    dispatch = ( (lambda r: pool.apply(handle_request, (r,)))
+                 if pool is not None else handle_request )
+    try:
+        if use_stdio:
+            return serve_stdio(dispatch)
+        else:
+            return serve_socket(address or default_address(), dispatch)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def serve_stdio(dispatch, infile=stdin, outfile=stdout):
+    '''Answer each request read from infile in order'''
+    for line in iter(infile.readline, ''):
+        if not line.strip():
+            continue
+        response = respond(line, dispatch)
+        print(json.dumps(response), file=outfile)
+        outfile.flush()
+        if response.get('shutdown'):
+            break
+    return 0
+
+
+def serve_socket(address, dispatch):
+    '''Answer requests on a Unix socket until asked to shut down'''
+
+    # Remove a socket left behind by a server that is no longer running
+    if exists(address):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(address)
+        except socket.error:
+            remove(address)
+        else:
+            print('A server is already running on {0}'.format(address),
+                  file=stderr)
+            return 1
+        finally:
+            probe.close()
+
+    class Handler(StreamRequestHandler):
+        '''Answer each request on a connection in order'''
+        def handle(self):
+            for line in iter(self.rfile.readline, b''):
+                if not line.strip():
+                    continue
+                response = respond(line.decode('utf-8'), dispatch)
+                self.wfile.write(( json.dumps(response) + '\n' )
+                                 .encode('utf-8'))
+                self.wfile.flush()
+                if response.get('shutdown'):
+                    # shutdown waits for serve_forever, so use a thread
+                    Thread(target=self.server.shutdown).start()
+                    break
+
+    class Server(ThreadingMixIn, UnixStreamServer):
+        daemon_threads = True
+
+    # Only this user may connect.  The socket is created with these
+    # permissions, so there is no moment when others could connect.
+    mask = umask(0o177)
+    try:
+        server = Server(address, Handler)
+    finally:
+        umask(mask)
+    try:
+        print('RAPID server listening on {0}'.format(address), file=stderr)
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if exists(address):
+            remove(address)
+    return 0
+
+
+def respond(line, dispatch):
+    '''Return the response to one line of JSON'''
+    try:
+        message = json.loads(line)
+    except ValueError as e:
+        return {'ok' : False, 'status' : 1,
+                'error' : 'Invalid JSON: {0}'.format(e)}
+    if not isinstance(message, dict):
+        return {'ok' : False, 'status' : 1,
+                'error' : 'A request must be a JSON object'}
+
+    # Commands for the server itself
+    command = message.get('command')
+    if command == 'ping':
+        response = {'ok' : True, 'status' : 0, 'version' : __version__}
+    elif command == 'shutdown':
+        response = {'ok' : True, 'status' : 0, 'shutdown' : True}
+    elif command is not None:
+        response = {'ok' : False, 'status' : 1,
+                    'error' : 'Unknown command: {0}'.format(command)}
+    else:
+        try:
+            response = dispatch(message)
+        except Exception as e:
+            response = {'ok' : False, 'status' : 1,
+                        'error' : '{0}: {1}'.format(type(e).__name__, e)}
+    if 'id' in message:
+        response['id'] = message['id']
+    return response
+
+
+def handle_request(message):
+    '''Calculate the spectra for one request and return the response.
+
+    The request gives the parameters either as the path of an input file
+    ("input") or as a parameter set ("record", see read_record).  It then
+    asks for one of
+
+    - "data": the path to write the data to, as with --data
+    - "script": the path to write a plotting script to, as with --script
+    - "params": true, for the table of parameters, as with --params
+    - nothing, for the spectra themselves
+
+    Relative paths, in the request or in the parameters, are taken from
+    "cwd" if it is given (i.e. the client's working directory), instead
+    of the server's.  For the first three, the response holds the exit
+    status and what would have been printed ("stdout" and "stderr").
+    Otherwise it holds "omega", "intensity" (one list per spectrum),
+    "labels", "new_params" (for each spectrum, the lists of peak
+    positions, Lorentzian widths, Gaussian widths and heights) and any
+    warnings in "stderr".
+    '''
+    if 'record' not in message and not message.get('input'):
+        return {'ok' : False, 'status' : 1,
+                'error' : 'A request needs an "input" or a "record"'}
+    cwd = message.get('cwd')
+    paths = dict((key, absolute_path(message[key], cwd))
+                 for key in ('input', 'data', 'script') if message.get(key))
+    try:
+        if 'record' in message:
+            args = read_record(message['record'], cwd)
+        else:
+            args = read_input(paths['input'], cwd=cwd)
+    except (OSError, IOError, ReaderError) as e:
+        return {'ok' : False, 'status' : 1, 'error' : str(e),
+                'stderr' : str(e) + '\n'}
+
+    if any(key in message for key in ('data', 'script', 'params')):
+        # Do what the command line would do
+        cmd_line_args = Namespace(input_file=paths.get('input'),
+                                  data=paths.get('data'),
+                                  script=paths.get('script'),
+                                  params=bool(message.get('params')),
+                                  jobs=1)
+        out, err = StringIO(), StringIO()
+        status = run_non_interactive(cmd_line_args, args, out, err)
+        return {'ok' : status == 0, 'status' : status,
+                'stdout' : out.getvalue(), 'stderr' : err.getvalue()}
+
+    err = StringIO()
+    try:
+        omega, labels, I_omega, new_params = calculate(args, err=err)
+    except SpectrumError as e:
+        return {'ok' : False, 'status' : 1, 'error' : str(e)}
+    return {'ok' : True, 'status' : 0, 'stderr' : err.getvalue(),
+            'omega' : omega.tolist(),
+            'intensity' : I_omega.tolist(),
+            'labels' : labels,
+            'new_params' : [[list(map(float, p)) for p in params]
+                            for params in new_params]}
@@ -0,0 +1,137 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+import json
+from sys import stdin, stdout
+from collections import deque
+from multiprocessing import Pool, cpu_count
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# Non-std. lib imports
+from numpy import full, nan
+from input_reader import ReaderError
+
+# Local imports
+from rapid.common import SpectrumError, read_record
+from rapid.cl.driver import calculate
+
+__all__ = ['run_stream', 'process_line']
+
+
+def run_stream(njobs=1, inflight=None, binary=False, infile=stdin,
+               outfile=stdout):
+    '''Calculate a spectrum for each line of JSON read from infile, and
+    write one result for each to outfile in the same order.
+
+    Each line is a parameter set as given to read_record, with an
+    optional "id" that is copied to the result.  The lines are
+    calculated on a pool of njobs processes (0 means one per CPU), with
+    at most inflight of them (by default twice njobs) read ahead of the
+    result being written, so that memory stays bounded however long the
+    input is.  See process_line for the format of the results.
+    '''
+    njobs = njobs if njobs > 0 else cpu_count()
+    inflight = max(inflight or 2 * njobs, 1)
+    out = getattr(outfile, 'buffer', outfile)
+    lines = ( line for line in iter(infile.readline, '') if line.strip() )
+
+    def write(result):
+        '''Write one result and send it on straight away'''
+        header, payload = result
+        out.write(header)
+        if payload:
+            out.write(payload)
+        out.flush()
+
+    if njobs <= 1:
+        for line in lines:
+            write(process_line(line, binary))
+        return 0
+
+    pool = Pool(njobs)
+    try:
+        pending = deque()
+        for line in lines:
+            pending.append(pool.apply_async(process_line, (line, binary)))
+            if len(pending) >= inflight:
+                write(pending.popleft().get())
+        while pending:
+            write(pending.popleft().get())
+    finally:
+        pool.close()
+        pool.join()
+    return 0
+
+
+def process_line(line, binary=False):
+    '''Calculate the spectra for one line of JSON.
+
+    Returns the result as a line of JSON (encoded), and for binary
+    results the bytes that follow it.  The JSON holds "ok" and, if
+    given, "id".  If the spectra could not be calculated it holds
+    "error".  Otherwise it holds "labels", any "warnings" (a list of
+    messages) from the calculation, and unless binary is True,
+    "omega", "intensity" (a list for each spectrum) and "new_params"
+    (for each spectrum, the lists of peak positions, Lorentzian widths,
+    Gaussian widths and heights).
+
+    For binary results the arrays are instead written after the line as
+    little-endian float64 values: omega (M), the intensities (S x M),
+    and the new parameters (S x 4 x N, padded with NaN), where "shapes"
+    gives the shape of each and "nbytes" their total size.
+    '''
+    response = {}
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        response.update(ok=False, error='Invalid JSON: {0}'.format(e))
+        return _encode(response), None
+    if not isinstance(record, dict):
+        response.update(ok=False, error='Each line must be a JSON object')
+        return _encode(response), None
+
+    record = dict(record)
+    if 'id' in record:
+        response['id'] = record.pop('id')
+    try:
+        args = read_record(record)
+        warnings = StringIO()
+        omega, labels, I_omega, new_params = calculate(args, err=warnings)
+    except (OSError, IOError, ReaderError, SpectrumError) as e:
+        response.update(ok=False, error=str(e))
+        return _encode(response), None
+    except Exception as e:
+        # Don't let one malformed record stop the whole stream
+        response.update(ok=False, error='{0}: {1}'.format(type(e).__name__,
+                                                          e))
+        return _encode(response), None
+
+    response.update(ok=True, labels=labels)
+    if warnings.getvalue():
+        response['warnings'] = warnings.getvalue().splitlines()
+    if not binary:
+        response.update(omega=omega.tolist(),
+                        intensity=I_omega.tolist(),
+                        new_params=[[list(map(float, p)) for p in params]
+                                    for params in new_params])
+        return _encode(response), None
+
+    # Pack the new parameters into one array.  There may be fewer
+    # new parameters than peaks if only some eigenvalues were found.
+    P = full((len(new_params), 4, len(args.vib)), nan)
+    for i, params in enumerate(new_params):
+        for j, p in enumerate(params):
+            P[i,j,:len(p)] = p
+    arrays = [a.astype('<f8') for a in (omega, I_omega, P)]
+    payload = b''.join(a.tobytes() for a in arrays)
+    response.update(shapes=[list(a.shape) for a in arrays],
+                    nbytes=len(payload))
+    return _encode(response), payload
+
+
+def _encode(response):
+    '''Return a response as a line of JSON in bytes'''
+    return ( json.dumps(response) + '\n' ).encode('utf-8')
@@ -0,0 +1,74 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+from io import StringIO
+from os.path import exists, join
+
+# Non-std lib imports
+import pytest
+from numpy import loadtxt
+
+# Local imports
+from rapid.__main__ import batch_parser
+from rapid.cl import batch
+from rapid.cl.batch import run_batch, input_files, process_file
+
+
+@pytest.fixture
+def output(monkeypatch):
+    '''Collect what the batch writes to stdout and stderr'''
+    out, err = StringIO(), StringIO()
+    monkeypatch.setattr(batch, 'stdout', out)
+    monkeypatch.setattr(batch, 'stderr', err)
+    return out, err
+
+
+def test_input_files(tmp_path, write_input):
+    a, b = write_input('a.inp'), write_input('b.inp')
+    listing = tmp_path / 'list.txt'
+    listing.write_text(u'\n'.join([b, '', join(str(tmp_path), 'c.inp')]))
+    # Patterns that match nothing are kept, so that they are reported,
+    # and each file is only given once
+    files = input_files([join(str(tmp_path), '*.inp'), 'missing.inp'],
+                        str(listing))
+    assert files == [a, b, 'missing.inp', join(str(tmp_path), 'c.inp')]
+
+
+def test_process_file(tmp_path, write_input, input_lines):
+    good = write_input('good.inp')
+    name, error, text, warnings = process_file((good, 'data', ''))
+    assert error is None and warnings == ''
+    assert loadtxt(join(str(tmp_path), 'good.dat')).shape[1] == 2
+
+    name, error, text, warnings = process_file((good, 'params', ''))
+    assert error is None and text.startswith('## ' + good)
+
+    bad = write_input('bad.inp', input_lines + ['exchange 1 7'])
+    name, error, text, warnings = process_file((bad, 'data', ''))
+    assert 'does not exist' in error and text == ''
+
+
+@pytest.mark.parametrize('jobs', ['1', '2'])
+def test_run_batch(tmp_path, write_input, input_lines, output, jobs):
+    write_input('a.inp')
+    write_input('b.inp', input_lines[:1] + ['peak 1900 1'])
+    write_input('c.inp', input_lines[1:])
+    outdir = join(str(tmp_path), 'out')
+    args = batch_parser().parse_args([join(str(tmp_path), '*.inp'),
+                                      'missing.inp', '-o', outdir,
+                                      '-j', jobs])
+    # One bad file doesn't stop the others
+    assert run_batch(args) == 1
+    assert exists(join(outdir, 'a.dat')) and exists(join(outdir, 'b.dat'))
+    assert not exists(join(outdir, 'c.dat'))
+    out, err = output[0].getvalue(), output[1].getvalue()
+    assert out.count('Data written to file') == 2
+    assert '2 of 4 input files succeeded' in err
+    assert 'FAILED {0}'.format(join(str(tmp_path), 'c.inp')) in err
+    assert 'FAILED missing.inp' in err
+
+
+def test_run_batch_nothing(output):
+    args = batch_parser().parse_args([])
+    assert run_batch(args) == 1
+    assert 'No input files' in output[1].getvalue()
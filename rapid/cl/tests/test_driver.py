@@ -0,0 +1,84 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+from io import StringIO
+
+# Non-std lib imports
+import pytest
+from numpy import arange
+from numpy.testing import assert_allclose
+
+# Local imports
+from rapid.common.read_input import read_input
+from rapid.common.spectrum import spectrum, ZMat
+from rapid.common.utils import normalize
+from rapid.cl import driver
+from rapid.cl.driver import calculate
+
+PEAKS = ['peak 1949.8 0.38 l=5.6 g=1.2',
+         'peak 1970.3 0.35 l=5.6 g=0.9',
+         'peak 2027.6 0.27 l=2.6 g=0.7',
+         'exchange 1 2 1.0']
+
+
+def check_sweep(args, labels, I_omega, points):
+    '''Check each spectrum against spectrum at its point, given as
+    (k, {attribute : (index, value)})'''
+    assert len(labels) == len(I_omega) == len(points)
+    omega = arange(args.xlim[0]-10, args.xlim[1]+10, 0.5)
+    for I, (k, settings) in zip(I_omega, points):
+        params = {'Gamma_Lorentz' : args.Gamma_Lorentz.copy(),
+                  'heights' : args.heights.copy(),
+                  'exchange_rates' : args.exchange_rates.copy()}
+        for attr, (index, value) in settings.items():
+            params[attr][index] = value
+        Z = ZMat(3, args.exchanges, params['exchange_rates'], True)
+        I0, _ = spectrum(Z, k, args.vib, params['Gamma_Lorentz'],
+                         args.Gamma_Gauss, params['heights'], omega)
+        assert_allclose(I, normalize(I0), atol=1E-10)
+
+
+@pytest.mark.parametrize('njobs', [0, 1, 2])
+def test_calculate_product(njobs):
+    args = read_input(['rate 1 2 lin 2 THz',
+                       'peak 1949.8 0.38 l=2,4 g=1.2'] + PEAKS[1:])
+    omega, labels, I_omega, new_params = calculate(args, njobs)
+    assert len(new_params) == 4
+    k1, k2 = args.k_values
+    check_sweep(args, labels, I_omega,
+                [(k, {'Gamma_Lorentz' : (0, l)})
+                 for l in (2, 4) for k in (k1, k2)])
+    assert labels[1].startswith('k = {0:g} cm^-1'.format(k2))
+    assert labels[1].endswith('peak 1 l = 2')
+
+
+@pytest.mark.parametrize('njobs', [1, 2])
+def test_calculate_zip(njobs):
+    args = read_input(['rate 1 2 lin 2 THz', 'sweep zip'] + PEAKS[:3] +
+                      ['exchange 1 2 0.5,1.0'])
+    omega, labels, I_omega, new_params = calculate(args, njobs)
+    k1, k2 = args.k_values
+    check_sweep(args, labels, I_omega,
+                [(k1, {'exchange_rates' : (0, 0.5)}),
+                 (k2, {'exchange_rates' : (0, 1.0)})])
+
+
+def test_calculate_window_warning():
+    # 150 peaks, most of them far outside of the plot
+    lines = ['rate 1 THz', 'eigensolver window', 'xlim 1900 2000']
+    lines += ['peak {0} 1 l=2 g=2'.format(1000 + 20 * i) for i in range(150)]
+    lines += ['exchange {0} {1} 0.1'.format(i, i + 1) for i in range(1, 150)]
+    err = StringIO()
+    calculate(read_input(lines), err=err)
+    assert 'eigenvalues outside of the window were omitted' in err.getvalue()
+
+
+def test_calculate_sparse(monkeypatch):
+    # A sparse Z gives the same spectra as a dense one
+    args = read_input(['rate 1 2 lin 2 THz'] + PEAKS)
+    omega, labels, I_omega, new_params = calculate(args)
+    monkeypatch.setattr(driver, 'SPARSE_PEAKS', 1)
+    omega, labels, I_sparse, sparse_params = calculate(args)
+    assert_allclose(I_sparse, I_omega, atol=1E-12)
+    for p, p0 in zip(sparse_params, new_params):
+        assert_allclose(p, p0, atol=1E-10)
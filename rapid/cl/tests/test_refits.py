@@ -0,0 +1,96 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+from argparse import Namespace
+from io import StringIO
+from os.path import join
+
+# Non-std lib imports
+import pytest
+from numpy import column_stack, linspace, savetxt
+from numpy.random import RandomState
+
+# Local imports
+from rapid.common.read_input import read_input
+from rapid.common.spectrum import ZMat, spectrum
+from rapid.common.fit import fit_spectrum, REFINE
+from rapid.cl.uncertainty import run_uncertainty, read_table
+
+
+@pytest.fixture
+def fitted(tmp_path, input_lines, write_input):
+    '''The arguments and best fit of noisy raw data of the small input
+    file, with the first two peaks apart, and the options of the fit'''
+    input_lines[0] = 'rate 0.5 THz'
+    args = read_input(input_lines)
+    omega = linspace(1901, 2049, 297)
+    Z = ZMat(3, args.exchanges, args.exchange_rates, True)
+    I = spectrum(Z, args.k, args.vib, args.Gamma_Lorentz, args.Gamma_Gauss,
+                 args.heights, omega)[0]
+    I += RandomState(0).normal(0, 1E-3, len(I))
+    savetxt(str(tmp_path / 'raw.txt'), column_stack([omega, I]))
+    args = read_input(write_input('a.inp', input_lines + ['raw raw.txt']),
+                      cwd=str(tmp_path))
+    options = {'refine' : REFINE, 'fix' : (), 'bounds' : {}, 'ties' : {}}
+    return args, fit_spectrum(args, **options), options
+
+
+def command_line(tmp_path, **kwargs):
+    '''The command line arguments of run_uncertainty'''
+    options = dict(uncertainty=join(str(tmp_path), 'u.txt'), confidence=0.9,
+                   seed=0, bootstrap=3, profile=3, resume=False, jobs=1)
+    options.update(kwargs)
+    return Namespace(**options)
+
+
+def table(tmp_path, kind):
+    '''The lines of refits in a table'''
+    with open(join(str(tmp_path), 'u.{0}.dat'.format(kind))) as fl:
+        return [line for line in fl.read().splitlines()
+                if not line.startswith('#')]
+
+
+def test_run_uncertainty(tmp_path, fitted):
+    args, best, options = fitted
+    out, err = StringIO(), StringIO()
+    assert run_uncertainty(command_line(tmp_path), args, best, options, out,
+                           err) == 0
+    assert err.getvalue() == ''
+    assert 'Intervals written to file' in out.getvalue()
+    with open(join(str(tmp_path), 'u.txt')) as fl:
+        summary = fl.read()
+    assert '3 bootstrap resamples (3 converged), 3 points' in summary
+    assert 'rate (thz)' in summary and 'peak 3 vib' in summary
+    bootstrap = table(tmp_path, 'bootstrap')
+    assert [line.split()[:2] for line in bootstrap] == [['0', '1'],
+                                                        ['1', '1'],
+                                                        ['2', '1']]
+    assert len(table(tmp_path, 'profile')) == 3
+
+    # Resuming only does the refits not yet done
+    out = StringIO()
+    assert run_uncertainty(command_line(tmp_path, bootstrap=5, resume=True),
+                           args, best, options, out, err) == 0
+    assert 'Resuming with 6 refits already done' in out.getvalue()
+    assert table(tmp_path, 'bootstrap')[:3] == bootstrap
+    assert len(table(tmp_path, 'bootstrap')) == 5
+
+    # The tables of another run are not resumed
+    err = StringIO()
+    assert run_uncertainty(command_line(tmp_path, seed=1, resume=True), args,
+                           best, options, out, err) == 1
+    assert 'different run' in err.getvalue()
+
+
+def test_read_table(tmp_path):
+    name = join(str(tmp_path), 't.dat')
+    with open(name, 'w') as fl:
+        fl.write(u'# header\n0 1 0.5 1 2\n1 0 nan nan nan\n2 1 0.25 1\n')
+    refits = read_table(name, ['header'], 2)
+    # The last line was cut short
+    assert sorted(refits) == [0, 1]
+    success, rss, values = refits[0]
+    assert success and rss == 0.5 and list(values) == [1, 2]
+    assert not refits[1][0]
+    with pytest.raises(ValueError):
+        read_table(name, ['other'], 2)
@@ -0,0 +1,12 @@
+from __future__ import print_function, division, absolute_import
+
+# Local imports
+from rapid.cl.globalfit import input_file_names
+
+
+def test_input_file_names():
+    assert input_file_names(['/data/270.txt', '300.txt']) == ['270.inp',
+                                                              '300.inp']
+    # Raw data files of the same name in different directories
+    assert input_file_names(['/a/raw.txt', '/b/raw.dat', '/c/x.txt']) == [
+        '1-raw.inp', '2-raw.inp', '3-x.inp']
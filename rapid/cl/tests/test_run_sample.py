@@ -0,0 +1,77 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+import re
+from argparse import Namespace
+from io import StringIO
+from os.path import join
+
+# Non-std lib imports
+from numpy import column_stack, isfinite, linspace, load, savetxt
+from numpy.random import RandomState
+
+# Local imports
+from rapid.common.read_input import read_input
+from rapid.common.spectrum import ZMat, spectrum
+from rapid.cl.sample import run_sample
+
+
+def command_line(tmp_path, **kwargs):
+    '''The command line arguments of run_sample'''
+    options = dict(sample=join(str(tmp_path), 's.txt'), refine=['rate',
+                                                               'vib'],
+                   fix=None, bound=None, tie=None, steps=40, burn=None,
+                   walkers=None, seed=0, confidence=0.9)
+    options.update(kwargs)
+    return Namespace(**options)
+
+
+def noisy_args(tmp_path, input_lines, write_input):
+    '''The small input file with noisy raw data of its spectrum'''
+    input_lines[0] = 'rate 0.5 THz'
+    args = read_input(input_lines)
+    omega = linspace(1901, 2049, 297)
+    Z = ZMat(3, args.exchanges, args.exchange_rates, True)
+    I = spectrum(Z, args.k, args.vib, args.Gamma_Lorentz, args.Gamma_Gauss,
+                 args.heights, omega)[0]
+    I += RandomState(0).normal(0, 1E-3, len(I))
+    savetxt(str(tmp_path / 'raw.txt'), column_stack([omega, I]))
+    return read_input(write_input('a.inp', input_lines + ['raw raw.txt']),
+                      cwd=str(tmp_path))
+
+
+def test_run_sample(tmp_path, input_lines, write_input):
+    args = noisy_args(tmp_path, input_lines, write_input)
+    out, err = StringIO(), StringIO()
+    assert run_sample(command_line(tmp_path), args, out, err) == 0
+    assert err.getvalue() == ''
+
+    # The whole chain is written, with the walkers in the unit of the
+    # input and the log posterior last
+    chain = load(join(str(tmp_path), 's.chain.npy'))
+    assert chain.shape == (40, 16, 2 + 4 * 3 + 2 + 1)
+    assert isfinite(chain).all()
+    assert ( abs(chain[10:,:,0] - 0.5) < 0.1 ).all()
+    with open(join(str(tmp_path), 's.txt')) as fl:
+        summary = fl.read()
+    assert '16 walkers, 30 steps after 10 of burn-in, seed 0' in summary
+    assert 'rate (thz)' in summary and 'peak 3 vib' in summary
+
+    # The acceptance is of the steps after the burn-in
+    line = [x for x in summary.splitlines() if 'Acceptance' in x][0]
+    acceptance = [float(x) for x in re.findall(r'\d\.\d+', line)]
+    assert len(acceptance) == 3 and all(0 <= x <= 1 for x in acceptance)
+
+
+def test_run_sample_errors(tmp_path, input_lines, write_input):
+    args = noisy_args(tmp_path, input_lines, write_input)
+    err = StringIO()
+    assert run_sample(command_line(tmp_path, burn=40), args, StringIO(),
+                      err) == 1
+    assert 'burn-in' in err.getvalue()
+
+    # The best fit is outside of the prior
+    args.priors = [('rate', 'uniform', 2.0, 3.0)]
+    err = StringIO()
+    assert run_sample(command_line(tmp_path), args, StringIO(), err) == 1
+    assert 'could not be started' in err.getvalue()
@@ -0,0 +1,183 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+import json
+import socket
+from io import StringIO
+from os import stat
+from os.path import exists, join
+from argparse import Namespace
+from threading import Thread
+from time import sleep, time
+
+# Non-std lib imports
+import pytest
+from numpy import loadtxt
+from numpy.testing import assert_allclose
+
+# Local imports
+from rapid.common.read_input import read_input
+from rapid.cl import client
+from rapid.cl.driver import calculate
+from rapid.cl.server import respond, handle_request, serve_stdio, \
+                            serve_socket
+from rapid.cl.client import request, run_via_server
+
+
+def failing(message):
+    raise ValueError('no good')
+
+
+def test_respond():
+    assert respond('{"command": "ping", "id": 3}', failing)['id'] == 3
+    assert respond('{"command": "shutdown"}', failing)['shutdown']
+    for line, error in (('{', 'Invalid JSON'),
+                        ('[1, 2]', 'must be a JSON object'),
+                        ('{"command": "reboot"}', 'Unknown command'),
+                        ('{"input": "x.inp"}', 'ValueError: no good')):
+        response = respond(line, failing)
+        assert not response['ok'] and response['status'] == 1
+        assert error in response['error']
+
+
+def test_handle_request_record(input_lines, write_input):
+    record = {'rate' : [1.54, 'THz'],
+              'peak' : [[1949.8, 0.38, {'l' : 5.6, 'g' : 1.2}],
+                        [1970.3, 0.35, {'l' : 5.6, 'g' : 0.9}],
+                        [2027.6, 0.27, {'l' : 2.6, 'g' : 0.7}]],
+              'exchange' : [[1, 2, 1.0]],
+              'xlim' : [1900, 2050]}
+    response = handle_request({'record' : record})
+    assert response['ok'] and response['stderr'] == ''
+    omega, labels, I_omega, new_params = calculate(read_input(input_lines))
+    assert_allclose(response['omega'], omega)
+    assert_allclose(response['intensity'], I_omega)
+    assert_allclose(response['new_params'][0], new_params[0])
+
+    # The same from an input file
+    response = handle_request({'input' : write_input('a.inp')})
+    assert_allclose(response['intensity'], I_omega)
+
+
+def test_handle_request_paths(tmp_path, input_lines, write_input):
+    # Relative paths, including the raw data in the input file, are
+    # taken from cwd, not the server's directory
+    (tmp_path / 'raw.txt').write_text(u'1900 0\n1950 1\n2000 0\n')
+    write_input('a.inp', input_lines + ['raw raw.txt'])
+    response = handle_request({'input' : 'a.inp', 'data' : 'a.dat',
+                               'cwd' : str(tmp_path)})
+    assert response['ok'], response
+    assert loadtxt(join(str(tmp_path), 'a.dat')).shape[1] == 2
+
+    response = handle_request({'input' : 'a.inp', 'params' : True,
+                               'cwd' : str(tmp_path)})
+    assert response['ok'] and 'Rel. Height' in response['stdout']
+
+
+def test_handle_request_errors(tmp_path, input_lines, write_input):
+    for message in ({}, {'input' : ''}, {'data' : 'a.dat'}):
+        response = handle_request(message)
+        assert not response['ok'] and 'needs an "input"' in response['error']
+
+    response = handle_request({'input' : 'missing.inp',
+                               'cwd' : str(tmp_path)})
+    assert not response['ok'] and response['stderr']
+    bad = write_input('bad.inp', input_lines + ['exchange 1 7'])
+    response = handle_request({'input' : bad})
+    assert not response['ok'] and 'does not exist' in response['error']
+    response = handle_request({'record' : [1, 2]})
+    assert not response['ok'] and 'dictionary' in response['error']
+
+
+def test_serve_stdio():
+    requests = ['{"command": "ping", "id": 1}', '',
+                '{"command": "bogus", "id": 2}',
+                '{"command": "shutdown", "id": 3}',
+                '{"command": "ping", "id": 4}']
+    out = StringIO()
+    assert serve_stdio(handle_request, StringIO(u'\n'.join(requests)),
+                       out) == 0
+    # Answered in order, stopping at the shutdown
+    responses = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [r['id'] for r in responses] == [1, 2, 3]
+    assert [r['ok'] for r in responses] == [True, False, True]
+
+
+@pytest.fixture
+def server(tmp_path):
+    '''Run a server on a socket in a temporary directory, and return the
+    socket's path'''
+    address = join(str(tmp_path), 's.sock')
+    thread = Thread(target=serve_socket, args=(address, handle_request))
+    thread.daemon = True
+    thread.start()
+    start = time()
+    while not exists(address) and time() - start < 10:
+        sleep(0.01)
+    yield address
+    try:
+        request({'command' : 'shutdown'}, address, 10)
+    except socket.error:
+        # It was already shut down
+        pass
+    thread.join(10)
+    assert not exists(address)
+
+
+def test_serve_socket(server, tmp_path, write_input, monkeypatch):
+    # Only this user may connect
+    assert stat(server).st_mode & 0o777 == 0o600
+    assert request({'command' : 'ping'}, server, 10)['ok']
+
+    # A relative input file is taken from the client's directory
+    write_input('a.inp')
+    monkeypatch.chdir(tmp_path)
+    out, err = StringIO(), StringIO()
+    monkeypatch.setattr(client, 'stdout', out)
+    monkeypatch.setattr(client, 'stderr', err)
+    args = Namespace(input_file='a.inp', data='a.dat', script=None,
+                     params=False)
+    assert run_via_server(args, server, 10) == 0
+    assert 'Data written to file' in out.getvalue()
+    assert exists(join(str(tmp_path), 'a.dat'))
+
+    args.input_file = 'missing.inp'
+    assert run_via_server(args, server, 10) == 1
+    assert err.getvalue()
+
+    # A second server on the same socket is refused
+    assert serve_socket(server, handle_request) == 1
+
+    assert request({'command' : 'shutdown'}, server, 10)['shutdown']
+
+
+def test_run_via_server_fallback(tmp_path):
+    args = Namespace(input_file='a.inp', data='a.dat', script=None,
+                     params=False)
+    # No server is running
+    address = join(str(tmp_path), 'none.sock')
+    assert run_via_server(args, address, 1) is None
+
+    # The plot must be shown by this process
+    args.data = None
+    assert run_via_server(args, address, 1) is None
+
+
+def test_run_via_server_timeout(tmp_path, monkeypatch):
+    # A server that doesn't answer in time may still write the output,
+    # so it is an error rather than a fallback
+    err = StringIO()
+    monkeypatch.setattr(client, 'stderr', err)
+    args = Namespace(input_file='a.inp', data='a.dat', script=None,
+                     params=False)
+    address = join(str(tmp_path), 'slow.sock')
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(address)
+    listener.listen(1)
+    try:
+        start = time()
+        assert run_via_server(args, address, 0.2) == 1
+        assert time() - start < 5
+    finally:
+        listener.close()
+    assert 'did not answer within 0.2 seconds' in err.getvalue()
@@ -0,0 +1,72 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+import json
+from io import BytesIO, StringIO
+
+# Non-std lib imports
+import pytest
+from numpy import cumsum, frombuffer, isnan, prod
+from numpy.testing import assert_allclose
+
+# Local imports
+from rapid.cl.stream import run_stream, process_line
+
+RECORD = {'rate' : [1.54, 'THz'],
+          'peak' : [[1949.8, 0.38, {'l' : 5.6, 'g' : 1.2}],
+                    [1970.3, 0.35, {'l' : 5.6, 'g' : 0.9}]],
+          'exchange' : [[1, 2]],
+          'xlim' : [1900, 2050]}
+
+
+def results(text):
+    '''The results written by run_stream, as dictionaries'''
+    return [json.loads(line) for line in text.decode('utf-8').splitlines()]
+
+
+@pytest.mark.parametrize('njobs', [1, 2])
+def test_run_stream(njobs):
+    lines = []
+    for i in range(5):
+        record = dict(RECORD, id=i, rate=[0.5 + i, 'THz'])
+        lines.append(json.dumps(record))
+    # Blank lines are skipped and malformed ones answered with an error,
+    # and none of them stop the stream
+    lines[1:1] = ['', '{"id": "bad", "peak": 5}', 'not json', '[1, 2]',
+                  '{"id": "missing", "rate": [1, "THz"]}']
+    out = BytesIO()
+    assert run_stream(njobs, 2, infile=StringIO(u'\n'.join(lines)),
+                      outfile=out) == 0
+    answers = results(out.getvalue())
+    assert [r.get('id') for r in answers] == [0, 'bad', None, None,
+                                              'missing', 1, 2, 3, 4]
+    assert [r['ok'] for r in answers] == [True] + [False] * 4 + [True] * 4
+    assert 'TypeError' in answers[1]['error']
+    assert 'Invalid JSON' in answers[2]['error']
+    assert 'JSON object' in answers[3]['error']
+
+    # Each spectrum is that of its own rate
+    for r in answers[5:]:
+        assert r['labels'] and len(r['intensity']) == 1
+    assert answers[5]['intensity'] != answers[6]['intensity']
+
+
+def test_binary():
+    header, payload = process_line(json.dumps(RECORD), binary=False)
+    expected = json.loads(header.decode('utf-8'))
+    assert payload is None
+
+    header, payload = process_line(json.dumps(RECORD), binary=True)
+    response = json.loads(header.decode('utf-8'))
+    assert 'intensity' not in response
+    assert response['nbytes'] == len(payload)
+    # The arrays follow one another in order
+    values = frombuffer(payload, dtype='<f8')
+    sizes = [int(prod(shape)) for shape in response['shapes']]
+    omega, I, P = [values[start:start+size].reshape(shape)
+                   for start, size, shape in zip(cumsum([0] + sizes), sizes,
+                                                 response['shapes'])]
+    assert_allclose(omega, expected['omega'])
+    assert_allclose(I, expected['intensity'])
+    assert_allclose(P, expected['new_params'])
+    assert not isnan(P).any()
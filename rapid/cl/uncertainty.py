@@ -0,0 +1,167 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+from os.path import exists, splitext
+from sys import stderr, stdout
+
+# Non-std. lib imports
+from numpy import array, nan
+
+# Local imports
+from rapid.common.read_input import k_to_rate
+from rapid.common.uncertainty import run_refits, bootstrap_jobs, \
+                                     profile_jobs, profile_rates, \
+                                     standard_errors, percentile_interval, \
+                                     profile_interval
+
+
+def run_uncertainty(cmd_line_args, args, best, options, out=stdout,
+                    err=stderr):
+    '''Estimate the uncertainty of the parameters of a fit by refitting
+    bootstrap resamples of its residuals, and by profiling the rate.
+
+    best is the FitResult of fit_spectrum for args, and options are the
+    refine, fix, bounds and ties it was given.  The intervals are
+    printed, and written to cmd_line_args.uncertainty.  Each refit is
+    written to a table as it finishes (ending in .bootstrap.dat and
+    .profile.dat), and with cmd_line_args.resume those already in the
+    tables are kept.  Messages are written to out and errors to err.
+    '''
+    unit = args.lifetime[1] if 'lifetime' in args else args.rate[1]
+    kind = 'lifetime' if 'lifetime' in args else 'rate'
+    names = ['{0} ({1})'.format(kind, unit)] + list(best.names[1:])
+    confidence = cmd_line_args.confidence
+    root = splitext(cmd_line_args.uncertainty)[0]
+    tables = {'bootstrap' : root + '.bootstrap.dat',
+              'profile' : root + '.profile.dat'}
+    headers = {'bootstrap' : ['Bootstrap resamples of the fit to {0}, seed '
+                              '{1}'.format(args.rawName, cmd_line_args.seed)],
+               'profile' : ['Profile of the {0} of the fit to {1}, {2} '
+                            'points'.format(kind, args.rawName,
+                                            cmd_line_args.profile)]}
+    columns = 'Columns: index, success, rss, ' + ', '.join(names)
+    for key in headers:
+        headers[key].append(columns)
+
+    # The rates of the profile, if the rate was refined
+    rates = profile_rates(best, cmd_line_args.profile) \
+            if best.free[0] and cmd_line_args.profile > 0 else []
+
+    # Read the refits already done, and start the tables again with them
+    done = {'bootstrap' : {}, 'profile' : {}}
+    try:
+        for key, filename in tables.items():
+            if cmd_line_args.resume and exists(filename):
+                done[key] = read_table(filename, headers[key], len(names))
+            with open(filename, 'w') as fl:
+                for line in headers[key]:
+                    print('# ' + line, file=fl)
+                for index in sorted(done[key]):
+                    print(table_line(index, *done[key][index]), file=fl)
+    except (IOError, OSError, ValueError) as e:
+        print(str(e), file=err)
+        return 1
+    jobs = bootstrap_jobs(cmd_line_args.bootstrap, done['bootstrap']) \
+         + profile_jobs(rates, done['profile'])
+    ndone = len(done['bootstrap']) + len(done['profile'])
+    if ndone:
+        print('Resuming with {0} refits already done'.format(ndone),
+              file=out)
+
+    # Append each refit to its table as soon as it is done, so that an
+    # interrupted run can be resumed
+    files = dict((key, open(filename, 'a'))
+                 for key, filename in tables.items())
+    try:
+        for refit in run_refits(args, best, jobs, seed=cmd_line_args.seed,
+                                njobs=cmd_line_args.jobs, **options):
+            values = refit.values.copy()
+            values[0] = k_to_rate(values[0], unit)
+            done[refit.kind][refit.index] = (refit.success, refit.rss,
+                                             values)
+            print(table_line(refit.index, refit.success, refit.rss, values),
+                  file=files[refit.kind])
+            files[refit.kind].flush()
+    finally:
+        for fl in files.values():
+            fl.close()
+
+    # The intervals of each refined parameter
+    k = best.values[0]
+    errors = standard_errors(best)
+    errors[0] *= abs(k_to_rate(k, unit)) / k
+    fitted = best.values.copy()
+    fitted[0] = k_to_rate(k, unit)
+    boot = array([done['bootstrap'][i][2] for i in sorted(done['bootstrap'])
+                  if done['bootstrap'][i][0]]).reshape(-1, len(names))
+    rss = ( ( best.model - best.data )**2 ).sum()
+    if len(done['profile']):
+        points = [(fitted[0], rss)] + [(v[2][0], v[1])
+                                       for v in done['profile'].values()]
+        profile = profile_interval(array([x[0] for x in points]),
+                                   array([x[1] for x in points]),
+                                   len(best.data), confidence)
+    else:
+        profile = nan, nan
+
+    summary = ['Uncertainty of the fit to {0}'.format(args.rawName),
+               '{0} bootstrap resamples ({1} converged), {2} points in the '
+               'profile of the {3}'.format(len(done['bootstrap']), len(boot),
+                                           len(done['profile']), kind),
+               '{0:g}% intervals; nan is an end past the '
+               'profile'.format(100 * confidence)]
+    lines = ['{0:20}{1:>14}{2:>14}{3:>14}{4:>14}{5:>14}{6:>14}'.format(
+             'Parameter', 'Fitted', 'Std. error', 'Bootstrap', '',
+             'Profile', '')]
+    for i in best.free.nonzero()[0]:
+        low, high = percentile_interval(boot[:,i], confidence)
+        ends = ['{0:14.6g}'.format(x) for x in profile] if i == 0 else ['']*2
+        lines.append('{0:20}{1:14.6g}{2:14.6g}{3:14.6g}{4:14.6g}'
+                     '{5:>14}{6:>14}'.format(names[i], fitted[i], errors[i],
+                                             low, high, *ends))
+    print('# ' + '\n# '.join(summary + lines[:1]), file=out)
+    for line in lines[1:]:
+        print('  ' + line, file=out)
+    try:
+        with open(cmd_line_args.uncertainty, 'w') as fl:
+            for line in summary + lines[:1]:
+                print('# ' + line, file=fl)
+            for line in lines[1:]:
+                print('  ' + line, file=fl)
+    except (IOError, OSError) as e:
+        print(str(e), file=err)
+        return 1
+    print('Intervals written to file {0}, and the refits to {1} and '
+          '{2}'.format(cmd_line_args.uncertainty, tables['bootstrap'],
+                       tables['profile']), file=out)
+    return 0
+
+
+def table_line(index, success, rss, values):
+    '''Return the line of a table of refits'''
+    return ' '.join(['{0:d}'.format(index), '{0:d}'.format(bool(success))]
+                    + ['{0:.17g}'.format(x) for x in [rss] + list(values)])
+
+
+def read_table(filename, header, nvalues):
+    '''Read the refits of a table written by run_uncertainty, as a
+    dictionary of each index to (success, rss, values).  A ValueError is
+    raised if the table is of a different run.  A line that was cut short
+    when a run was interrupted is skipped.'''
+    refits = {}
+    with open(filename) as fl:
+        lines = fl.read().splitlines()
+    if [x[2:] for x in lines[:len(header)]] != header:
+        raise ValueError('{0} is from a different run, and cannot be '
+                         'resumed'.format(filename))
+    for line in lines[len(header):]:
+        tokens = line.split()
+        if len(tokens) != nvalues + 3:
+            continue
+        try:
+            values = array([float(x) for x in tokens[2:]])
+            refits[int(tokens[0])] = (bool(int(tokens[1])), values[0],
+                                      values[1:])
+        except ValueError:
+            continue
+    return refits
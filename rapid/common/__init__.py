@@ -1,14 +1,46 @@
 from __future__ import print_function, division, absolute_import
 
-# Local imports
-from rapid.common.spectrum import spectrum, SpectrumError, ZMat
-from rapid.common.utils import normalize, clip, numerics, write_data
-from rapid.common.save_script import save_script
-from rapid.common.read_input import read_input
+# Local imports.  Each is imported when first used.
+from rapid._lazy import lazy_exports
+
+lazy_exports(__name__, {'spectrum' : 'rapid.common.spectrum',
+                        'spectrum_batch' : 'rapid.common.spectrum',
+                        'SpectrumError' : 'rapid.common.spectrum',
+                        'ZMat' : 'rapid.common.spectrum',
+                        'spectrum_window' : 'rapid.common.window',
+                        'SpectrumModel' : 'rapid.common.model',
+                        'rate_sweep' : 'rapid.common.sweep',
+                        'sweep_points' : 'rapid.common.sweep',
+                        'RateSurrogate' : 'rapid.common.sweep',
+                        'spectrum_jacobian' : 'rapid.common.jacobian',
+                        'ZMat_derivatives' : 'rapid.common.jacobian',
+                        'fit_spectrum' : 'rapid.common.fit',
+                        'FitError' : 'rapid.common.fit',
+                        'global_fit' : 'rapid.common.globalfit',
+                        'normalize' : 'rapid.common.utils',
+                        'clip' : 'rapid.common.utils',
+                        'numerics' : 'rapid.common.utils',
+                        'write_data' : 'rapid.common.utils',
+                        'save_script' : 'rapid.common.save_script',
+                        'read_input' : 'rapid.common.read_input',
+                        'read_record' : 'rapid.common.read_input',
+                        'read_manifest' : 'rapid.common.read_input',
+                       })
 
 
 __all__ = ['spectrum',
+           'spectrum_batch',
+           'spectrum_window',
+           'SpectrumModel',
+           'rate_sweep',
+           'sweep_points',
+           'RateSurrogate',
+           'spectrum_jacobian',
            'ZMat',
+           'ZMat_derivatives',
+           'fit_spectrum',
+           'FitError',
+           'global_fit',
            'SpectrumError',
            'normalize',
            'clip',
@@ -16,4 +48,6 @@ __all__ = ['spectrum',
            'write_data',
            'save_script',
            'read_input',
+           'read_record',
+           'read_manifest',
           ]
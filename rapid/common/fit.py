@@ -0,0 +1,323 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+from collections import namedtuple
+
+# Non-std lib imports
+from scipy.optimize import least_squares
+from numpy import arange, array, asarray, concatenate, column_stack, full, \
+                  inf, isfinite, nan, ones, sqrt, zeros
+from numpy.linalg import lstsq
+
+# Local imports
+from rapid.common.spectrum import ZMat, SpectrumError
+from rapid.common.jacobian import spectrum_jacobian, ZMat_derivatives
+from rapid.common.read_input import rate_to_k, k_to_rate, LIFETIME_UNITS
+from rapid.common.utils import clip, normalize
+
+__all__ = ['fit_spectrum', 'fit_parameters', 'set_parameters', 'FitResult',
+           'FitError', 'KINDS', 'REFINE']
+
+# The kinds of parameter that can be refined.  The name of a kind
+# selects all parameters of that kind (i.e. "l" is every Lorentzian
+# width).
+KINDS = ('rate', 'exchange', 'vib', 'l', 'g', 'height', 'baseline', 'scale')
+
+# The parameters refined by default.  The exchange rates are relative to
+# the rate, so they are only refined when asked for.
+REFINE = ('rate', 'vib', 'l', 'g', 'height', 'baseline', 'scale')
+
+# The default bounds of each kind of parameter.  The activation energy
+# is only a parameter of a global fit (see rapid.common.globalfit).
+BOUNDS = {'rate' : (0, inf), 'exchange' : (0, inf), 'vib' : (-inf, inf),
+          'l' : (0, inf), 'g' : (0, inf), 'height' : (0, inf),
+          'baseline' : (-inf, inf), 'scale' : (0, inf),
+          'activation' : (-inf, inf)}
+
+# A parameter of the fit.  name is i.e. "peak 2 l", kind is "l", label is
+# "peak 2", and value is its value.  The rate is in wavenumbers.
+Parameter = namedtuple('Parameter', 'name kind label value')
+
+# The result of a fit.  names are the names of all the parameters and
+# values their fitted values (initial their starting values).  free says
+# which were refined, and tied gives the index of the parameter each one
+# follows (its own index if not tied).  omega and data are the raw data
+# that was fitted, model is the fitted spectrum there, and jacobian is
+# the derivatives of the model with respect to the refined parameters.
+FitResult = namedtuple('FitResult',
+                       'names values initial free tied success message '
+                       'nfev rms omega data model jacobian')
+
+# Which parameters are refined.  free and tied are as in FitResult, index
+# is the indices of those refined, lower and upper are the bounds of all
+# parameters, and expand is the derivatives of all the parameters with
+# respect to those refined.
+Choice = namedtuple('Choice', 'free tied index lower upper expand')
+
+
+def fit_spectrum(args, refine=REFINE, fix=(), bounds=None, ties=None,
+                 max_nfev=None, data=None, start=None):
+    '''Refine the parameters read by read_input so that the spectrum
+    matches the raw data, and return a FitResult.
+
+    The model is scale * I + baseline, where I is the spectrum calculated
+    at the x-values of the raw data, and the data is clipped to xlim and
+    normalized.  refine and fix are lists of the names of the parameters
+    to refine and to hold fixed (see fit_parameters); a name may also be
+    a kind (see KINDS), or a label such as "peak 2" to select all of its
+    parameters.  bounds is a dictionary of names to (lower, upper), where
+    the bounds of the rate are in the unit of the input file.  ties is a
+    dictionary of names to the name of the parameter each is held equal
+    to.  By default everything but the relative exchange rates is
+    refined.  The heights are relative, so when the scale and all the
+    heights are refined, the first height is held fixed.
+
+    data replaces the normalized raw data, i.e. to refit a resample of
+    it, and start gives the starting values of all the parameters (as in
+    FitResult.values), i.e. to start from an earlier fit.  By default the
+    fit starts from the parameters of args, with the scale and baseline
+    that best match the data.
+
+    The fit is a bounded least squares (scipy.optimize.least_squares)
+    using the analytic derivatives from spectrum_jacobian.  A FitError is
+    raised if the fit cannot be set up, and a SpectrumError if a spectrum
+    cannot be calculated.
+    '''
+    if args.raw is None:
+        raise FitError('There is no raw data to fit to')
+    if args.k_values is not None or args.sweeps:
+        raise FitError('A sweep cannot be fit')
+    raw = clip(args.raw, args.xlim)
+    if len(raw) < 2:
+        raise FitError('There is no raw data inside of xlim')
+    omega = raw[:,0]
+    data = normalize(raw[:,1]) if data is None else asarray(data, dtype=float)
+
+    params = fit_parameters(args)
+    names = [p.name for p in params]
+    initial = array([p.value for p in params])
+    npeaks, nexchange = len(args.vib), len(args.exchange_rates)
+
+    def spectrum_at(p):
+        '''The spectrum and its derivatives for the parameters p'''
+        k, rates = p[0], p[1:1+nexchange]
+        vib, GL, GG, h = p[1+nexchange:-2].reshape(4, npeaks)
+        Z = ZMat(npeaks, args.exchanges, rates, args.symmetric_exchange)
+        dZ = ZMat_derivatives(npeaks, args.exchanges, rates,
+                              args.symmetric_exchange)
+        return spectrum_jacobian(Z, k, vib, GL, GG, h, omega, dZ=dZ,
+                                 kernel=args.lineshape)
+
+    # Start the baseline and scale at their best values for the
+    # initial spectrum
+    if start is not None:
+        initial = array(start, dtype=float)
+    else:
+        I = spectrum_at(initial).intensity
+        scale, baseline = lstsq(column_stack([I, ones(len(I))]), data,
+                                rcond=None)[0]
+        if scale <= 0:
+            scale, baseline = 1 / abs(I).max(), 0.0
+        initial[-2:] = baseline, scale
+
+    # Choose the parameters to refine
+    unit = args.lifetime[1] if 'lifetime' in args else args.rate[1]
+    heights = [i for i, p in enumerate(params) if p.kind == 'height']
+    choice = choose_parameters(params, refine, fix, bounds, ties, unit,
+                               [(len(params) - 1, heights)])
+
+    def model_at(p):
+        '''The model and its derivatives for all the parameters p'''
+        return scaled_model(spectrum_at(p), *p[-2:])
+
+    values, solution, model, jacobian = refine_parameters(model_at, data,
+                                                          initial, choice,
+                                                          max_nfev)
+    rms = sqrt(( ( model - data )**2 ).mean())
+    return FitResult(names, values, initial[choice.tied], choice.free,
+                     choice.tied, solution.success, solution.message,
+                     solution.nfev, rms, omega, data, model, jacobian)
+
+
+def scaled_model(result, baseline, scale):
+    '''Return the model scale * I + baseline for a Jacobian from
+    spectrum_jacobian, and its derivatives with respect to the parameters
+    of the Jacobian, the baseline and the scale.'''
+    model = scale * result.intensity + baseline
+    jacobian = concatenate([scale * result.jacobian,
+                            ones((len(model), 1)),
+                            result.intensity[:,None]], axis=1)
+    return model, jacobian
+
+
+def choose_parameters(params, refine, fix, bounds, ties, unit, scales):
+    '''Return which of the parameters are refined, and their bounds, as a
+    Choice.  See fit_spectrum for refine, fix, bounds and ties, and unit
+    is that of the bounds of the rate.  scales is a list of the index of
+    each scale with the indices of the heights it multiplies.
+    '''
+    names = [p.name for p in params]
+    free = zeros(len(params), dtype=bool)
+    for name in refine:
+        free[select(params, name)] = True
+    for name in fix:
+        free[select(params, name)] = False
+    link = arange(len(params))
+    for name, other in (ties or {}).items():
+        target = select(params, other, single=True)
+        for i in select(params, name):
+            link[i] = target
+    # Follow each chain of ties to the parameter at its end
+    tied = arange(len(params))
+    for i in range(len(params)):
+        seen = set([i])
+        while link[tied[i]] != tied[i]:
+            tied[i] = link[tied[i]]
+            if tied[i] in seen:
+                raise FitError('The parameters tied to {0} form a '
+                               'loop'.format(names[i]))
+            seen.add(tied[i])
+    free[tied != arange(len(params))] = False
+
+    # The heights are relative, so they can't all be refined with their
+    # scale.  A height tied to a free height is also free.
+    for scale, heights in scales:
+        if free[scale] and all(free[tied[i]] for i in heights):
+            free[tied[heights[0]]] = False
+    index = free.nonzero()[0]
+    if not len(index):
+        raise FitError('There are no parameters to refine')
+
+    # The bounds.  Those of the rate are given in the unit of the input.
+    lower = array([BOUNDS[p.kind][0] for p in params], dtype=float)
+    upper = array([BOUNDS[p.kind][1] for p in params], dtype=float)
+    for name, (low, high) in (bounds or {}).items():
+        if low > high:
+            raise FitError('The lower bound of {0} is above its upper '
+                           'bound'.format(name))
+        for i in select(params, name):
+            if params[i].kind == 'rate':
+                lower[i], upper[i] = sorted(bound_to_k(x, unit)
+                                            for x in (low, high))
+            else:
+                lower[i], upper[i] = low, high
+
+    # The derivatives of all parameters with respect to those refined
+    expand = zeros((len(params), len(index)))
+    for j, i in enumerate(index):
+        expand[tied == i,j] = 1
+    return Choice(free, tied, index, lower, upper, expand)
+
+
+def refine_parameters(model_at, data, initial, choice, max_nfev=None):
+    '''Refine the parameters chosen by choose_parameters, starting from
+    initial, so that model_at matches data.  model_at returns the model
+    and its derivatives with respect to all the parameters.
+
+    Returns the values of all the parameters, the result from
+    least_squares, and the model and its derivatives with respect to
+    the refined parameters.  A SpectrumError is raised if the spectrum
+    cannot be calculated at initial, since there is nowhere to step
+    back to.
+    '''
+    initial = initial.copy()
+    index, tied = choice.index, choice.tied
+    lower, upper = choice.lower[index], choice.upper[index]
+    initial[index] = initial[index].clip(lower, upper)
+
+    cache = {}
+    def evaluate(x):
+        '''The model and its derivatives for the refined parameters x'''
+        key = x.tobytes()
+        if key not in cache:
+            p = initial.copy()
+            p[index] = x
+            cache.clear()
+            try:
+                model, jacobian = model_at(p[tied])
+            except SpectrumError:
+                # A step to parameters that are not physical is rejected
+                # by least_squares, which then takes a shorter step
+                cache[key] = full(len(data), nan), None
+                return cache[key]
+            cache[key] = model, jacobian.dot(choice.expand)
+        return cache[key]
+
+    if not isfinite(evaluate(initial[index])[0]).all():
+        raise SpectrumError('The spectrum cannot be calculated at the '
+                            'starting parameters')
+    solution = least_squares(lambda x: evaluate(x)[0] - data,
+                             initial[index],
+                             jac=lambda x: evaluate(x)[1],
+                             bounds=(lower, upper), method='trf',
+                             x_scale='jac', max_nfev=max_nfev)
+    values = initial.copy()
+    values[index] = solution.x
+    model, jacobian = evaluate(solution.x)
+    return values[tied], solution, model, jacobian
+
+
+def fit_parameters(args):
+    '''Return the parameters that can be fit as a list of Parameter.
+    They are the rate (in wavenumbers), the relative exchange rates
+    ("exchange 1 2"), the vib, l, g and height of each peak
+    ("peak 1 vib"), and the baseline and scale of the model.'''
+    params = [Parameter('rate', 'rate', 'rate', args.k)]
+    for (p1, p2), rate in zip(args.exchanges, args.exchange_rates):
+        name = 'exchange {0} {1}'.format(p1+1, p2+1)
+        params.append(Parameter(name, 'exchange', name, rate))
+    for kind, values in (('vib', args.vib), ('l', args.Gamma_Lorentz),
+                         ('g', args.Gamma_Gauss), ('height', args.heights)):
+        for num, value in zip(args.num, values):
+            label = 'peak {0}'.format(num)
+            params.append(Parameter('{0} {1}'.format(label, kind), kind,
+                                    label, value))
+    params.append(Parameter('baseline', 'baseline', 'baseline', 0.0))
+    params.append(Parameter('scale', 'scale', 'scale', 1.0))
+    return params
+
+
+def bound_to_k(value, unit):
+    '''Return a bound of the rate or lifetime in the given unit in
+    wavenumbers.  A bound of 0 or infinity is one of the ends.'''
+    if 0 < value < inf:
+        return rate_to_k(value, unit)
+    lifetime = unit.lower() in LIFETIME_UNITS
+    return 0.0 if ( value <= 0 ) != lifetime else inf
+
+
+def select(params, name, single=False):
+    '''Return the indices of the parameters matching a name, kind or
+    label.  The parameter of one spectrum of a global fit, i.e.
+    "peak 1 l [2]", is also matched by its name without the spectrum.
+    If single is True, the name must be of one parameter, and its index
+    is returned.'''
+    name = ' '.join(str(name).lower().split())
+    index = [i for i, p in enumerate(params)
+             if name in (p.name, p.kind, p.label, p.name.split(' [')[0])]
+    if not index:
+        raise FitError('Unknown parameter: {0}'.format(name))
+    elif single and len(index) > 1:
+        raise FitError('{0} is not a single parameter'.format(name))
+    return index[0] if single else index
+
+
+def set_parameters(args, result):
+    '''Store the fitted values of a FitResult in the parameters read by
+    read_input, so that i.e. input_record gives the fitted input file.'''
+    values = result.values
+    nexchange, npeaks = len(args.exchange_rates), len(args.vib)
+    args.k = values[0]
+    if 'lifetime' in args:
+        args.lifetime = k_to_rate(args.k, args.lifetime[1]), \
+                        args.lifetime[1]
+    else:
+        args.rate = k_to_rate(args.k, args.rate[1]), args.rate[1]
+    args.exchange_rates = values[1:1+nexchange].copy()
+    args.vib, args.Gamma_Lorentz, args.Gamma_Gauss, args.heights = \
+        values[1+nexchange:-2].reshape(4, npeaks).copy()
+
+
+class FitError(Exception):
+    '''An exception for setting up a fit'''
+    pass
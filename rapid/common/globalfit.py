@@ -0,0 +1,263 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+from collections import namedtuple
+from copy import deepcopy
+from multiprocessing import Pool, cpu_count
+
+# Non-std lib imports
+from numpy import arange, array, array_split, column_stack, concatenate, \
+                  cumsum, exp, log, ones, sqrt, zeros
+from numpy.linalg import lstsq
+
+# Local imports
+from rapid.common.spectrum import ZMat
+from rapid.common.jacobian import spectrum_jacobian_batch, ZMat_derivatives
+from rapid.common.fit import fit_parameters, choose_parameters, \
+                             refine_parameters, scaled_model, select, \
+                             set_parameters, Parameter, FitError
+from rapid.common.read_input import k_to_rate
+from rapid.common.utils import clip, normalize
+
+__all__ = ['global_fit', 'global_parameters', 'kinetic_rates',
+           'kinetic_prefactor', 'spectrum_args', 'GlobalFitResult',
+           'REFINE']
+
+# The gas constant in kJ/mol/K, and Boltzmann's constant over Planck's
+# constant in Hz/K
+GAS_CONSTANT = 8.314462618E-3
+KB_H = 2.083661912E10
+
+# The parameters refined by default
+REFINE = ('rate', 'activation', 'vib', 'l', 'g', 'height', 'baseline',
+          'scale')
+
+# The result of a global fit.  The fields are those of FitResult, except
+# that omega, data and model are lists with one array for each spectrum,
+# and the rows of jacobian are those of each spectrum in turn.
+# temperatures are those of the spectra and rates the fitted rate of each
+# in wavenumbers.
+GlobalFitResult = namedtuple('GlobalFitResult',
+                             'names values initial free tied success '
+                             'message nfev rms omega data model jacobian '
+                             'temperatures rates')
+
+
+def global_fit(args, refine=REFINE, fix=(), bounds=None, ties=None,
+               max_nfev=None, njobs=1):
+    '''Refine the parameters of a manifest read by read_manifest so that
+    the spectrum at each temperature matches its raw data, and return a
+    GlobalFitResult.
+
+    The rate at temperature T is k exp(-Ea/R (1/T - 1/T0)) (Arrhenius),
+    or that times T/T0 (Eyring, where Ea is the activation enthalpy),
+    where k is the rate at the reference temperature T0.  The rate and
+    the activation energy are fit to all the spectra together, as are
+    the peak parameters except those the manifest makes local to each
+    spectrum.  Each spectrum has its own baseline and scale.  refine,
+    fix, bounds and ties are as for fit_spectrum, using the names from
+    global_parameters.
+
+    The spectra and their derivatives are evaluated in chunks, each with
+    one batched eigensystem, on a pool of njobs processes (0 means one
+    per CPU).  A FitError is raised if the fit cannot be set up, and a
+    SpectrumError if a spectrum cannot be calculated.
+    '''
+    if args.k_values is not None or args.sweeps:
+        raise FitError('A sweep cannot be fit')
+    omegas, data = [], []
+    for name, raw in zip(args.spectra, args.raws):
+        raw = clip(raw, args.xlim)
+        if len(raw) < 2:
+            raise FitError('There is no raw data of {0} inside of '
+                           'xlim'.format(name))
+        omegas.append(raw[:,0])
+        data.append(normalize(raw[:,1]))
+    sizes = array([len(x) for x in data])
+    ends = cumsum(sizes)
+    starts = ends - sizes
+    target = concatenate(data)
+
+    params, index = global_parameters(args)
+    names = [p.name for p in params]
+    initial = array([p.value for p in params])
+    nspectra = len(omegas)
+    njobs = min(njobs if njobs > 0 else cpu_count(), nspectra)
+    chunks = array_split(arange(nspectra), njobs)
+    common = {'npeaks' : len(args.vib), 'exchanges' : args.exchanges,
+              'symmetric' : args.symmetric_exchange,
+              'kernel' : args.lineshape}
+
+    pool = Pool(njobs) if njobs > 1 else None
+    try:
+        def model_at(p):
+            '''The model of all the spectra and its derivatives for all
+            the parameters p'''
+            k, dk, dkdE = kinetic_rates(p[0], p[1], args.temperatures,
+                                        args.reference, args.kinetics)
+            values = p[index]
+            values[:,0] = k
+            jobs = [dict(common, values=values[c],
+                         omegas=[omegas[s] for s in c]) for c in chunks]
+            if pool is None:
+                results = [_evaluate_chunk(job) for job in jobs]
+            else:
+                results = pool.map(_evaluate_chunk, jobs)
+            results = [x for chunk in results for x in chunk]
+
+            # Map the derivatives of each spectrum to the parameters
+            model = concatenate([x[0] for x in results])
+            jacobian = zeros((len(model), len(p)))
+            for s, (_, J) in enumerate(results):
+                rows = slice(starts[s], ends[s])
+                jacobian[rows,index[s,1:]] = J[:,1:]
+                jacobian[rows,0] = J[:,0] * dk[s]
+                jacobian[rows,1] = J[:,0] * dkdE[s]
+            return model, jacobian
+
+        # Start the baseline and scale of each spectrum at their best
+        # values for its initial spectrum.  These start at 0 and 1, so
+        # the model is the spectrum itself.
+        I = model_at(initial)[0]
+        for s in range(nspectra):
+            Is = I[starts[s]:ends[s]]
+            scale, baseline = lstsq(column_stack([Is, ones(len(Is))]),
+                                    data[s], rcond=None)[0]
+            if scale <= 0:
+                scale, baseline = 1 / abs(Is).max(), 0.0
+            initial[index[s,-2:]] = baseline, scale
+
+        # Choose the parameters to refine.  The heights of each spectrum
+        # are relative to its scale.
+        unit = args.lifetime[1] if 'lifetime' in args else args.rate[1]
+        heights = [j for j, p in enumerate(fit_parameters(args))
+                   if p.kind == 'height']
+        scales = [(index[s,-1], list(index[s,heights]))
+                  for s in range(nspectra)]
+        choice = choose_parameters(params, refine, fix, bounds, ties, unit,
+                                   scales)
+
+        values, solution, model, jacobian = refine_parameters(model_at,
+                                                              target,
+                                                              initial, choice,
+                                                              max_nfev)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    rms = sqrt(( ( model - target )**2 ).mean())
+    rates = kinetic_rates(values[0], values[1], args.temperatures,
+                          args.reference, args.kinetics)[0]
+    return GlobalFitResult(names, values, initial[choice.tied], choice.free,
+                           choice.tied, solution.success, solution.message,
+                           solution.nfev, rms, omegas, data,
+                           [model[a:b] for a, b in zip(starts, ends)],
+                           jacobian, args.temperatures, rates)
+
+
+def global_parameters(args):
+    '''Return the parameters of a global fit as a list of Parameter, and
+    the (S x P) indices into them of the P parameters of each of the S
+    spectra as fit_parameters gives them.
+
+    The parameters are the rate at the reference temperature and the
+    activation energy ("activation", in kJ/mol), followed by those of
+    fit_parameters.  Those local to each spectrum are given once for
+    each, i.e. "peak 1 l [2]" for the second spectrum.  The baseline and
+    scale are always local.  The rate of each spectrum follows from the
+    kinetics, so its index is -1.
+    '''
+    base = fit_parameters(args)
+    local = zeros(len(base), dtype=bool)
+    for name in args.local:
+        local[select(base, name)] = True
+    if local[0]:
+        raise FitError('The rate of each spectrum follows from the '
+                       'kinetics, so it cannot be local')
+    local[-2:] = True
+
+    nspectra = len(args.spectra)
+    params = [base[0], Parameter('activation', 'activation', 'activation',
+                                 float(args.activation))]
+    index = zeros((nspectra, len(base)), dtype=int)
+    index[:,0] = -1
+    for j, p in enumerate(base[1:], 1):
+        if local[j]:
+            index[:,j] = arange(len(params), len(params) + nspectra)
+            params.extend(Parameter('{0} [{1}]'.format(p.name, s+1), p.kind,
+                                    p.label, p.value)
+                          for s in range(nspectra))
+        else:
+            index[:,j] = len(params)
+            params.append(p)
+    return params, index
+
+
+def kinetic_rates(k, activation, temperatures, reference, kinetics):
+    '''Return the rates at each temperature for the rate k at the
+    reference temperature and the activation energy (or enthalpy) in
+    kJ/mol, and their derivatives with respect to k and the activation
+    energy.  kinetics is "arrhenius" or "eyring".'''
+    x = 1 / temperatures - 1 / reference
+    factor = exp(-activation * x / GAS_CONSTANT)
+    if kinetics == 'eyring':
+        factor = factor * temperatures / reference
+    rates = k * factor
+    return rates, factor, -rates * x / GAS_CONSTANT
+
+
+def kinetic_prefactor(k, activation, reference, kinetics):
+    '''Return the Arrhenius prefactor in Hz, or the activation entropy
+    in J/mol/K for Eyring kinetics, for the rate k in wavenumbers at the
+    reference temperature and the activation energy in kJ/mol.'''
+    hz = k_to_rate(k, 'hz')
+    if kinetics == 'eyring':
+        return 1E3 * ( GAS_CONSTANT * log(hz / ( KB_H * reference ))
+                       + activation / reference )
+    return hz * exp(activation / ( GAS_CONSTANT * reference ))
+
+
+def spectrum_args(args, result, s):
+    '''Return a copy of the manifest read by read_manifest holding the
+    fitted parameters of spectrum s of a GlobalFitResult, so that i.e.
+    input_record gives its own input file.  If s is None, the parameters
+    local to each spectrum are averaged over them instead.'''
+    args = deepcopy(args)
+    index = global_parameters(args)[1]
+    if s is None:
+        values = result.values[index[0]]
+        local = ( index != index[0] ).any(0)
+        values[local] = result.values[index].mean(0)[local]
+        values[0] = result.values[0]
+    else:
+        values = result.values[index[s]]
+        values[0] = result.rates[s]
+        args.add('rawName', args.spectra[s])
+    set_parameters(args, result._replace(values=values))
+    args.activation = result.values[1]
+    return args
+
+
+def _evaluate_chunk(job):
+    '''Return the model and its derivatives with respect to the
+    parameters of fit_parameters for each spectrum of a chunk of a global
+    fit.  job gives the values of those parameters of each spectrum, its
+    x-values, and what is shared by all.'''
+    values, npeaks = job['values'], job['npeaks']
+    exchanges, symmetric = job['exchanges'], job['symmetric']
+    nexchange = len(exchanges)
+    k, rates = values[:,0], values[:,1:1+nexchange]
+    vib, GL, GG, h = values[:,1+nexchange:-2].reshape(-1, 4, npeaks) \
+                                             .transpose(1, 0, 2)
+    Z = array([ZMat(npeaks, exchanges, r, symmetric) for r in rates])
+    # The relative exchange rates are usually shared
+    if ( rates == rates[0] ).all():
+        dZ = ZMat_derivatives(npeaks, exchanges, rates[0], symmetric)
+    else:
+        dZ = [ZMat_derivatives(npeaks, exchanges, r, symmetric)
+              for r in rates]
+    results = spectrum_jacobian_batch(Z, k, vib, GL, GG, h, job['omegas'],
+                                      dZ=dZ, kernel=job['kernel'])
+    return [scaled_model(result, *x[-2:])
+            for result, x in zip(results, values)]
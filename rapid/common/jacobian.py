@@ -0,0 +1,277 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+from collections import namedtuple
+
+# Non-std lib imports
+from scipy.sparse import issparse
+from numpy import add, arange, argsort, asarray, bincount, broadcast_to, \
+                  concatenate, diag, diag_indices_from, eye, repeat, unique, \
+                  zeros
+
+# Local imports
+from rapid.common.spectrum import eigensystem, faddeeva, SpectrumError, \
+                                  BLOCKSIZE, INVSQRT2LOG2_2, INVSQRTPI, \
+                                  SQRT2, SQRT2LOG2_2, SQRT2PI
+
+__all__ = ['spectrum_jacobian', 'spectrum_jacobian_batch', 'ZMat_derivatives',
+           'Jacobian']
+
+# The intensities and new parameters as from spectrum, along with their
+# derivatives.  jacobian is the (M x P) derivatives of the intensities
+# with respect to each of the P parameters named in names, and
+# new_params_jacobian is the (N x P) derivatives of each of the four
+# new parameters.
+Jacobian = namedtuple('Jacobian',
+                      'intensity new_params jacobian new_params_jacobian '
+                      'names')
+
+# Eigenvalues closer than this (relative to the largest) are degenerate
+DEGENERATE = 1E-8
+
+
+def spectrum_jacobian(Z, k, vib, Gamma_Lorentz, Gamma_Gauss, heights, omega,
+                      dZ=(), blocksize=BLOCKSIZE, kernel='exact'):
+    '''Return the intensities and new parameters as spectrum does, along
+    with their derivatives with respect to k, the exchange rates, and
+    each peak's vib, Gamma_Lorentz, Gamma_Gauss and heights, as a
+    Jacobian.
+
+    dZ is a sequence of the derivatives of Z with respect to each exchange
+    rate (i.e. from ZMat_derivatives); if it is empty, no derivatives with
+    respect to the exchange rates are found.  The parameters are ordered
+    k, the exchange rates, then all the vib, Gamma_Lorentz, Gamma_Gauss
+    and heights.
+
+    The derivatives of the eigenvalues and eigenvectors of A are found by
+    first order perturbation of its eigensystem, and those of the
+    Faddeeva function from w'(z) = -2zw(z) + 2i/sqrt(pi), so that the
+    whole Jacobian costs about as much as one spectrum.  The derivatives
+    are not defined if a parameter couples peaks whose eigenvalues are
+    degenerate, in which case a SpectrumError is raised.
+    '''
+    vib = asarray(vib, dtype=float)
+    Gamma_Lorentz = asarray(Gamma_Lorentz, dtype=float)
+    Gamma_Gauss = asarray(Gamma_Gauss, dtype=float)
+    heights = asarray(heights, dtype=float)
+    omega = asarray(omega, dtype=float)
+    npeaks = len(vib)
+    if issparse(Z):
+        Z = Z.toarray()
+    dZ = [x.toarray() if issparse(x) else asarray(x) for x in dZ]
+
+    # Construct A as spectrum does, and find its eigensystem
+    ZI = Z - eye(npeaks)
+    A = diag(-1j * vib + 0.5 * Gamma_Lorentz) - k * ZI
+    return eigensystem_jacobian(eigensystem(A), ZI, k, dZ, Gamma_Gauss,
+                                heights, omega, blocksize, kernel)
+
+
+def spectrum_jacobian_batch(Z, k, vib, Gamma_Lorentz, Gamma_Gauss, heights,
+                            omegas, dZ=(), blocksize=BLOCKSIZE,
+                            kernel='exact'):
+    '''Return a Jacobian as from spectrum_jacobian for each of a stack of
+    parameter sets.
+
+    The arguments may carry a leading batch axis as for spectrum_batch:
+    Z is (B x N x N), k is (B), and vib, Gamma_Lorentz, Gamma_Gauss and
+    heights are (B x N).  Arguments without it are shared.  dZ is shared
+    by every member, or is B sequences of derivatives to give each its
+    own, and omegas is the B domains, which may each be different.  The
+    eigensystems are all found with one batched call.
+    '''
+    k = asarray(k, dtype=float)
+    omegas = [asarray(omega, dtype=float) for omega in omegas]
+    nbatch = len(omegas)
+    Z = broadcast_to(asarray(Z, dtype=float),
+                     (nbatch,) + asarray(Z).shape[-2:])
+    npeaks = Z.shape[-1]
+    k = broadcast_to(k, (nbatch,))
+    vib, Gamma_Lorentz, Gamma_Gauss, heights = [
+        broadcast_to(asarray(x, dtype=float), (nbatch, npeaks))
+        for x in (vib, Gamma_Lorentz, Gamma_Gauss, heights)]
+    if len(dZ) and asarray(dZ[0]).ndim == 3:
+        dZ = [list(member) for member in dZ]
+    else:
+        dZ = [[x.toarray() if issparse(x) else asarray(x)
+               for x in dZ]] * nbatch
+
+    # Construct the stack of A matrices and decompose them together
+    ZI = Z - eye(npeaks)
+    A = ( -1j * vib + 0.5 * Gamma_Lorentz )[...,None] * eye(npeaks) \
+        - k[:,None,None] * ZI
+    Lambda, S, SinvT = eigensystem(A)
+    return [eigensystem_jacobian((Lambda[b], S[b], SinvT[b]), ZI[b], k[b],
+                                 dZ[b], Gamma_Gauss[b], heights[b], omegas[b],
+                                 blocksize, kernel)
+            for b in range(nbatch)]
+
+
+def eigensystem_jacobian(esys, ZI, k, dZ, Gamma_Gauss, heights, omega,
+                         blocksize=BLOCKSIZE, kernel='exact'):
+    '''Return the Jacobian as spectrum_jacobian does from the eigensystem
+    (Lambda, S, SinvT) of A, and Z - I.'''
+    Lambda, S, SinvT = esys
+    Sinv = SinvT.T
+    npeaks = len(Lambda)
+
+    # The parameters of the new peaks, as in new_parameters.  M is the
+    # whole of S^{-1} G S, whose diagonal is Gprime.
+    sigma = Gamma_Gauss * INVSQRT2LOG2_2
+    M = ( Sinv * sigma**(-2) ).dot(S)
+    Gprime = M.diagonal().real
+    if ( Gprime <= 0 ).any():
+        raise SpectrumError('The input parameters for this system are '
+                            'not physical.\nTry increasing the Gaussian '
+                            'line widths')
+    u = heights.dot(S)
+    v = Sinv.sum(1)
+    h = u * v
+
+    # 1 / (Lambda_j - Lambda_i), with zeros on the diagonal and
+    # wherever the eigenvalues are degenerate
+    gap = Lambda[None,:] - Lambda[:,None]
+    gap[diag_indices_from(gap)] = 1.0
+    small = abs(gap) <= DEGENERATE * max(abs(Lambda).max(), 1.0)
+    small[diag_indices_from(small)] = True
+    gap[small] = 1.0
+    invgap = 1 / gap
+    invgap[small] = 0.0
+    small[diag_indices_from(small)] = False
+
+    def perturb(B):
+        '''The derivatives of the eigenvalues, Gprime and the heights
+        from B = S^{-1} dA S.  The eigenvectors change by S C.'''
+        if small.any() and ( abs(B[small]) >
+                             DEGENERATE * max(abs(B).max(), 1.0) ).any():
+            raise SpectrumError('The derivatives of the spectrum are not '
+                                'defined where exchanging peaks have '
+                                'degenerate eigenvalues')
+        C = B * invgap
+        dGprime = ( ( M * C.T ).sum(1) - ( C * M.T ).sum(1) ).real
+        dh = C.T.dot(u) * v - u * C.dot(v)
+        return B.diagonal(), dGprime, dh
+
+    # The derivatives with respect to the parameters in A
+    names = ['k'] + ['exchange {0}'.format(i+1) for i in range(len(dZ))]
+    changes = [perturb(-Sinv.dot(ZI).dot(S))]
+    for x in dZ:
+        # Each rate usually only changes a few elements of Z
+        rows, cols = x.nonzero()
+        if len(rows) <= npeaks:
+            B = ( Sinv[:,rows] * x[rows,cols] ).dot(S[cols,:])
+        else:
+            B = Sinv.dot(x).dot(S)
+        changes.append(perturb(-k * B))
+    for a in range(npeaks):
+        changes.append(perturb(-1j * Sinv[:,a,None] * S[None,a,:]))
+    for a in range(npeaks):
+        changes.append(perturb(0.5 * Sinv[:,a,None] * S[None,a,:]))
+    dLambda, dGprime, dh = [asarray(x).reshape(-1, npeaks)
+                            for x in zip(*changes)]
+    names += ['{0} {1}'.format(name, a+1) for name in ('vib',
+                                                       'Gamma_Lorentz')
+              for a in range(npeaks)]
+
+    # Gamma_Gauss only changes Gprime, and heights only the heights
+    dG = -2 * sigma**(-3) * INVSQRT2LOG2_2
+    dGprime_GG = ( Sinv.T * S ).real * dG[:,None]
+    dh_heights = S * v
+    zero = zeros((npeaks, npeaks))
+    dLambda = concatenate([dLambda, zero, zero])
+    dGprime = concatenate([dGprime, dGprime_GG, zero])
+    dh = concatenate([dh, zero, dh_heights])
+    names += ['{0} {1}'.format(name, a+1) for name in ('Gamma_Gauss',
+                                                       'heights')
+              for a in range(npeaks)]
+
+    # The new parameters in the order spectrum gives them
+    order = argsort(abs(Lambda.imag), kind='mergesort')
+    Lambda, Gprime, h = Lambda[order], Gprime[order], h[order]
+    dLambda, dGprime, dh = dLambda[:,order], dGprime[:,order], dh[:,order]
+    sigmas = Gprime**(-0.5)
+    dsigmas = -0.5 * sigmas**3 * dGprime
+    new_params = -Lambda.imag, 2 * Lambda.real, SQRT2LOG2_2 * sigmas, h.real
+    new_params_jacobian = (-dLambda.imag.T, 2 * dLambda.real.T,
+                           SQRT2LOG2_2 * dsigmas.T, dh.real.T)
+
+    # The line shapes are Re[c w(z)] with z = (omega - center) / scale.
+    # With alpha and beta below, dz = alpha - z beta, so each derivative
+    # is a weighted sum over the peaks of w(z), w'(z) and z w'(z).
+    center = -Lambda.imag - 1j * Lambda.real
+    scale = SQRT2 * sigmas
+    coeff = h.conjugate() / ( SQRT2PI * sigmas )
+    dcenter = -dLambda.imag - 1j * dLambda.real
+    dcoeff = dh.conjugate() / ( SQRT2PI * sigmas ) - coeff * dsigmas / sigmas
+    alpha = coeff * -dcenter / scale
+    beta = coeff * dsigmas / sigmas
+
+    # Only the real part is needed, so the three complex products are done
+    # as one real product, as Re(ab) = Re(a)Re(b) - Im(a)Im(b)
+    weights = concatenate([dcoeff, alpha, -beta], axis=1).T
+    weights = concatenate([weights.real, -weights.imag])
+
+    wofz = faddeeva(kernel)
+    npoints = len(omega)
+    intensity = zeros(npoints)
+    jacobian = zeros((npoints, len(names)))
+    fstep = min(max(int(blocksize) // max(npeaks, 1), 1), max(npoints, 1))
+    for i in range(0, npoints, fstep):
+        z = ( omega[i:i+fstep,None] - center ) / scale
+        w = wofz(z)
+        dw = -2 * z * w + 2j * INVSQRTPI
+        intensity[i:i+fstep] = w.dot(coeff).real
+        basis = concatenate([w, dw, z * dw], axis=1)
+        jacobian[i:i+fstep] = concatenate([basis.real, basis.imag],
+                                          axis=1).dot(weights)
+
+    return Jacobian(intensity, new_params, jacobian, new_params_jacobian,
+                    names)
+
+
+def ZMat_derivatives(npeaks, peak_exchanges, relative_rates, symmetric):
+    '''Return the derivatives of the Z matrix from ZMat with respect to
+    each of the M relative_rates, as an (M x N x N) array.
+
+    An exchange that is given again later has no effect on Z, so its
+    derivative is zero.  If Z is normalized, the derivative is that of
+    the normalized matrix.
+    '''
+    index = asarray(peak_exchanges, dtype=int).reshape(-1, 2)
+    rates = asarray(relative_rates, dtype=float).ravel()
+    source = arange(len(rates))
+
+    # Place the rates as ZMat does, remembering which rate is where
+    if symmetric:
+        rows = index.ravel()
+        cols = index[:,::-1].ravel()
+        rates = repeat(rates, 2)
+        source = repeat(source, 2)
+    else:
+        rows, cols = index[:,0], index[:,1]
+    flat = rows * npeaks + cols
+    last = len(flat) - 1 - unique(flat[::-1], return_index=True)[1]
+    rows, cols, rates, source = rows[last], cols[last], rates[last], \
+                                source[last]
+
+    dZ = zeros((len(index), npeaks, npeaks))
+    diagonal = rows == cols
+    dZ[source[~diagonal],rows[~diagonal],cols[~diagonal]] = 1.0
+    if not symmetric:
+        return dZ
+
+    # Each diagonal is 1 minus the sum of its row
+    sums = bincount(rows, weights=rates, minlength=npeaks)
+    dsums = zeros((len(index), npeaks))
+    add.at(dsums, (source, rows), 1.0)
+    dZ[:,arange(npeaks),arange(npeaks)] -= dsums
+
+    # Z is divided by the largest sum if it is larger than 1
+    if ( sums > 1 ).any():
+        largest = sums.argmax()
+        Z = zeros((npeaks, npeaks))
+        Z[rows[~diagonal],cols[~diagonal]] = rates[~diagonal]
+        Z[arange(npeaks),arange(npeaks)] = 1 - sums
+        dZ = ( dZ - Z * dsums[:,largest,None,None] / sums[largest] ) \
+             / sums[largest]
+    return dZ
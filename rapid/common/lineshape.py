@@ -0,0 +1,252 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+from math import sqrt, pi
+
+# Non-std lib imports
+from scipy.special import wofz
+from numpy import asarray, arange, clip, concatenate, empty, errstate, exp, \
+                  fft, flatnonzero, rint, tan
+
+# A few constants
+INVSQRTPI = 1 / sqrt(pi)
+
+__all__ = ['KERNELS', 'lineshape_kernel', 'exact', 'humlicek', 'weideman',
+           'table']
+
+
+#############################################################################
+# Each kernel returns the Faddeeva function w(z) (or an approximation to it)
+# for Im(z) >= 0.  The Voigt profile is the real part of w(z), and the
+# imaginary part is needed to give the complex heights after exchange their
+# dispersive component.  The approximations are only valid in the upper
+# half plane, which is where z is as long as the Lorentzian widths after
+# exchange are positive.  The errors quoted are the maximum absolute error
+# in w(z) over the upper half plane; w(0) = 1 is the largest value.
+#############################################################################
+
+
+def exact(z):
+    '''The Faddeeva function from scipy, accurate to machine precision.'''
+    return wofz(z)
+
+
+def humlicek(z):
+    '''Humlicek's (1982) W4 rational approximation of the Faddeeva function.
+    His first region, one term of the continued fraction, starts at
+    |Re(z)| + Im(z) = 8 rather than 15.  The maximum absolute error is
+    about 5E-5.'''
+    return _split(z, 8, _humlicek_near, _far)
+
+
+def _humlicek_near(z):
+    '''Humlicek's W4 for |Re(z)| + Im(z) < 8, his regions 2 to 4'''
+    x, y = z.real, z.imag
+    w = empty(z.shape, dtype=complex)
+
+    # Region 2: two terms of the continued fraction
+    r2 = abs(x) + y >= 5.5
+    w[r2] = _far2(z[r2])
+
+    # Region 3: close to the origin but away from the real axis
+    r3 = ~r2 & ( y >= 0.195 * abs(x) - 0.176 )
+    t = z[r3] * -1j
+    w[r3] = _horner(_W4_REGION3[0], t) / _horner(_W4_REGION3[1], t)
+
+    # Region 4: close to the real axis
+    r4 = ~( r2 | r3 )
+    t = z[r4] * -1j
+    u = t * t
+    q = _horner(_W4_REGION4[0], u)
+    q *= t
+    q /= _horner(_W4_REGION4[1], u)
+    w[r4] = exp(u, out=u) - q
+    return w
+
+
+# The polynomials of regions 3 and 4 of Humlicek's W4, as the
+# coefficients of the numerator and denominator from the highest power
+_W4_REGION3 = ((0.5642236, 3.778987, 11.96482, 20.20933, 16.4955),
+               (1.0, 6.699398, 21.69274, 39.27121, 38.82363, 16.4955))
+_W4_REGION4 = ((0.56419, -1.320522, 35.76683, -219.0313, 1540.787,
+                -3321.9905, 36183.31),
+               (-1.0, 1.841439, -61.57037, 364.2191, -2186.181, 9022.228,
+                -24322.84, 32066.6))
+
+
+def _horner(coefficients, x):
+    '''Evaluate the polynomial with the given coefficients (from the
+    highest power) at x, in place to avoid temporary arrays'''
+    p = x * coefficients[0]
+    p += coefficients[1]
+    for c in coefficients[2:]:
+        p *= x
+        p += c
+    return p
+
+
+def _weideman_coefficients(N):
+    '''The polynomial coefficients of Weideman's (1994) approximation.'''
+    M = 2 * N
+    L = sqrt(N / sqrt(2))
+    theta = arange(-M + 1, M) * pi / M
+    t = L * tan(theta / 2)
+    f = concatenate([[0.0], exp(-t**2) * ( L**2 + t**2 )])
+    a = fft.fft(fft.fftshift(f)).real / ( 2 * M )
+    return L, a[1:N+1][::-1]
+
+
+WEIDEMAN_N = 16
+_WEIDEMAN = _weideman_coefficients(WEIDEMAN_N)
+
+
+def weideman(z):
+    '''Weideman's (1994) rational approximation of the Faddeeva function
+    using 16 terms, with the continued fraction far from the origin.  The
+    maximum absolute error is about 2E-7.'''
+    return _split(z, 8, _weideman_near, _far2)
+
+
+def _weideman_near(z):
+    '''Weideman's approximation for |Re(z)| + Im(z) < 8'''
+    L, a = _WEIDEMAN
+    iz = z * 1j
+    denom = L - iz
+    x = iz + L
+    x /= denom
+    p = _horner(a, x)
+    p *= 2
+    p /= denom
+    p += INVSQRTPI
+    p /= denom
+    return p
+
+
+# The tabulated Faddeeva function covers 0 <= x <= TABLE_MAX
+# and 0 <= y <= TABLE_MAX with spacing TABLE_STEP
+TABLE_MAX = 8.0
+TABLE_STEP = 0.05
+_TABLE = []
+
+
+def _faddeeva_table():
+    '''Return the table of w(z) as a flat array with its row length,
+    creating it on first use.'''
+    if not _TABLE:
+        x = arange(0, TABLE_MAX + 2 * TABLE_STEP, TABLE_STEP)
+        _TABLE.append((wofz(x[None,:] + 1j * x[:,None]).ravel(), len(x)))
+    return _TABLE[0]
+
+
+def table(z):
+    '''The Faddeeva function from a table of exact values, with the
+    continued fraction far from the origin.  The maximum absolute error
+    is about 5E-5.'''
+    return _split(z, TABLE_MAX, _table_near, _far)
+
+
+def _table_near(z):
+    '''Interpolate w(z) in the table for |Re(z)| + Im(z) < TABLE_MAX'''
+    tab, nx = _faddeeva_table()
+    # w(-x + iy) is the conjugate of w(x + iy), so only x >= 0 is stored
+    x, y = abs(z.real), clip(z.imag, 0, None)
+    i = rint(x * ( 1 / TABLE_STEP )).astype(int)
+    j = rint(y * ( 1 / TABLE_STEP )).astype(int)
+    w0 = tab.take(i + nx * j)
+
+    # w is analytic, and its derivatives follow from w' = 2i/sqrt(pi) - 2zw,
+    # so it is found from a Taylor series about the nearest point z0
+    z0 = empty(z.shape, dtype=complex)
+    z0.real, z0.imag = i, j
+    z0 *= TABLE_STEP
+    d = x + 1j * y
+    d -= z0
+    w1 = z0 * w0
+    w1 *= -2
+    w1 += 2j * INVSQRTPI
+    # Half of w''
+    w = z0 * w1
+    w += w0
+    w *= -d
+    w += w1
+    w *= d
+    w += w0
+    neg = z.real < 0
+    w[neg] = w[neg].conjugate()
+    return w
+
+
+#############################################################################
+# Far from the origin w(z) is given to good accuracy by the first terms of
+# its continued fraction, which are much cheaper than any of the kernels.
+# Over a wide plot most points are far from every peak, so the approximate
+# kernels evaluate the continued fraction over the whole array and only
+# their own approximation at the points near the origin.  For
+# |Re(z)| + Im(z) >= 8, the largest error of one term is about 5E-5 and
+# that of two terms is about 1.4E-7.
+#############################################################################
+
+
+def _far(z):
+    '''One term of the continued fraction of w(z)'''
+    t = z * -1j
+    u = t * t
+    u += 0.5
+    t *= INVSQRTPI
+    with errstate(divide='ignore', invalid='ignore'):
+        t /= u
+    return t
+
+
+def _far2(z):
+    '''Two terms of the continued fraction of w(z)'''
+    t = z * -1j
+    u = t * t
+    w = u * INVSQRTPI
+    w += 2.5 * INVSQRTPI
+    w *= t
+    u += 3
+    u *= t * t
+    u += 0.75
+    with errstate(divide='ignore', invalid='ignore'):
+        w /= u
+    return w
+
+
+def _split(z, limit, near, far):
+    '''Return far(z), with near(z) instead where |Re(z)| + Im(z) < limit.
+    Each is only given its own points, as a flat array, except that far
+    is given all of them when most are far.'''
+    z = asarray(z, dtype=complex)
+    flat = z.reshape(-1)
+    s = abs(flat.real)
+    s += flat.imag
+    close = s < limit
+    i = flatnonzero(close)
+    if len(i) == len(flat):
+        return near(flat).reshape(z.shape)
+    elif 2 * len(i) < len(flat):
+        w = far(z)
+    else:
+        w = empty(z.shape, dtype=complex)
+        j = flatnonzero(~close)
+        w.reshape(-1)[j] = far(flat[j])
+    if len(i):
+        w.reshape(-1)[i] = near(flat[i])
+    return w
+
+
+# The kernels by the name they are given in the input file
+KERNELS = {'exact'    : exact,
+           'humlicek' : humlicek,
+           'weideman' : weideman,
+           'table'    : table,
+          }
+
+
+def lineshape_kernel(kernel):
+    '''Return the Faddeeva kernel for the given name.  A callable is
+    returned unchanged so that custom kernels can be plugged in.'''
+    if callable(kernel):
+        return kernel
+    return KERNELS[str(kernel).lower()]
@@ -0,0 +1,179 @@
+from __future__ import print_function, division, absolute_import
+
+# Non-std lib imports
+from scipy.sparse import diags, identity, issparse
+from numpy import array, array_equal, asarray, diag, eye, ndarray, zeros
+
+# Local imports
+from rapid.common.spectrum import exchange_eigensystem, block_parameters, \
+                                  voigt_sum, BLOCKSIZE, SQRT2LOG2_2
+
+__all__ = ['SpectrumModel']
+
+
+class SpectrumModel(object):
+    '''Hold the inputs of a spectrum and cache each stage of its
+    calculation.
+
+    The calculation is done in three stages, each of which is only
+    redone when something it depends on has changed:
+
+    1. The eigensystem of A, which depends on Z, k, vib and
+       Gamma_Lorentz.
+    2. The new parameters, which also depend on Gamma_Gauss and heights.
+    3. The intensities, which also depend on omega and the options
+       blocksize, kernel and tol.
+
+    Set the inputs with update (or the constructor), then call
+    calculate.  parameters gives just the new parameters, and
+    intensity_at the intensities on some other domain.  Inputs that are
+    given again with the same value don't invalidate anything, so it is
+    fine to pass every input each time.
+
+    The intensities are written into the same array each time while the
+    size of omega stays the same, so copy them if they must be kept
+    after the next calculation.
+    '''
+
+    # The inputs of each stage, and the stages that depend on them
+    STAGES = (('eigen', ('Z', 'k', 'vib', 'Gamma_Lorentz')),
+              ('params', ('Gamma_Gauss', 'heights')),
+              ('intensity', ('omega', 'blocksize', 'kernel', 'tol')),
+             )
+
+    def __init__(self, Z=None, k=None, vib=None, Gamma_Lorentz=None,
+                 Gamma_Gauss=None, heights=None, omega=None,
+                 blocksize=BLOCKSIZE, kernel='exact', tol=None):
+        '''Initialize the model with any of the inputs of spectrum'''
+        self.inputs = dict.fromkeys(name for stage, names in self.STAGES
+                                    for name in names)
+        self.blocks = None
+        self.new_params = None
+        self.intensity = None
+        self._params = None
+        self._out = None
+        self.update(Z=Z, k=k, vib=vib, Gamma_Lorentz=Gamma_Lorentz,
+                    Gamma_Gauss=Gamma_Gauss, heights=heights, omega=omega,
+                    blocksize=blocksize, kernel=kernel, tol=tol)
+
+    def __getattr__(self, name):
+        '''Give access to the inputs as attributes'''
+        inputs = self.__dict__.get('inputs', {})
+        if name in inputs:
+            return inputs[name]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        '''Setting an input is the same as passing it to update'''
+        if name in self.__dict__.get('inputs', ()):
+            self.update(**{name: value})
+        else:
+            super(SpectrumModel, self).__setattr__(name, value)
+
+    def update(self, **kwargs):
+        '''Change any of the inputs, and invalidate the stages
+        that depend on those that have changed.'''
+        first = None
+        for i, (stage, names) in enumerate(self.STAGES):
+            for name in names:
+                if name not in kwargs:
+                    continue
+                value = _copy(kwargs.pop(name))
+                if not _same(self.inputs[name], value):
+                    self.inputs[name] = value
+                    first = i if first is None else min(first, i)
+        if kwargs:
+            raise TypeError('Unknown inputs: ' + ', '.join(sorted(kwargs)))
+
+        # Invalidate this stage and all that come after it
+        if first is not None:
+            if first <= 0:
+                self.blocks = None
+            if first <= 1:
+                self._params = self.new_params = None
+            self.intensity = None
+
+    def calculate(self):
+        '''Return the intensities and the new parameters, the same as
+        spectrum, redoing only the stages that are out of date.'''
+        new_params = self.parameters()
+
+        if self.intensity is None:
+            # Reuse the output array if the domain is the same size
+            out = self._out
+            if out is None or out.shape != self.omega.shape:
+                out = self._out = zeros(self.omega.shape)
+            self.intensity = self._voigt(self.omega, out)
+
+        return self.intensity, new_params
+
+    def parameters(self):
+        '''Return the new parameters, redoing only the stages that are
+        out of date.  omega is not needed for these.'''
+        missing = [name for name, value in self.inputs.items()
+                   if value is None and name not in ('tol', 'omega')]
+        if missing:
+            raise ValueError('Missing inputs: ' + ', '.join(sorted(missing)))
+
+        if self.blocks is None:
+            self.blocks = exchange_eigensystem(self._A())
+
+        if self._params is None:
+            self._params = block_parameters(self.blocks, self.Gamma_Gauss,
+                                            self.heights)
+            peaks, HWHM, sigmas, h = self._params
+            self.new_params = peaks, 2 * HWHM, SQRT2LOG2_2 * sigmas, h.real
+
+        return self.new_params
+
+    def intensity_at(self, omega):
+        '''Return the intensities on another domain, using the same
+        eigensystem and parameters as calculate.  The cached intensities
+        are left alone, so this is for i.e. a quick preview on a coarser
+        domain.'''
+        self.parameters()
+        omega = asarray(omega, dtype=float)
+        return self._voigt(omega, zeros(omega.shape))
+
+    def _voigt(self, omega, out):
+        '''Sum the peaks on omega into out'''
+        peaks, HWHM, sigmas, h = self._params
+        return voigt_sum(omega, h, peaks, HWHM, sigmas,
+                         blocksize=self.blocksize, out=out,
+                         kernel=self.kernel, tol=self.tol)
+
+    def _A(self):
+        '''Construct the A matrix from Z, k, vib and Gamma_Lorentz'''
+        Z, k, npeaks = self.Z, self.k, len(self.vib)
+        diagonal = -1j * self.vib + 0.5 * self.Gamma_Lorentz
+        if issparse(Z):
+            return diags([diagonal], [0]) - k * ( Z - identity(npeaks,
+                                                                format='csr') )
+        else:
+            return diag(diagonal) - k * ( Z - eye(npeaks) )
+
+
+def _copy(value):
+    '''Return an array copy of an input, so that later changes
+    to the caller's array don't go unnoticed'''
+    if issparse(value):
+        return value.copy()
+    elif isinstance(value, (list, tuple, ndarray)):
+        return array(value, dtype=float)
+    else:
+        return value
+
+
+def _same(old, new):
+    '''Return True if an input has not changed'''
+    if old is None or new is None:
+        return old is new
+    elif issparse(old) or issparse(new):
+        if not ( issparse(old) and issparse(new) ) or old.shape != new.shape:
+            return False
+        return ( old != new ).nnz == 0
+    elif isinstance(old, ndarray) or isinstance(new, ndarray):
+        old, new = asarray(old), asarray(new)
+        return old.shape == new.shape and array_equal(old, new)
+    else:
+        return old == new
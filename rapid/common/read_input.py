@@ -2,21 +2,42 @@ from __future__ import print_function, division, absolute_import
 
 # Std. lib imports
 from sys import stdout
-from math import pi
+from math import pi, log10
+from collections import OrderedDict
+from os.path import expanduser, expandvars, join
 
 # Non-std. lib imports
-from numpy import array, loadtxt
+from numpy import array, linspace, loadtxt, logspace
 from input_reader import InputReader, SUPPRESS, ReaderError, \
                          range_check, abs_file_path
 
 HZ2WAVENUM = 1 / ( 100 * 2.99792458E8 ) # Hz to cm^{-1} conversion
 
-__all__ = ['read_input', 'ReaderError']
+# Each unit of the rate in Hz, and of the lifetime in s
+RATE_UNITS = { 'thz' : 1E12, 'ghz' : 1E9, 'phz' : 1E15, 'hz' : 1 }
+LIFETIME_UNITS = { 'ps' : 1E-12, 'ns' : 1E-9, 'fs' : 1E-15, 's' : 1 }
 
+# The keys that are given on several lines
+REPEATED = ('peak', 'exchange', 'spectrum', 'local', 'prior')
 
-def read_input(input_file):
+# The distributions a prior may have.  The values are the ends of the
+# uniform distributions, and the mean and standard deviation of the
+# normal distribution.
+PRIORS = ('uniform', 'loguniform', 'normal')
+
+__all__ = ['read_input', 'read_manifest', 'read_record', 'record_lines',
+           'input_record', 'manifest_record', 'sweep_range', 'sweep_values',
+           'rate_to_k', 'k_to_rate',
+           'ReaderError']
+
+
+def read_input(input_file, manifest=False, cwd=None):
     '''Defines what to expect from the input file and then
-    reads it in.'''
+    reads it in.  The input file may also be given as a
+    list of its lines.  If manifest is True, the file is
+    a manifest for a global fit (see read_manifest).
+    Relative paths in the file are taken from cwd if it
+    is given, instead of the working directory.'''
 
     # Creates an input reader instance
     reader = InputReader(default=SUPPRESS)
@@ -24,62 +45,105 @@ def read_input(input_file):
     # Rate parameter, either rate or lifetime, not both
     rate = reader.add_mutually_exclusive_group(required=True)
     # The units are s, ns, ps, or fs.  The default is ps.
-    rate.add_line_key('lifetime', type=float,
-                      glob={'len' : '?',
-                            'type' : ('ps', 'fs', 'ns', 's'),
-                            'default' : 'ps'})
-    rate.add_line_key('rate', type=float,
-                      glob={'len' : '?',
-                            'type' : ('thz', 'phz', 'ghz', 'hz'),
-                            'default' : 'thz'})
+    # Either may instead be swept over a range, as in
+    # "rate 0.1 10 log 200 THz" (see sweep_range).
+    rate.add_line_key('lifetime', type=(float, str), glob={'len' : '*'})
+    rate.add_line_key('rate', type=(float, str), glob={'len' : '*'})
+
+    # The rates, heights, widths and relative exchange rates may each be
+    # given several values (see sweep_values), and a spectrum is
+    # calculated for every combination of them (product), or for the
+    # first values of each, then the second values, etc. (zip)
+    reader.add_line_key('sweep', type=('product', 'zip'), default='product',
+                        dest='combine')
 
     # The range of the X-axis
     reader.add_line_key('xlim', type=[int, int], default=(1900, 2000))
     reader.add_boolean_key('reverse', action=True, default=False)
 
+    # How to evaluate the Voigt line shapes.  The approximate
+    # kernels are faster but less accurate than the exact one.
+    reader.add_line_key('lineshape', type=('exact', 'humlicek', 'weideman',
+                                           'table'),
+                        default='exact')
+    # Only evaluate each peak where it is larger than this fraction
+    # of the largest peak (each peak's error, not the sum's).  The
+    # default is everywhere.
+    reader.add_line_key('tolerance', type=float, default=None)
+    # Find all eigenvalues, or only those in a window about the plot
+    reader.add_line_key('eigensolver', type=('dense', 'window'),
+                        default='dense')
+
     # Read in the raw data.  
     reader.add_line_key('raw', type=[], glob={'len':'*', 'join':True, },
                                default=None, case=True)
 
     # Read in the peak data.  The wavenumber and height is required.
     # The Lorentzian and Gaussian widths are defaulted to 10 if not given.
-    floatkw = {'type' : float, 'default' : 10.0}
-    reader.add_line_key('peak', required=True, repeat=True, type=[float,float],
+    floatkw = {'type' : (float, str), 'default' : 10.0}
+    reader.add_line_key('peak', required=True, repeat=True,
+                                type=[float, (float, str)],
                                 keywords={'g':floatkw, 'l':floatkw,
                                           'num' : {'type':int,'default':-1}})
 
     # Read the exchange information.
     reader.add_line_key('exchange', repeat=True, type=[int, int],
-                                    glob={'type' : float,
+                                    glob={'type' : (float, str),
                                           'default' : 1.0,
                                           'len' : '?'})
     reader.add_boolean_key('nosym', action=False, default=True,
                            dest='symmetric_exchange')
 
+    # Priors of the parameters for sampling their posterior, as in
+    # "prior peak 1 vib normal 1950 2".  Each is a parameter name as for
+    # fitting, then uniform, loguniform or normal with its two values.
+    reader.add_line_key('prior', repeat=True, type=[],
+                        glob={'len' : '*', 'join' : True}, default=[])
+
+    # A manifest gives the raw data of several spectra, each
+    # at its own temperature, and how the rate depends on it
+    if manifest:
+        reader.add_line_key('spectrum', required=True, repeat=True,
+                            type=[str, float], case=True)
+        reader.add_line_key('kinetics', type=('arrhenius', 'eyring'),
+                            default='arrhenius')
+        # The activation energy or enthalpy in kJ/mol
+        reader.add_line_key('activation', type=float, default=0.0)
+        # The temperature of the rate.  The default is the mean.
+        reader.add_line_key('reference', type=float, default=None)
+        # The parameters fit to each spectrum on their own
+        reader.add_line_key('local', repeat=True, type=[],
+                            glob={'len' : '*', 'join' : True}, default=[])
+
     # Actually read the input file
     args = reader.read_input(input_file)
 
     # Make sure the filename was given correctly and read in data
     if args.raw:
         args.add('rawName', args.raw)
-        args.raw = loadtxt(abs_file_path(args.raw))
+        args.raw = loadtxt(absolute_path(args.raw, cwd))
 
     # Make the output file path absolute if given
-    args.data = abs_file_path(args.data) if 'data' in args else ''
+    args.data = absolute_path(args.data, cwd) if 'data' in args else ''
 
     if 'save_plot_script' in args:
-        args.save_plot_script = abs_file_path(args.save_plot_script)
+        args.save_plot_script = absolute_path(args.save_plot_script, cwd)
     else:
         args.save_plot_script = ''
 
-    # Adjust the input rate or lifetime to wavenumbers
+    # Adjust the input rate or lifetime to wavenumbers.  If a range
+    # was given, k is the first rate and k_values is all of them.
+    # The rate or lifetime is kept as (first value, unit).
     if 'lifetime' in args:
-        convert = { 'ps' : 1E-12, 'ns' : 1E-9, 'fs' : 1E-15, 's' : 1 }
-        args.add('k', 1 / ( convert[args.lifetime[1]] * args.lifetime[0] ))
+        values, unit = sweep_range('lifetime', args.lifetime, 'ps',
+                                   LIFETIME_UNITS)
+        args.lifetime = values[0], unit
     else:
-        convert = { 'thz' : 1E12, 'ghz' : 1E9, 'phz' : 1E15, 'hz' : 1 }
-        args.add('k', convert[args.rate[1]] * args.rate[0])
-    args.k *= HZ2WAVENUM / ( 2 * pi )
+        values, unit = sweep_range('rate', args.rate, 'thz', RATE_UNITS)
+        args.rate = values[0], unit
+    k_values = rate_to_k(values, unit)
+    args.add('k', k_values[0])
+    args.add('k_values', k_values if len(k_values) > 1 else None)
 
     # Parse the vibrational input
     num, vib, Gamma_Lorentz, Gamma_Gauss, heights, rel_rates, num_given = (
@@ -108,6 +172,19 @@ def read_input(input_file):
     else:
         num = range(1, len(num)+1, 1)
 
+    # The parameters given several values are swept.  Each
+    # parameter holds its first value.
+    sweeps = []
+    for key, label, values in (('heights', 'height', heights),
+                               ('Gamma_Lorentz', 'l', Gamma_Lorentz),
+                               ('Gamma_Gauss', 'g', Gamma_Gauss)):
+        for i, value in enumerate(values):
+            name = 'peak {0} {1}'.format(num[i], label)
+            values[i] = sweep_values(name, value)
+            if len(values[i]) > 1:
+                sweeps.append((name, key, i, values[i]))
+            values[i] = values[i][0]
+
     args.add('num', array(num))
     args.add('vib', array(vib))
     args.add('heights', array(heights))
@@ -130,16 +207,52 @@ def read_input(input_file):
                 raise ReaderError(string.format(p2))
             if p1 == p2 and args.symmetric_exchange:
                 raise ReaderError('Self exchange is not allowed')
-            rate = exchange[2]
+            name = 'exchange {0} {1}'.format(p1, p2)
+            rate = sweep_values(name, exchange[2])
+            if len(rate) > 1:
+                sweeps.append((name, 'exchange_rates', len(rates), rate))
             # Offset the peak number by one to match python indicies
             ex.append([p1-1, p2-1])
-            rates.append(rate)
+            rates.append(rate[0])
     else:
         ex = []
         rates = []
     args.add('exchanges', array(ex, dtype=int))
     args.add('exchange_rates', array(rates))
 
+    # A list of (name, attribute, index, values) for each parameter
+    # other than the rate that is swept.  When zipped, all sweeps
+    # must have the same number of values.
+    args.add('sweeps', sweeps)
+    if args.combine == 'zip':
+        lengths = set(len(x[3]) for x in sweeps)
+        if args.k_values is not None:
+            lengths.add(len(args.k_values))
+        if len(lengths) > 1:
+            raise ReaderError('To zip the swept parameters, each must be '
+                              'given the same number of values')
+
+    # Split each prior into its name, distribution and values
+    priors = []
+    for line in args.prior:
+        tokens = line.split()
+        if len(tokens) < 4 or tokens[-3] not in PRIORS:
+            raise ReaderError('A prior is a name, then one of {0} and its '
+                              'two values: {1}'.format(', '.join(PRIORS),
+                                                       line))
+        try:
+            a, b = float(tokens[-2]), float(tokens[-1])
+        except ValueError:
+            raise ReaderError('The values of a prior must be numbers: '
+                              '{0}'.format(line))
+        if ( tokens[-3] == 'normal' and b <= 0 ) or \
+           ( tokens[-3] == 'uniform' and a >= b ) or \
+           ( tokens[-3] == 'loguniform' and not 0 < a < b ):
+            raise ReaderError('The values of this prior do not describe a '
+                              'distribution: {0}'.format(line))
+        priors.append((' '.join(tokens[:-3]), tokens[-3], a, b))
+    args.add('priors', priors)
+
     # Make sure the xlimits are ascending
     try:
         range_check(args.xlim[0], args.xlim[1])
@@ -147,4 +260,246 @@ def read_input(input_file):
         raise ReaderError('In xrange, the low value must '
                           'less than the high value')
 
+    # Read in the raw data of each spectrum of a manifest
+    if manifest:
+        if args.raw is not None:
+            raise ReaderError('The raw data of a manifest is given by its '
+                              'spectrum lines')
+        names, temperatures = zip(*args.spectrum)
+        if min(temperatures) <= 0:
+            raise ReaderError('The temperatures must be positive')
+        args.add('spectra', [absolute_path(x, cwd) for x in names])
+        args.add('temperatures', array(temperatures))
+        args.add('raws', [loadtxt(x) for x in args.spectra])
+        if args.reference is None:
+            args.reference = float(args.temperatures.mean())
+        elif args.reference <= 0:
+            raise ReaderError('The reference temperature must be positive')
+
     return args
+
+
+def absolute_path(filename, cwd=None):
+    '''Return the absolute path of filename, relative to cwd if it is
+    given instead of the working directory'''
+    if cwd is not None:
+        filename = join(cwd, expanduser(expandvars(filename)))
+    return abs_file_path(filename)
+
+
+def read_manifest(input_file):
+    '''Read the manifest of a global fit.  It is an input file whose raw
+    data is instead given by a "spectrum FILE TEMPERATURE" line for each
+    spectrum, with the temperature in K.  Its other keys are
+
+        kinetics arrhenius|eyring   how the rate depends on temperature
+        activation VALUE            the activation energy (Arrhenius) or
+                                    enthalpy (Eyring) in kJ/mol
+        reference T                 the temperature in K at which the
+                                    rate is given (default the mean)
+        local NAME                  a parameter fit to each spectrum on
+                                    its own, i.e. "local l" or
+                                    "local peak 1 vib" (repeatable)
+
+    The other peak parameters are shared by all spectra.  Returns the
+    same as read_input, along with spectra (the absolute paths of the
+    raw data), temperatures, and raws (the raw data of each).'''
+    return read_input(input_file, manifest=True)
+
+
+def read_record(record, cwd=None):
+    '''Read a parameter set given as a dictionary instead of a file.
+    See record_lines for the format, and read_input for cwd.  Returns
+    the same as read_input.'''
+    return read_input(record_lines(record), cwd=cwd)
+
+
+def record_lines(record):
+    '''Return the lines of the input file described by a dictionary.
+
+    Each key of the dictionary is an input file key.  The value is the
+    list of what follows the key on its line, where a dictionary gives
+    the keyword arguments, or a single value if there is only one.  Keys
+    given on several lines (see REPEATED) take a list of lines, and
+    boolean keys (reverse and nosym) take True or False.  For example
+
+        {"rate": [1.54, "THz"],
+         "peak": [[1949.8, 0.38, {"l": 5.6, "g": 1.2}],
+                  [1970.3, 0.35, {"l": 5.6, "g": 0.9}]],
+         "exchange": [[1, 2, 1.0]],
+         "xlim": [1900, 2050],
+         "reverse": true}
+    '''
+    if not isinstance(record, dict):
+        raise ReaderError('A parameter set must be a dictionary')
+
+    def line(key, value):
+        '''Return the line for a key and its value'''
+        if value is True:
+            return key
+        tokens = [key]
+        for item in value if isinstance(value, (list, tuple)) else [value]:
+            if isinstance(item, dict):
+                tokens.extend('{0}={1!r}'.format(k, v) if isinstance(v, float)
+                              else '{0}={1}'.format(k, v)
+                              for k, v in item.items())
+            else:
+                tokens.append(repr(item) if isinstance(item, float)
+                              else str(item))
+        text = ' '.join(tokens)
+        if '\n' in text or '\r' in text:
+            raise ReaderError('{0}: values cannot contain line '
+                              'breaks'.format(key))
+        return text
+
+    lines = []
+    for key, value in record.items():
+        if value is False or value is None:
+            continue
+        elif key in REPEATED:
+            lines.extend(line(key, v) for v in value)
+        else:
+            lines.append(line(key, value))
+    return lines
+
+
+def input_record(args):
+    '''Return the record (see record_lines) of the parameters read by
+    read_input, so that an input file can be written from them.  Only
+    the first value of a swept parameter is kept.  The raw data file is
+    given by its absolute path.'''
+    record = OrderedDict()
+    if 'lifetime' in args:
+        record['lifetime'] = [float(args.lifetime[0]), args.lifetime[1]]
+    else:
+        record['rate'] = [float(args.rate[0]), args.rate[1]]
+
+    # Only give the peak numbers if they were not the default
+    numbered = list(args.num) != list(range(1, len(args.num)+1))
+    record['peak'] = []
+    for i in range(len(args.num)):
+        keywords = OrderedDict([('l', float(args.Gamma_Lorentz[i])),
+                                ('g', float(args.Gamma_Gauss[i]))])
+        if numbered:
+            keywords['num'] = int(args.num[i])
+        record['peak'].append([float(args.vib[i]), float(args.heights[i]),
+                               keywords])
+    record['exchange'] = [[int(p1+1), int(p2+1), float(rate)]
+                          for (p1, p2), rate in zip(args.exchanges,
+                                                    args.exchange_rates)]
+    record['nosym'] = not args.symmetric_exchange
+
+    record['xlim'] = [int(args.xlim[0]), int(args.xlim[1])]
+    record['reverse'] = bool(args.reverse)
+    if args.lineshape != 'exact':
+        record['lineshape'] = args.lineshape
+    if args.tolerance is not None:
+        record['tolerance'] = float(args.tolerance)
+    if args.eigensolver != 'dense':
+        record['eigensolver'] = args.eigensolver
+    if 'rawName' in args:
+        record['raw'] = abs_file_path(args.rawName)
+    record['prior'] = [[name, dist, float(a), float(b)]
+                       for name, dist, a, b in args.priors]
+    return record
+
+
+def manifest_record(args):
+    '''Return the record (see record_lines) of the manifest read by
+    read_manifest, as input_record does for an input file.'''
+    record = input_record(args)
+    record['kinetics'] = args.kinetics
+    record['activation'] = float(args.activation)
+    record['reference'] = float(args.reference)
+    record['local'] = list(args.local)
+    record['spectrum'] = [[name, float(temperature)] for name, temperature
+                          in zip(args.spectra, args.temperatures)]
+    return record
+
+
+def rate_to_k(value, unit):
+    '''Return the rate in wavenumbers of a rate or lifetime given in one
+    of the units in RATE_UNITS or LIFETIME_UNITS.'''
+    unit = unit.lower()
+    if unit in LIFETIME_UNITS:
+        hz = 1 / ( LIFETIME_UNITS[unit] * value )
+    else:
+        hz = RATE_UNITS[unit] * value
+    return hz * HZ2WAVENUM / ( 2 * pi )
+
+
+def k_to_rate(k, unit):
+    '''Return the rate or lifetime in the given unit of a rate in
+    wavenumbers.  This is the inverse of rate_to_k.'''
+    unit = unit.lower()
+    hz = k * ( 2 * pi ) / HZ2WAVENUM
+    if unit in LIFETIME_UNITS:
+        return 1 / ( LIFETIME_UNITS[unit] * hz )
+    else:
+        return hz / RATE_UNITS[unit]
+
+
+def sweep_range(name, line, default_unit, units):
+    '''Return the values and unit given on a rate or lifetime line.
+
+    The line is either a value (see sweep_values) with an optional unit,
+    or a range "start stop lin|log number" with an optional unit.
+    '''
+    start, rest = line[0], list(line[1:])
+    unit = default_unit
+    if rest and rest[-1] in units:
+        unit = rest.pop()
+
+    if not rest:
+        return sweep_values(name, start), unit
+    elif len(rest) != 3 or rest[1] not in ('lin', 'log'):
+        raise ReaderError('{0}: expected "{0} value [unit]" or '
+                          '"{0} start stop lin|log number [unit]"'
+                          .format(name))
+    try:
+        start, stop, number = float(start), float(rest[0]), int(rest[2])
+    except ValueError:
+        raise ReaderError('{0}: the range must be given as '
+                          '"start stop lin|log number"'.format(name))
+    return value_range(name, rest[1], start, stop, number), unit
+
+
+def sweep_values(name, value):
+    '''Return the values given for a parameter as an array.
+
+    A value is either a single number, a comma-separated list of
+    numbers such as "1,2,5", or a range such as "lin:1:10:5" or
+    "log:0.1:10:200" giving the spacing, the first and last values,
+    and the number of values.
+    '''
+    if isinstance(value, (int, float)):
+        return array([value], dtype=float)
+    parts = value.split(':')
+    try:
+        if parts[0] in ('lin', 'log') and len(parts) == 4:
+            return value_range(name, parts[0], float(parts[1]),
+                               float(parts[2]), int(parts[3]))
+        else:
+            return array([float(x) for x in value.split(',')])
+    except ValueError:
+        raise ReaderError('{0}: cannot read "{1}"; expected a number, '
+                          'a list such as "1,2,5", or a range such as '
+                          '"lin:1:10:5" or "log:0.1:10:5"'.format(name, value))
+
+
+def value_range(name, spacing, start, stop, number):
+    '''Return number values spaced linearly ('lin') or
+    logarithmically ('log') from start to stop.'''
+    if number < 1:
+        raise ReaderError('{0}: the number of values must be '
+                          'positive'.format(name))
+    if spacing == 'log':
+        if start <= 0 or stop <= 0:
+            raise ReaderError('{0}: a log range must be '
+                              'positive'.format(name))
+        values = logspace(log10(start), log10(stop), number)
+        # Keep the ends exactly as they were given
+        values[-1], values[0] = stop, start
+        return values
+    else:
+        return linspace(start, stop, number)
@@ -0,0 +1,224 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+from math import ceil, log as mlog
+
+# Non-std lib imports
+from numpy import arange, argmax, array, cumsum, errstate, full, inf, \
+                  isfinite, log, nan, pi, sqrt, tile, zeros
+from numpy.fft import irfft, rfft
+from numpy.random import RandomState
+
+# Local imports
+from rapid.common.spectrum import spectrum_batch, ZMat, SpectrumError
+from rapid.common.fit import fit_parameters, choose_parameters, select, \
+                             FitError
+from rapid.common.read_input import k_to_rate
+
+__all__ = ['Posterior', 'ensemble_sampler', 'autocorrelation_time',
+           'log_prior']
+
+
+class Posterior(object):
+    '''The log posterior of the parameters of a fit (see fit_spectrum)
+    given its data, for a batch of parameter sets at once.
+
+    The likelihood is Gaussian with the noise level marginalized over
+    (with a Jeffreys prior), so that its log is -n/2 log(RSS) for the n
+    points of the data.  The priors are those of args (see log_prior),
+    and the other parameters have a flat prior within their bounds.  Only
+    the parameters refined by the fit are sampled, in the order of their
+    indices in the fit.
+    '''
+
+    def __init__(self, args, best, refine, fix=(), bounds=None, ties=None):
+        '''args are the parameters read by read_input, and best is the
+        FitResult of fit_spectrum for them with refine, fix, bounds and
+        ties, which choose the parameters that are sampled.'''
+        self.args = args
+        self.omega, self.data = best.omega, best.data
+        self.params = fit_parameters(args)
+        self.names = [p.name for p in self.params]
+        self.unit = args.lifetime[1] if 'lifetime' in args else args.rate[1]
+        heights = [i for i, p in enumerate(self.params)
+                   if p.kind == 'height']
+        self.choice = choose_parameters(self.params, refine, fix, bounds,
+                                        ties, self.unit,
+                                        [(len(self.params) - 1, heights)])
+        self.best = best.values.copy()
+        self.index = self.choice.index
+        self.ndim = len(self.index)
+
+        # The priors, with the indices of the parameters of each
+        self.priors = []
+        for name, dist, a, b in args.priors:
+            self.priors.append((select(self.params, name), dist, a, b))
+
+    def values(self, X):
+        '''Return all the parameters for the (B x D) sampled parameters
+        X, as (B x P) values like FitResult.values.'''
+        values = tile(self.best, (len(X), 1))
+        values[:,self.index] = X
+        return values[:,self.choice.tied]
+
+    def prior(self, values):
+        '''Return the log prior of the (B x P) values of all the
+        parameters.  The prior of the rate is in the unit of the input
+        file, so it is transformed to the rate in wavenumbers.'''
+        lower, upper = self.choice.lower, self.choice.upper
+        inside = ( ( values >= lower ) & ( values <= upper ) ).all(1)
+        logp = zeros(len(values))
+        logp[~inside] = -inf
+        for index, dist, a, b in self.priors:
+            for i in index:
+                x = values[:,i]
+                if i == 0:
+                    with errstate(divide='ignore', invalid='ignore'):
+                        x = k_to_rate(values[:,0], self.unit)
+                        logp += log(abs(x / values[:,0]))
+                logp += log_prior(dist, a, b, x)
+        logp[~isfinite(logp)] = -inf
+        return logp
+
+    def likelihood(self, values):
+        '''Return the log likelihood of the (B x P) values of all the
+        parameters.  The spectra of the batch are calculated together.'''
+        try:
+            I = self.spectra(values)
+        except SpectrumError:
+            # Find which members can't be calculated
+            I = full((len(values), len(self.omega)), nan)
+            for b in range(len(values)):
+                try:
+                    I[b] = self.spectra(values[b:b+1])[0]
+                except SpectrumError:
+                    pass
+        baseline, scale = values[:,-2:].T
+        model = scale[:,None] * I + baseline[:,None]
+        rss = ( ( model - self.data )**2 ).sum(1)
+        logl = -0.5 * len(self.data) * log(rss)
+        logl[~isfinite(logl)] = -inf
+        return logl
+
+    def spectra(self, values):
+        '''Return the (B x M) spectra of the (B x P) values of all the
+        parameters at the x-values of the data.'''
+        args = self.args
+        npeaks, nexchange = len(args.vib), len(args.exchange_rates)
+        rates = values[:,1:1+nexchange]
+        Z = array([ZMat(npeaks, args.exchanges, r, args.symmetric_exchange)
+                   for r in rates])
+        vib, GL, GG, h = values[:,1+nexchange:-2].reshape(-1, 4, npeaks) \
+                                                 .transpose(1, 0, 2)
+        return spectrum_batch(Z, values[:,0], vib, GL, GG, h, self.omega,
+                              kernel=args.lineshape)[0]
+
+    def __call__(self, X):
+        '''Return the log posterior of the (B x D) sampled parameters X.
+        Only the members with a finite prior are calculated.'''
+        values = self.values(X)
+        logp = self.prior(values)
+        finite = isfinite(logp)
+        if finite.any():
+            logp[finite] += self.likelihood(values[finite])
+        return logp
+
+    def start(self, nwalkers, errors, random, scale=1E-2):
+        '''Return nwalkers starting points in a small ball about the best
+        fit, spread by scale times the standard errors of the sampled
+        parameters, each with a finite posterior.'''
+        x0 = self.best[self.index]
+        spread = scale * errors
+        bad = ~isfinite(spread) | ( spread <= 0 )
+        spread[bad] = scale * abs(x0[bad]) + 1E-8
+        walkers = x0 + spread * random.randn(nwalkers, self.ndim)
+        for _ in range(100):
+            logp = self(walkers)
+            bad = ~isfinite(logp)
+            if not bad.any():
+                return walkers, logp
+            walkers[bad] = x0 + spread * random.randn(bad.sum(), self.ndim)
+            spread = spread / 2
+        raise FitError('The walkers could not be started near the fit.  '
+                       'Is the fit outside of the priors?')
+
+
+def log_prior(dist, a, b, x):
+    '''Return the log density at x of a prior distribution, which is
+    uniform or loguniform between a and b, or normal with mean a and
+    standard deviation b.'''
+    x = array(x, dtype=float)
+    if dist == 'normal':
+        return -0.5 * ( ( x - a ) / b )**2 - log(b * sqrt(2 * pi))
+    logp = full(x.shape, -inf)
+    inside = ( x >= a ) & ( x <= b )
+    if dist == 'uniform':
+        logp[inside] = -mlog(b - a)
+    else:
+        logp[inside] = -log(x[inside]) - mlog(mlog(b / a))
+    return logp
+
+
+def ensemble_sampler(log_prob, walkers, nsteps, logp=None, random=None,
+                     stretch=2.0):
+    '''Sample with Goodman and Weare's affine invariant ensemble sampler,
+    using their stretch move.
+
+    log_prob returns the log probabilities of a (B x D) batch of points,
+    and walkers are the (W x D) starting points.  Each step moves each
+    half of the walkers in turn towards or away from walkers of the other
+    half, so the log probabilities of each half's proposals are found
+    with one call.  Yields the walkers, their log probabilities, and how
+    many of their moves were accepted so far after each step.
+    '''
+    walkers = array(walkers, dtype=float)
+    nwalkers, ndim = walkers.shape
+    if nwalkers < 4 or nwalkers % 2:
+        raise ValueError('There must be an even number of at least four '
+                         'walkers')
+    if random is None:
+        random = RandomState()
+    logp = log_prob(walkers) if logp is None else array(logp, dtype=float)
+    accepted = zeros(nwalkers, dtype=int)
+    halves = arange(nwalkers // 2), arange(nwalkers // 2, nwalkers)
+    for step in range(nsteps):
+        for active, other in (halves, halves[::-1]):
+            n = len(active)
+            z = ( ( stretch - 1 ) * random.rand(n) + 1 )**2 / stretch
+            partners = walkers[other[random.randint(0, len(other), n)]]
+            proposal = partners + z[:,None] * ( walkers[active] - partners )
+            new = log_prob(proposal)
+            with errstate(invalid='ignore'):
+                accept = log(random.rand(n)) < ( ndim - 1 ) * log(z) \
+                                               + new - logp[active]
+            walkers[active[accept]] = proposal[accept]
+            logp[active[accept]] = new[accept]
+            accepted[active[accept]] += 1
+        yield walkers, logp, accepted
+
+
+def autocorrelation_time(chain, window=5):
+    '''Return the integrated autocorrelation time of each parameter of a
+    (N x W x D) chain of N steps of W walkers, in steps.
+
+    The autocorrelation of each walker is found by FFT and averaged over
+    the walkers, and summed over the smallest window of at least window
+    times the autocorrelation time (Sokal's automatic windowing).  A
+    parameter that doesn't change has a time of NaN.
+    '''
+    chain = array(chain, dtype=float)
+    nsteps = len(chain)
+    x = chain - chain.mean(0)
+    nfft = 2**int(ceil(mlog(2 * nsteps, 2)))
+    f = rfft(x, n=nfft, axis=0)
+    acf = irfft(f * f.conjugate(), n=nfft, axis=0)[:nsteps]
+    with errstate(divide='ignore', invalid='ignore'):
+        rho = ( acf / acf[0] ).mean(1)
+    taus = 2 * cumsum(rho, axis=0) - 1
+    tau = full(chain.shape[2], nan)
+    for d in range(chain.shape[2]):
+        if not isfinite(taus[:,d]).all():
+            continue
+        reached = arange(nsteps) >= window * taus[:,d]
+        tau[d] = taus[argmax(reached) if reached.any() else -1,d]
+    return tau
@@ -3,11 +3,21 @@ from __future__ import print_function, division, absolute_import
 # Std. lib imports
 from sys import exit
 from math import sqrt, log, pi
+from cmath import sqrt as csqrt
 
 # Non-std lib imports
-from scipy.linalg import eig, inv
-from scipy.special import wofz
-from numpy import array, argsort, diag, dot, eye, zeros
+from scipy.linalg import eig, lu_factor, lu_solve
+from scipy.sparse import coo_matrix, csr_matrix, diags, identity, issparse
+from scipy.sparse.csgraph import connected_components
+from numpy import add, arange, argsort, array, asarray, bincount, \
+                  broadcast_arrays, broadcast_to, concatenate, cumsum, diag, \
+                  diag_indices_from, einsum, eye, inf, log as nplog, \
+                  maximum, ones, repeat, searchsorted, split, sqrt as npsqrt, \
+                  swapaxes, take_along_axis, unique, zeros
+from numpy.linalg import eig as npeig, solve
+
+# Local imports
+from rapid.common.lineshape import lineshape_kernel
 
 
 # A few constants
@@ -15,106 +25,447 @@ SQRT2LOG2_2 = sqrt(2 * log(2)) * 2
 INVSQRT2LOG2_2 = 1 / SQRT2LOG2_2
 SQRT2 = sqrt(2)
 SQRT2PI = sqrt(2 * pi)
+INVSQRTPI = 1 / sqrt(pi)
+
+# The three cube roots of unity
+CUBEROOTS = [1, complex(-0.5, sqrt(3) / 2), complex(-0.5, -sqrt(3) / 2)]
+
+# The default maximum number of (peak, frequency) pairs
+# evaluated at once when summing the Voigt profiles
+BLOCKSIZE = 2**18
+
+# Each peak is only evaluated over its support if that is less than this
+# fraction of all the (peak, frequency) pairs.  Each pair costs about twice
+# as much over the supports as over the whole domain.
+TRUNCATED_FRACTION = 0.4
 
 
-def ZMat(npeaks, peak_exchanges, relative_rates, symmetric):
-    '''Construct the Z matrix.  Symmetry can be enforced or not.'''
+def ZMat(npeaks, peak_exchanges, relative_rates, symmetric, sparse=False):
+    '''Construct the Z matrix.  Symmetry can be enforced or not.
 
-    Z = zeros((npeaks, npeaks))
+    peak_exchanges is an (M x 2) array of the indices of the exchanging
+    peaks and relative_rates is the M rates.  If an exchange is given more
+    than once the last rate is used.  If sparse is True, a scipy.sparse
+    CSR matrix is returned instead of a dense array.
+    '''
+    index = asarray(peak_exchanges, dtype=int).reshape(-1, 2)
+    rates = asarray(relative_rates, dtype=float).ravel()
 
     if symmetric:
         # Place the relative exchange rates symmetrically in Z
-        for index, rate in zip(peak_exchanges, relative_rates):
-            Z[index[0],index[1]] = rate
-            Z[index[1],index[0]] = rate
+        rows = index.ravel()
+        cols = index[:,::-1].ravel()
+        rates = repeat(rates, 2)
+    else:
+        # Place the relative exchange rates in Z
+        rows, cols = index[:,0], index[:,1]
+
+    # Keep only the last rate given for each element
+    flat = rows * npeaks + cols
+    last = len(flat) - 1 - unique(flat[::-1], return_index=True)[1]
+    rows, cols, rates = rows[last], cols[last], rates[last]
 
+    if symmetric:
         # The diagonals of Z must be 1 minus the sum
         # of the off diagonals for that row
-        sums = zeros(npeaks)
-        for i in xrange(npeaks):
-            sums[i] = sum(Z[i,:])
-            Z[i,i]  = 1 - sums[i]
+        sums = bincount(rows, weights=rates, minlength=npeaks)
+        diagonal = rows == cols
+        rows, cols, rates = rows[~diagonal], cols[~diagonal], rates[~diagonal]
+        rows = concatenate([rows, arange(npeaks)])
+        cols = concatenate([cols, arange(npeaks)])
+        rates = concatenate([rates, 1 - sums])
 
         # Now, if any of the sums are greater than 1, normalize
-        if any(sums > 1):
-            Z /= sums.max()
+        if ( sums > 1 ).any():
+            rates /= sums.max()
+
+    if sparse:
+        return csr_matrix((rates, (rows, cols)), shape=(npeaks, npeaks))
     else:
-        # Place the relative exchange rates in Z
-        for index, rate in zip(peak_exchanges, relative_rates):
-            Z[index[0],index[1]] = rate
-        
-    return Z
+        Z = zeros((npeaks, npeaks))
+        Z[rows,cols] = rates
+        return Z
 
 
-def spectrum(Z, k, vib, Gamma_Lorentz, Gamma_Gauss, heights, omega):
+def spectrum(Z, k, vib, Gamma_Lorentz, Gamma_Gauss, heights, omega,
+             blocksize=BLOCKSIZE, kernel='exact', tol=None):
     '''This routine contains the code that drives the actual calculation
     of the intensities.
+
+    blocksize bounds the number of (peak, frequency) pairs that are
+    evaluated at once when summing the Voigt profiles, and therefore
+    the size of the temporary arrays.
+
+    kernel chooses how the Faddeeva function in the Voigt profiles is
+    evaluated.  It is one of the names in rapid.common.lineshape.KERNELS
+    ('exact', 'humlicek', 'weideman' or 'table') or a function
+    of a complex array.
+
+    If tol is given, each peak is only evaluated over the part of omega
+    where it is larger than about tol times the largest peak amplitude.
+    tol bounds the tail left out of each peak, not of the sum, so the
+    error of the spectrum grows with the number of peaks whose tails
+    overlap.
     '''
     npeaks = len(vib)
-    N = range(npeaks)
+
+    # Multiply Z-I by k to get K, then construct the A matrix from K,
+    # the vibrational frequencies, and the Lorentzian HWHM.
+    # Z may be a scipy.sparse matrix.
+    if issparse(Z):
+        K = k * ( Z - identity(npeaks, format='csr') )
+        A = diags([-1j * vib + 0.5 * Gamma_Lorentz], [0]) - K
+    else:
+        K = k * ( Z - eye(npeaks) )
+        A = diag(-1j * vib + 0.5 * Gamma_Lorentz) - K
+
+    ##########################################
+    # Construct an array of the new parameters
+    ##########################################
+
+    peaks, HWHM, sigmas, h = exchange_parameters(A, Gamma_Gauss, heights)
+    # Also create the modified input parameters for return
+    GL = 2 * HWHM
+    GG = SQRT2LOG2_2 * sigmas
+    new_params = peaks, GL, GG, h.real
+
+    ################################################
+    # Use these new values to calculate the spectrum
+    ################################################
+
+    # Return the sum of voigt profiles for each peak,
+    # along with the new parameters
+    return (voigt_sum(omega, h, peaks, HWHM, sigmas, blocksize=blocksize,
+                      kernel=kernel, tol=tol),
+            new_params)
+
+
+def spectrum_batch(Z, k, vib, Gamma_Lorentz, Gamma_Gauss, heights, omega,
+                   blocksize=BLOCKSIZE, kernel='exact', tol=None):
+    '''Calculate the intensities for a stack of parameter sets at once.
+
+    The arguments are the same as for spectrum, but each may carry
+    leading batch axes: Z is (B x N x N), k is (B), and vib,
+    Gamma_Lorentz, Gamma_Gauss and heights are (B x N).  Arguments
+    without the batch axes are shared by every member of the batch.
+    All members must have the same number of peaks and share the
+    domain omega.  Returns a (B x M) intensity array and the new
+    parameters as a tuple of (B x N) arrays.
+    '''
+    Z = asarray(Z, dtype=float)
+    k = asarray(k, dtype=float)
+    vib = asarray(vib, dtype=float)
+    Gamma_Lorentz = asarray(Gamma_Lorentz, dtype=float)
+    Gamma_Gauss = asarray(Gamma_Gauss, dtype=float)
+    heights = asarray(heights, dtype=float)
+    npeaks = vib.shape[-1]
 
     # Multiply Z-I by k to get K
-    K = k * ( Z - eye(npeaks) )
+    K = k[...,None,None] * ( Z - eye(npeaks) )
+
+    # Construct the stack of A matrices, then find S, S^{-1}, and Lambda
+    # for all of them together
+    A = ( -1j * vib + 0.5 * Gamma_Lorentz )[...,None] * eye(npeaks) - K
+    Lambda, S, SinvT = eigensystem(A)
+
+    # Construct arrays of the new parameters
+    peaks, HWHM, sigmas, h = new_parameters(Lambda, S, SinvT,
+                                            Gamma_Gauss, heights)
+    new_params = peaks, 2 * HWHM, SQRT2LOG2_2 * sigmas, h.real
+
+    # Sum the voigt profiles for each member of the batch
+    return (voigt_sum(omega, h, peaks, HWHM, sigmas, blocksize=blocksize,
+                      kernel=kernel, tol=tol),
+            new_params)
+
+
+def exchange_parameters(A, Gamma_Gauss, heights):
+    '''Return the peak positions, Lorentzian HWHM, Gaussian sigmas, and
+    complex heights after exchange, ordered by the magnitude of the
+    peak positions.
+
+    The eigensystem of A is found with exchange_eigensystem, and the
+    parameters with block_parameters.
+    '''
+    return block_parameters(exchange_eigensystem(A), Gamma_Gauss, heights)
+
+
+def exchange_eigensystem(A):
+    '''Return the eigensystem of A as a list of blocks.
+
+    The peaks are split into the connected components of the exchange
+    network, so that A is block diagonal and each block is decomposed on
+    its own.  Blocks of the same size are decomposed together in one
+    batched call, and peaks that don't exchange with any other peak are
+    passed through without any linear algebra.  A may be a scipy.sparse
+    matrix; only the blocks are made dense.
+
+    Each block is a tuple (indx, Lambda, S, SinvT), where indx is the
+    peaks in the block (stacked if there are several blocks of the same
+    size) and the rest are as returned by eigensystem.  S and SinvT are
+    None for peaks that don't exchange.
+    '''
+    npeaks = A.shape[0]
+
+    # Small systems are quicker to decompose whole than to split
+    if npeaks <= 3 and not issparse(A):
+        return [(arange(npeaks),) + eigensystem(A)]
+
+    # The non-zero elements of A
+    if issparse(A):
+        A = A.tocoo()
+        rows, cols, vals = A.row, A.col, A.data
+    else:
+        rows, cols = A.nonzero()
+        vals = A[rows,cols]
+    diagonal = A.diagonal()
+
+    # Two peaks are connected if either exchanges into the other
+    offdiag = rows != cols
+    graph = coo_matrix((ones(offdiag.sum()), (rows[offdiag], cols[offdiag])),
+                       shape=(npeaks, npeaks))
+    ncomp, labels = connected_components(graph, directed=True,
+                                         connection='weak')
+
+    # If all peaks are connected, just use the whole matrix
+    if ncomp == 1:
+        if issparse(A):
+            A = A.toarray()
+        # Lambda is the eigenvalues of A, S is the eigenvectors.
+        # The columns of SinvT are the rows of S^{-1}.
+        return [(arange(npeaks),) + eigensystem(A)]
+
+    # Collect the peaks in each component, and group components by size
+    members = argsort(labels, kind='mergesort')
+    sizes = bincount(labels)
+    members = split(members, cumsum(sizes)[:-1])
+    # The position of each peak within its component, and
+    # the position of each component within its group
+    position = zeros(npeaks, dtype=int)
+    group = zeros(ncomp, dtype=int)
+    blocks = []
+    for n in unique(sizes):
+        comps = (sizes == n).nonzero()[0]
+        indx = array([members[c] for c in comps])
+        if n == 1:
+            # The eigenvalue of an isolated peak is its diagonal element,
+            # and its eigenvectors are 1
+            indx = indx[:,0]
+            blocks.append((indx, diagonal[indx], None, None))
+        else:
+            # Gather the elements of every block of this size
+            position[indx] = arange(n)
+            group[comps] = arange(len(comps))
+            inblock = sizes[labels[rows]] == n
+            r, c = rows[inblock], cols[inblock]
+            stack = zeros((len(comps), n, n), dtype=complex)
+            add.at(stack, (group[labels[r]], position[r], position[c]),
+                   vals[inblock])
+            # Find S, S^{-1}, and Lambda for every block of this size
+            blocks.append((indx,) + eigensystem(stack))
+    return blocks
+
 
-    ############################
-    # Find S, S^{-1}, and Lambda
-    ############################
+def block_parameters(blocks, Gamma_Gauss, heights):
+    '''Return the peak positions, Lorentzian HWHM, Gaussian sigmas, and
+    complex heights after exchange from the blocks returned by
+    exchange_eigensystem, ordered by the magnitude of the peak positions.'''
+    Gamma_Gauss, heights = asarray(Gamma_Gauss), asarray(heights)
 
-    # Construct the A matrix from K, the vibrational frequencies,
-    # and the Lorentzian HWHM
-    A = diag(-1j * vib + 0.5 * Gamma_Lorentz) - K
-    # Lambda is the eigenvalues of A, S is the eigenvectors
-    Lambda, S = eig(A)
+    # A single block is the whole matrix, and is already in order
+    if len(blocks) == 1 and blocks[0][2] is not None:
+        indx, Lambda, S, SinvT = blocks[0]
+        if indx.ndim == 1:
+            return new_parameters(Lambda, S, SinvT, Gamma_Gauss, heights)
+
+    params = []
+    for indx, Lambda, S, SinvT in blocks:
+        if S is None:
+            # The parameters of an isolated peak are unchanged
+            Gprime = ( Gamma_Gauss[indx] * INVSQRT2LOG2_2 )**(-2)
+            params.append((-Lambda.imag, Lambda.real, Gprime**(-0.5),
+                           heights[indx].astype(complex)))
+        else:
+            params.append([x.ravel() for x in
+                           new_parameters(Lambda, S, SinvT,
+                                          Gamma_Gauss[indx], heights[indx])])
+
+    # Merge the blocks, and order by the peak positions as if the
+    # whole matrix had been decomposed at once
+    peaks, HWHM, sigmas, h = [concatenate(x) for x in zip(*params)]
+    indx = argsort(abs(peaks), kind='mergesort')
+    return peaks[indx], HWHM[indx], sigmas[indx], h[indx]
+
+
+def eigensystem(A):
+    '''Return the eigenvalues of A ordered by the magnitude of their
+    imaginary part, the matching right eigenvectors S, and the transpose
+    of S^{-1}.
+
+    S^{-1} is built from the left eigenvectors rather than by inverting S.
+    If the eigenvalues are too close together for the left eigenvectors
+    to be biorthogonal, S^{-1} is instead found from an LU factorization
+    of S.
+
+    If A is a stack of matrices, all are decomposed with one batched call
+    and S^{-1} is found with a batched solve.  A single 2x2 or 3x3 matrix
+    is decomposed in closed form unless its eigenvalues are nearly
+    degenerate.
+    '''
+    if A.ndim > 2:
+        return _eigensystem_stack(A)
+    elif len(A) in (2, 3):
+        esys = closed_form_eigensystem(A)
+        if esys is not None:
+            return esys
+
+    # Lambda is the eigenvalues of A, W and S are the left and
+    # right eigenvectors
+    Lambda, W, S = eig(A, left=True, right=True)
     # Since the eigens are unordered, order by
     # the imaginary part of Lambda
     indx = argsort(abs(Lambda.imag))
-    S, Sinv, Lambda = S[:,indx], inv(S[:,indx]), Lambda[indx]
+    Lambda, W, S = Lambda[indx], W[:,indx], S[:,indx]
 
-    #################################
-    # Use S and S^{-1} to find Gprime
-    #################################
+    if degenerate(Lambda):
+        SinvT = lu_solve(lu_factor(S), eye(len(Lambda))).T
+    else:
+        # Scale the conjugated left eigenvectors so that W^H S = I
+        W = W.conj()
+        SinvT = W / einsum('ij,ij->j', W, S)
+    return Lambda, S, SinvT
 
-    # Convert Gamma_Gauss to sigma
-    sigma = Gamma_Gauss * INVSQRT2LOG2_2
 
-    # Construct the G matrix from sigma,
-    # then use S and S^{-1} to get Gprime
-    G = diag(sigma**(-2))
-    # Off-diagonals are zero
-    Gprime = array(diag(dot(dot(Sinv, G), S)), dtype=complex).real
+def _eigensystem_stack(A):
+    '''Batched version of eigensystem for a stack of A matrices.'''
+    Lambda, S = npeig(A)
+    # Order each member by the imaginary part of Lambda
+    indx = argsort(abs(Lambda.imag), axis=-1)
+    Lambda = take_along_axis(Lambda, indx, axis=-1)
+    S = take_along_axis(S, indx[...,None,:], axis=-1)
+    I = broadcast_to(eye(A.shape[-1]), S.shape)
+    SinvT = swapaxes(solve(S, I), -1, -2)
+    return Lambda, S, SinvT
 
-    ##########################################
-    # Construct an array of the new parameters
-    ##########################################
 
-    h = [height(j, heights, S, Sinv) for j in N]
-    peaks = [-x.imag for x in Lambda]
-    HWHM  = [x.real for x in Lambda]
-    try:
-        sigmas = [1 / sqrt(x) for x in Gprime]
-    except ValueError:
+def closed_form_eigensystem(A, tol=1E-4):
+    '''Return the same as eigensystem for a 2x2 or 3x3 matrix using the
+    closed-form roots of its characteristic polynomial.
+
+    The eigenvectors are cross products of the rows (right) or columns
+    (left) of A - lambda I.  The arithmetic is done on Python complex
+    numbers, which for matrices this small is much faster than calling
+    LAPACK.  None is returned if any two eigenvalues are closer than tol
+    times the size of A, where the eigenvectors from this method are
+    inaccurate.
+    '''
+    n = len(A)
+    N = range(n)
+    # Shift A by the mean of its diagonal so that it has no trace.
+    # This keeps the large vibrational frequencies out of the roots.
+    M = A.tolist()
+    mu = sum(M[i][i] for i in N) / n
+    for i in N:
+        M[i][i] -= mu
+    size = max(abs(x) for row in M for x in row)
+
+    if n == 2:
+        # The roots of t^2 + det(M) = 0
+        t = csqrt(-( M[0][0] * M[1][1] - M[0][1] * M[1][0] ))
+        roots = [t, -t]
+    else:
+        # Cardano's method for t^3 + p t + q = 0.  Choose the
+        # sign of the square root that avoids cancellation.
+        p = ( M[0][0] * M[1][1] - M[0][1] * M[1][0]
+            + M[0][0] * M[2][2] - M[0][2] * M[2][0]
+            + M[1][1] * M[2][2] - M[1][2] * M[2][1] )
+        q = -( M[0][0] * ( M[1][1] * M[2][2] - M[1][2] * M[2][1] )
+             - M[0][1] * ( M[1][0] * M[2][2] - M[1][2] * M[2][0] )
+             + M[0][2] * ( M[1][0] * M[2][1] - M[1][1] * M[2][0] ) )
+        r = csqrt(q * q / 4 + p * p * p / 27)
+        if abs(-q / 2 - r) > abs(-q / 2 + r):
+            r = -r
+        u = ( -q / 2 + r )**( 1 / 3 )
+        if abs(u) <= tol * size:
+            return None
+        roots = [u * w - p / ( 3 * u * w ) for w in CUBEROOTS]
+
+    # Fall back to the general method if any roots are too close
+    if any(abs(roots[i] - roots[j]) <= tol * size
+           for i in N for j in N if i < j):
+        return None
+
+    # Polish the cubic roots with a Newton step.  They are
+    # well separated, so the derivative is not small.
+    if n == 3:
+        roots = [t - ( t * t * t + p * t + q ) / ( 3 * t * t + p )
+                 for t in roots]
+
+    # Since the eigens are unordered, order by
+    # the imaginary part of Lambda
+    roots.sort(key=lambda t: abs(( t + mu ).imag))
+    S, W = [], []
+    for t in roots:
+        B = [[M[i][j] - ( t if i == j else 0 ) for j in N] for i in N]
+        S.append(_null_vector(B))
+        W.append(_null_vector([list(col) for col in zip(*B)]))
+    # Scale the left eigenvectors so that W^T S = I
+    W = [[x / sum(y * z for y, z in zip(w, s)) for x in w]
+         for w, s in zip(W, S)]
+    return (array([t + mu for t in roots]), array(S).T, array(W).T)
+
+
+def _null_vector(B):
+    '''Return the null vector of a singular 2x2 or 3x3 matrix (as nested
+    lists) from its rows, choosing the largest of the candidates.'''
+    if len(B) == 2:
+        candidates = [[B[0][1], -B[0][0]], [B[1][1], -B[1][0]]]
+    else:
+        candidates = [[a[1] * b[2] - a[2] * b[1],
+                       a[2] * b[0] - a[0] * b[2],
+                       a[0] * b[1] - a[1] * b[0]]
+                      for a, b in ((B[0], B[1]), (B[0], B[2]), (B[1], B[2]))]
+    return max(candidates, key=lambda v: sum(abs(x) for x in v))
+
+
+def degenerate(Lambda, tol=1E-8):
+    '''Return True if any two eigenvalues are equal to within a tolerance
+    relative to the largest eigenvalue.'''
+    if len(Lambda) < 2:
+        return False
+    diff = abs(Lambda[:,None] - Lambda[None,:])
+    diff[diag_indices_from(diff)] = inf
+    return diff.min() <= tol * max(abs(Lambda).max(), 1.0)
+
+
+def new_parameters(Lambda, S, SinvT, Gamma_Gauss, heights):
+    '''Return the peak positions, Lorentzian HWHM, Gaussian sigmas, and
+    complex heights after exchange from the eigensystem of A.'''
+
+    # Convert Gamma_Gauss to sigma
+    sigma = Gamma_Gauss * INVSQRT2LOG2_2
+
+    # Only the diagonal of Gprime = S^{-1} G S is needed, and
+    # G = diag(sigma**(-2)) is diagonal, so this is a weighted column sum
+    Gprime = einsum('...aj,...a,...aj->...j', SinvT, sigma**(-2), S).real
+    if (Gprime <= 0).any():
         # I'm not sure this is a problem anymore, but this happened at some
         # stage of development
         raise SpectrumError('The input parameters for this system are '
                             'not physical.\nTry increasing the Gaussian '
                             'line widths')
-    # Also create the modified input parameters for return
-    GL = [2 * x for x in HWHM]
-    GG = [SQRT2LOG2_2 * x for x in sigmas]
-    new_params = peaks, GL, GG, [x.real for x in h]
+    sigmas = Gprime**(-0.5)
 
-    ################################################
-    # Use these new values to calculate the spectrum
-    ################################################
+    # The new height for peak j is the sum over a and a' of
+    # heights[a] * S[a,j] * S^{-1}[j,a'], which factorizes
+    h = einsum('...a,...aj->...j', heights, S) * SinvT.sum(-2)
 
-    # Return the sum of voigt profiles for each peak,
-    # along with the new parameters
-    return (array([voigt(omega, j, h, peaks, HWHM, sigmas) for j in N]).sum(0),
-            new_params)
+    return -Lambda.imag, Lambda.real, sigmas, h
 
 
-def voigt(freq, j, height, vib, HWHM, sigma):
+def voigt(freq, j, height, vib, HWHM, sigma, kernel='exact'):
     '''Return a Voigt line shape over a given domain about a given vib'''
+    wofz = faddeeva(kernel)
 
     # Define what to pass to the complex error function
     z = ( freq - vib[j] + 1j*HWHM[j] ) / ( SQRT2 * sigma[j] )
@@ -123,10 +474,151 @@ def voigt(freq, j, height, vib, HWHM, sigma):
     return ( height[j].conjugate() * wofz(z) ).real / ( SQRT2PI * sigma[j] )
 
 
-def height(j, heights, S, Sinv):
-    '''Return the modified peak height'''
-    N = range(len(heights))
-    return sum([heights[a] * S[a,j] * Sinv[j,ap] for a in N for ap in N])
+def voigt_sum(freq, height, vib, HWHM, sigma, blocksize=BLOCKSIZE, out=None,
+              kernel='exact', tol=None):
+    '''Return the sum of the Voigt line shapes of all peaks over a given
+    domain.
+
+    The peaks and the domain are split into blocks so that at most
+    blocksize (peak, frequency) pairs are evaluated at once, and each
+    block is accumulated into the output array.  If out is given, the
+    sum is written into it instead of a new array.
+
+    If tol is given, each peak is only evaluated where its line shape is
+    larger than about tol times the largest peak amplitude, and peaks
+    that are that small over the whole domain are skipped.  The error
+    of each peak is then about tol times the largest amplitude, and that
+    of the sum is up to the number of overlapping tails times that.  If
+    the supports cover most of the domain all points are evaluated
+    anyway, as that is faster.  The domain must be sorted in ascending
+    order for this.
+
+    The peak parameters may carry leading batch axes, in which case a
+    sum is returned for each member of the batch.
+    '''
+    wofz = faddeeva(kernel)
+    freq = asarray(freq, dtype=float)
+
+    # The parts of each line shape that don't depend on the frequency
+    center = asarray(vib) - 1j * asarray(HWHM)
+    scale = SQRT2 * asarray(sigma)
+    coeff = asarray(height).conjugate() / ( SQRT2PI * asarray(sigma) )
+    center, scale, coeff = broadcast_arrays(center, scale, coeff)
+
+    shape = center.shape[:-1] + freq.shape
+    if out is None:
+        out = zeros(shape)
+    else:
+        out[...] = 0.0
+    npeaks, npoints = center.shape[-1], len(freq)
+    if npeaks == 0 or npoints == 0:
+        return out
+
+    # Only evaluate each peak over its support if asked to
+    if tol and not ( freq[1:] < freq[:-1] ).any():
+        if _truncated_voigt_sum(freq, center, scale, coeff, tol, blocksize,
+                                wofz, out):
+            return out
+
+    # Choose the block shape.  Keep all the peaks in one block
+    # if possible so each frequency block is visited only once.
+    nbatch = max(center.size // npeaks, 1)
+    blocksize = max(int(blocksize) // nbatch, 1)
+    fstep = min(max(blocksize // npeaks, 1), npoints)
+    pstep = min(max(blocksize // fstep, 1), npeaks)
+
+    for i in range(0, npoints, fstep):
+        f = freq[i:i+fstep]
+        for j in range(0, npeaks, pstep):
+            z = f - center[...,j:j+pstep,None]
+            z /= scale[...,j:j+pstep,None]
+            # The real part of the weighted sum over the peaks in the block
+            out[...,i:i+fstep] += einsum('...j,...jf->...f',
+                                         coeff[...,j:j+pstep], wofz(z)).real
+    return out
+
+
+def support(center, scale, coeff, tol):
+    '''Return the half-width in frequency of each line shape outside of
+    which it is smaller than about tol times the largest amplitude.
+
+    The absorptive part of a Voigt decays as a Gaussian near the peak
+    and as a Lorentzian in the wings, and the dispersive part decays as
+    1/x.  The half-width is the largest of the distances at which each
+    of these falls below a sixth of the allowed amount.
+    '''
+    # The allowed amount, relative to the largest amplitude of each batch
+    amount = tol * abs(coeff).max(axis=-1)[...,None] / 6
+    amount[amount == 0] = inf
+    y = -center.imag / scale
+    re, im = abs(coeff.real) / amount, abs(coeff.imag) / amount
+
+    # The distances in units of z for each part
+    gauss = npsqrt(y**2 + nplog(maximum(re, 1.0)))
+    lorentz = npsqrt(re * y * INVSQRTPI)
+    dispersive = im * INVSQRTPI
+    return maximum(maximum(gauss, lorentz), dispersive) * scale
+
+
+def _truncated_voigt_sum(freq, center, scale, coeff, tol, blocksize, wofz,
+                         out):
+    '''Add each line shape to out only over its support in freq.
+
+    Returns False without doing anything if the supports cover so much
+    of the domain (more than TRUNCATED_FRACTION of it) that evaluating
+    every point is faster.
+    '''
+    npeaks, npoints = center.shape[-1], len(freq)
+
+    # Find the range of the domain in each peak's support.  Work
+    # with the peaks of all batch members as one flat list.
+    width = support(center, scale, coeff, tol).ravel()
+    center, scale, coeff = center.ravel(), scale.ravel(), coeff.ravel()
+    lo = searchsorted(freq, center.real - width, side='left')
+    hi = searchsorted(freq, center.real + width, side='right')
+    # The index of each peak's first point in the flattened output
+    base = lo + ( arange(len(center)) // npeaks ) * npoints
+
+    # Skip the peaks whose support lies outside the domain, and order the
+    # rest by where they start so that each group covers a short stretch
+    # of the output
+    keep = ( hi > lo ).nonzero()[0]
+    keep = keep[argsort(base[keep], kind='stable')]
+    center, scale, coeff = center[keep], scale[keep], coeff[keep]
+    lo, base, count = lo[keep], base[keep], ( hi - lo )[keep]
+    if not len(count):
+        return True
+    elif count.sum() > TRUNCATED_FRACTION * len(width) * npoints:
+        return False
+
+    # Group the peaks so that about blocksize points are evaluated at once
+    end = cumsum(count)
+    groups = searchsorted(end, arange(blocksize, end[-1], blocksize),
+                          side='right')
+    flat = out.reshape(-1)
+    for p in split(arange(len(count)), groups):
+        if not len(p):
+            continue
+        n = count[p]
+        # The offset of each point from the start of its peak's support
+        offset = arange(n.sum()) - repeat(cumsum(n) - n, n)
+        # The stretch of the output this group adds to
+        start, stop = base[p[0]], ( base[p] + n ).max()
+        p = repeat(p, n)
+        z = freq[lo[p] + offset] - center[p]
+        z /= scale[p]
+        flat[start:stop] += bincount(base[p] - start + offset,
+                                     weights=( coeff[p] * wofz(z) ).real,
+                                     minlength=stop - start)
+    return True
+
+
+def faddeeva(kernel):
+    '''Return the Faddeeva kernel to use in the Voigt profiles'''
+    try:
+        return lineshape_kernel(kernel)
+    except KeyError:
+        raise SpectrumError('Unknown line shape kernel: {0}'.format(kernel))
 
 
 class SpectrumError(Exception):
@@ -0,0 +1,251 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+from itertools import permutations, product
+from collections import OrderedDict
+from hashlib import sha1
+from math import floor, log10
+
+# Non-std lib imports
+from scipy.sparse import issparse
+from numpy import asarray, ascontiguousarray, diag, diag_indices_from, eye, \
+                  inf, isfinite, logspace, trace, zeros
+from numpy.linalg import solve
+
+# Local imports
+from rapid.common.spectrum import eigensystem, new_parameters, voigt_sum, \
+                                  BLOCKSIZE, SQRT2LOG2_2
+
+__all__ = ['rate_sweep', 'continue_eigensystem', 'sweep_points',
+           'RateSurrogate']
+
+# The most corrections to make to the eigenvectors at each rate before
+# falling back to a full eigendecomposition
+MAXITER = 6
+
+# The most memory in bytes that a RateSurrogate keeps spectra in
+SURROGATE_BYTES = 64 * 2**20
+
+
+def rate_sweep(Z, k_values, vib, Gamma_Lorentz, Gamma_Gauss, heights, omega,
+               blocksize=BLOCKSIZE, kernel='exact', tol=None,
+               maxiter=MAXITER):
+    '''Calculate the intensities of one system at each of a sequence of
+    exchange rates.
+
+    The arguments are the same as for spectrum, except that k_values is
+    a sequence of rates.  The eigensystem at each rate is continued from
+    the one at the rate before, so the rates should be in order.  For
+    more than three peaks this is quicker than decomposing A afresh each
+    time (smaller systems are decomposed in closed form), and it keeps each
+    eigenvalue in the same position across all of the rates instead of
+    re-sorting them by peak position, so the new parameters of a peak
+    can be followed through coalescence.
+
+    Returns a (len(k_values) x M) intensity array and the new parameters
+    as a tuple of (len(k_values) x N) arrays.
+    '''
+    k_values = asarray(k_values, dtype=float).ravel()
+    vib = asarray(vib, dtype=float)
+    Gamma_Gauss = asarray(Gamma_Gauss, dtype=float)
+    heights = asarray(heights, dtype=float)
+    npeaks, nk = len(vib), len(k_values)
+    if issparse(Z):
+        Z = Z.toarray()
+    ZI = asarray(Z, dtype=float) - eye(npeaks)
+    D = diag(-1j * vib + 0.5 * asarray(Gamma_Lorentz, dtype=float))
+
+    I = zeros((nk, len(omega)))
+    peaks, GL, GG, h = [zeros((nk, npeaks)) for _ in range(4)]
+    esys = None
+    for i, k in enumerate(k_values):
+        # Construct the A matrix at this rate and find its eigensystem
+        A = D - k * ZI
+        if esys is None:
+            esys = eigensystem(A)
+        else:
+            esys = continue_eigensystem(A, *esys, maxiter=maxiter)
+
+        # Calculate the new parameters and the spectrum
+        p, HWHM, sigmas, hc = new_parameters(*esys, Gamma_Gauss=Gamma_Gauss,
+                                             heights=heights)
+        voigt_sum(omega, hc, p, HWHM, sigmas, blocksize=blocksize,
+                  out=I[i], kernel=kernel, tol=tol)
+        peaks[i], GL[i], GG[i], h[i] = p, 2 * HWHM, SQRT2LOG2_2 * sigmas, \
+                                       hc.real
+
+    return I, (peaks, GL, GG, h)
+
+
+def continue_eigensystem(A, Lambda, S, SinvT, maxiter=MAXITER, tol=1E-12):
+    '''Update the eigensystem of a matrix close to A to that of A,
+    keeping the eigenvalues in the same order.
+
+    Each iteration transforms A with the current eigenvectors, takes the
+    diagonal of S^{-1} A S as the eigenvalues, and corrects S to first
+    order in the off-diagonal elements.  This converges quadratically
+    while the change in A is small compared with the spacing of the
+    eigenvalues.  If a correction is too large or the off-diagonal part
+    has not fallen below tol times the spread of A after maxiter
+    iterations, A is decomposed with eigensystem instead, and its
+    eigenvalues are matched to the first order estimates.  Matrices of
+    three or fewer peaks are always decomposed again (in closed form),
+    and each eigenvalue is matched to the nearest estimate.
+
+    Returns the same as eigensystem.
+    '''
+    n = len(A)
+    # Small matrices are quicker to decompose again than to iterate
+    if n <= 3:
+        predicted = ( SinvT * A.dot(S) ).sum(0)
+        Lambda, S, SinvT = eigensystem(A)
+        # Take the nearest eigenvalue to each estimate, unless two
+        # estimates share one
+        order = abs(predicted[:,None] - Lambda[None,:]).argmin(1)
+        if len(set(order)) < n:
+            order = min(permutations(range(n)),
+                        key=lambda x: abs(predicted - Lambda[list(x)]).sum())
+            order = list(order)
+        return Lambda[order], S[:,order], SinvT[:,order]
+
+    # Remove the mean of the diagonal to reduce round-off
+    mu = trace(A) / n
+    M = A - mu * eye(n)
+    scale = max(abs(M).max(), 1.0)
+
+    predicted = None
+    for i in range(maxiter + 1):
+        Sinv = SinvT.T
+        B = Sinv.dot(M).dot(S)
+        d = B.diagonal().copy()
+        if predicted is None:
+            # The first order estimate of the new eigenvalues
+            predicted = d + mu
+        B[diag_indices_from(B)] = 0
+        if abs(B).max() <= tol * scale:
+            return d + mu, S, SinvT
+        elif i == maxiter:
+            break
+
+        # The first order correction to the eigenvectors is
+        # S (I + C), where C[i,j] = B[i,j] / (d[j] - d[i])
+        gap = d[None,:] - d[:,None]
+        gap[diag_indices_from(gap)] = inf
+        C = B / gap
+        if not isfinite(C).all() or abs(C).max() > 0.5:
+            break
+        C[diag_indices_from(C)] = 1
+        S = S.dot(C)
+        SinvT = solve(C, Sinv).T
+
+    # The update did not converge, so start again and label the new
+    # eigenvalues by the closest of the predicted ones.  SciPy's
+    # optimize is slow to import and only needed here, so wait until now.
+    from scipy.optimize import linear_sum_assignment
+    Lambda, S, SinvT = eigensystem(A)
+    row, col = linear_sum_assignment(abs(predicted[:,None] - Lambda[None,:]))
+    return Lambda[col], S[:,col], SinvT[:,col]
+
+
+def sweep_points(k_values, sweeps, combine='product'):
+    '''Return the points of a parameter sweep.
+
+    k_values is the rates and sweeps is a list of (name, attribute,
+    index, values) for each other swept parameter, as made by
+    read_input.  If combine is 'product' every combination is a point,
+    and if it is 'zip' the nth values of each sweep make the nth point.
+
+    Each point is a tuple of the rates to calculate and a list of
+    (name, attribute, index, value) for the other parameters.  With
+    'product', every point is given all of the rates so that each can be
+    calculated with one rate_sweep.
+    '''
+    k_values = asarray(k_values, dtype=float).ravel()
+    if combine == 'zip':
+        npoints = max([len(k_values)] + [len(x[3]) for x in sweeps])
+        return [(k_values[i:i+1] if len(k_values) > 1 else k_values,
+                 [(name, attr, index, values[i])
+                  for name, attr, index, values in sweeps])
+                for i in range(npoints)]
+    else:
+        return [(k_values, [(name, attr, index, value)
+                            for (name, attr, index, _), value
+                            in zip(sweeps, combo)])
+                for combo in product(*[x[3] for x in sweeps])]
+
+
+class RateSurrogate(object):
+    '''Approximate spectra at any rate by interpolating between spectra
+    calculated beforehand with rate_sweep, i.e. to update a plot while
+    the rate is dragged.
+
+    The rates are divided into tiles one decade wide, each calculated at
+    points_per_decade log-spaced rates.  Since the tiles are the same
+    whatever rate the calculation starts from, they are reused by later
+    drags.  Tiles are kept per system (see key), and the least recently
+    used are dropped once they take more than maxbytes.
+    '''
+
+    def __init__(self, maxbytes=SURROGATE_BYTES, points_per_decade=20):
+        '''Initialize an empty surrogate'''
+        self.maxbytes = maxbytes
+        self.points_per_decade = points_per_decade
+        self.tiles = OrderedDict()
+        self.nbytes = 0
+
+    @staticmethod
+    def key(*arrays):
+        '''Return a key for the system given by arrays, i.e. Z, vib,
+        Gamma_Lorentz, Gamma_Gauss, heights and omega'''
+        digest = sha1()
+        for a in arrays:
+            a = ascontiguousarray(a.toarray() if issparse(a) else a,
+                                  dtype=float)
+            digest.update(str(a.shape).encode('ascii'))
+            digest.update(a.tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def tile(k):
+        '''Return the tile that the rate k falls in'''
+        return int(floor(log10(k)))
+
+    def rates(self, tile):
+        '''Return the rates to calculate for a tile'''
+        return logspace(tile, tile + 1, self.points_per_decade + 1)
+
+    def add(self, key, tile, I):
+        '''Keep the intensities of a tile (as returned by rate_sweep at
+        its rates) for a system'''
+        self.discard(key, tile)
+        self.tiles[key, tile] = I
+        self.nbytes += I.nbytes
+        while self.nbytes > self.maxbytes and len(self.tiles) > 1:
+            old = self.tiles.popitem(last=False)[1]
+            self.nbytes -= old.nbytes
+
+    def discard(self, key, tile):
+        '''Forget a tile if it is kept'''
+        old = self.tiles.pop((key, tile), None)
+        if old is not None:
+            self.nbytes -= old.nbytes
+
+    def __contains__(self, key_tile):
+        return key_tile in self.tiles
+
+    def interpolate(self, key, k):
+        '''Return the intensities of a system at the rate k, or None if
+        its tile has not been calculated'''
+        tile = self.tile(k)
+        try:
+            I = self.tiles.pop((key, tile))
+        except KeyError:
+            return None
+        # Most recently used goes last
+        self.tiles[key, tile] = I
+
+        # Interpolate linearly in log k between the neighbouring rates
+        x = ( log10(k) - tile ) * self.points_per_decade
+        i = min(max(int(floor(x)), 0), self.points_per_decade - 1)
+        w = x - i
+        return ( 1 - w ) * I[i] + w * I[i+1]
@@ -0,0 +1,124 @@
+from __future__ import print_function, division, absolute_import
+
+# Non-std lib imports
+import pytest
+from numpy.testing import assert_allclose
+
+# Local imports
+from rapid.common.read_input import read_input, rate_to_k
+from rapid.common.fit import fit_spectrum, fit_parameters, set_parameters, \
+                             FitError
+
+# The parameters of the data, with the first two peaks apart
+DATA = ['rate 0.5 THz',
+        'peak 1949.8 0.38 l=5.6 g=1.2',
+        'peak 1970.3 0.35 l=5.6 g=0.9',
+        'peak 2027.6 0.27 l=2.6 g=0.7',
+        'exchange 1 2 1.0',
+        'xlim 1900 2050']
+
+# Where the fits start from, away from the parameters of the data
+START = ['rate 1.0 THz',
+         'peak 1951.5 0.38 l=4.5 g=2.0',
+         'peak 1968.0 0.30 l=6.5 g=1.5',
+         'peak 2026.5 0.30 l=3.5 g=1.0',
+         'exchange 1 2 1.0',
+         'xlim 1900 2050']
+
+
+def start_args(raw):
+    '''The parameters to start fitting raw from'''
+    args = read_input(START)
+    args.raw = raw
+    return args
+
+
+def test_fit_parameters(input_lines):
+    params = fit_parameters(read_input(input_lines))
+    assert [p.name for p in params[:3]] == ['rate', 'exchange 1 2',
+                                            'peak 1 vib']
+    assert [p.kind for p in params[-2:]] == ['baseline', 'scale']
+    assert len(params) == 2 + 4 * 3 + 2
+
+
+def test_fit_spectrum_recovers(synthetic_raw):
+    true = read_input(DATA)
+    args = start_args(synthetic_raw(DATA))
+    result = fit_spectrum(args)
+    assert result.success
+    assert result.rms < 1E-6
+    values = dict(zip(result.names, result.values))
+    assert_allclose(values['rate'], true.k, rtol=1E-4)
+    assert_allclose([values['peak {0} vib'.format(i)] for i in (1, 2, 3)],
+                    true.vib, atol=1E-4)
+    assert_allclose([values['peak {0} l'.format(i)] for i in (1, 2, 3)],
+                    true.Gamma_Lorentz, rtol=1E-4)
+    assert_allclose([values['peak {0} g'.format(i)] for i in (1, 2, 3)],
+                    true.Gamma_Gauss, rtol=1E-3)
+    # The heights are relative, and the first is held at its start
+    assert not result.free[result.names.index('peak 1 height')]
+    heights = [values['peak {0} height'.format(i)] for i in (1, 2, 3)]
+    assert_allclose(heights, true.heights, rtol=1E-4)
+    assert_allclose(result.model, result.data, atol=1E-5)
+    assert result.jacobian.shape == (len(result.data), result.free.sum())
+
+    # The fitted parameters go back into the input
+    set_parameters(args, result)
+    assert args.rate[1].lower() == 'thz'
+    assert_allclose(args.rate[0], 0.5, rtol=1E-4)
+    assert_allclose(args.vib, true.vib, atol=1E-4)
+
+
+def test_fit_spectrum_choices(synthetic_raw):
+    args = start_args(synthetic_raw(DATA))
+    result = fit_spectrum(args, fix=['peak 1 vib'],
+                          ties={'peak 2 l' : 'peak 1 l'},
+                          bounds={'rate' : (0.8, 2.0)})
+    values = dict(zip(result.names, result.values))
+    # Fixed, tied and bounded
+    assert values['peak 1 vib'] == 1951.5
+    assert values['peak 2 l'] == values['peak 1 l']
+    assert not result.free[result.names.index('peak 2 l')]
+    assert_allclose(values['rate'], rate_to_k(0.8, 'THz'))
+
+    # Only what is asked for is refined
+    result = fit_spectrum(args, refine=['peak 3', 'scale'])
+    assert [n for n, f in zip(result.names, result.free) if f] == \
+           ['peak 3 vib', 'peak 3 l', 'peak 3 g', 'peak 3 height', 'scale']
+    assert_allclose(result.values[:3], result.initial[:3])
+
+
+def test_fit_spectrum_start(synthetic_raw):
+    # Starting from the answer and refitting noiseless data stays there
+    args = read_input(DATA)
+    args.raw = synthetic_raw(DATA)
+    result = fit_spectrum(args)
+    again = fit_spectrum(args, start=result.values, data=result.data)
+    assert_allclose(again.initial, result.values)
+    assert_allclose(again.values, result.values, rtol=1E-6)
+
+
+def test_fit_spectrum_errors(input_lines, synthetic_raw):
+    args = read_input(input_lines)
+    with pytest.raises(FitError):
+        fit_spectrum(args)
+    args.raw = synthetic_raw()[:1]
+    with pytest.raises(FitError):
+        fit_spectrum(args)
+    args.raw = synthetic_raw()
+    for kwargs in ({'refine' : ['peak 4']},
+                   {'refine' : []},
+                   {'fix' : ['rate', 'vib', 'l', 'g', 'height', 'baseline',
+                             'scale']},
+                   {'ties' : {'peak 1 l' : 'peak 2 l',
+                              'peak 2 l' : 'peak 1 l'}},
+                   {'ties' : {'peak 1 l' : 'l'}},
+                   {'bounds' : {'rate' : (2.0, 1.0)}}):
+        with pytest.raises(FitError):
+            fit_spectrum(args, **kwargs)
+
+    # A sweep has no one spectrum to fit
+    args = read_input(input_lines[1:] + ['rate 1 2 lin 3 THz'])
+    args.raw = synthetic_raw()
+    with pytest.raises(FitError):
+        fit_spectrum(args)
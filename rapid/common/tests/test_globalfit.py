@@ -0,0 +1,118 @@
+from __future__ import print_function, division, absolute_import
+
+# Non-std lib imports
+import pytest
+from numpy import array, exp, log, savetxt
+from numpy.testing import assert_allclose
+
+# Local imports
+from rapid.common.read_input import read_manifest, k_to_rate, rate_to_k
+from rapid.common.fit import FitError
+from rapid.common.globalfit import global_fit, global_parameters, \
+                                   kinetic_rates, kinetic_prefactor, \
+                                   spectrum_args, GAS_CONSTANT, KB_H
+
+PEAKS = ['peak 1949.8 0.38 l=5.6 g=1.2',
+         'peak 1970.3 0.35 l=5.6 g=0.9',
+         'peak 2027.6 0.27 l=2.6 g=0.7',
+         'exchange 1 2 1.0',
+         'xlim 1900 2050']
+
+# The temperatures of the data, its rate at the reference temperature in
+# THz, and its activation energy in kJ/mol
+TEMPERATURES = [270.0, 300.0, 330.0]
+RATE, ACTIVATION = 0.5, 15.0
+
+
+@pytest.fixture
+def manifest(tmp_path, synthetic_raw):
+    '''Write the raw data of the spectra at each temperature, and return
+    the lines of their manifest, starting from a rate and activation
+    energy away from those of the data'''
+    rates = kinetic_rates(rate_to_k(RATE, 'THz'), ACTIVATION,
+                          array(TEMPERATURES), 300.0, 'arrhenius')[0]
+    lines = ['rate 0.8 THz', 'activation 5', 'reference 300'] + PEAKS
+    for T, k in zip(TEMPERATURES, rates):
+        name = str(tmp_path / '{0:.0f}.txt'.format(T))
+        rate = 'rate {0!r} THz'.format(k_to_rate(k, 'THz'))
+        savetxt(name, synthetic_raw([rate] + PEAKS))
+        lines.append('spectrum {0} {1}'.format(name, T))
+    return lines
+
+
+def test_kinetic_rates():
+    T = array([250.0, 300.0, 350.0])
+    for kinetics in ('arrhenius', 'eyring'):
+        rates, dk, dE = kinetic_rates(2.0, 20.0, T, 300.0, kinetics)
+        assert_allclose(rates[1], 2.0)
+        assert (rates[0] < rates[1] < rates[2])
+        # The derivatives are as from finite differences
+        step = 1E-6
+        up = kinetic_rates(2.0 + step, 20.0, T, 300.0, kinetics)[0]
+        assert_allclose(dk, ( up - rates ) / step, rtol=1E-6)
+        up = kinetic_rates(2.0, 20.0 + step, T, 300.0, kinetics)[0]
+        assert_allclose(dE, ( up - rates ) / step, rtol=1E-5)
+    ratio = exp(-20.0 / GAS_CONSTANT * ( 1 / 250.0 - 1 / 300.0 ))
+    assert_allclose(kinetic_rates(2.0, 20.0, T, 300.0, 'arrhenius')[0][0],
+                    2.0 * ratio)
+    assert_allclose(kinetic_rates(2.0, 20.0, T, 300.0, 'eyring')[0][0],
+                    2.0 * ratio * 250.0 / 300.0)
+
+
+def test_kinetic_prefactor():
+    k, T0 = rate_to_k(1.0, 'THz'), 300.0
+    A = kinetic_prefactor(k, 20.0, T0, 'arrhenius')
+    assert_allclose(A * exp(-20.0 / ( GAS_CONSTANT * T0 )), 1E12)
+    # The rate from the Eyring equation with the activation entropy
+    S = kinetic_prefactor(k, 20.0, T0, 'eyring') / 1E3
+    assert_allclose(KB_H * T0 * exp(S / GAS_CONSTANT - 20.0 /
+                                    ( GAS_CONSTANT * T0 )), 1E12)
+    assert_allclose(S, GAS_CONSTANT * log(1E12 / ( KB_H * T0 )) + 20.0 / T0)
+
+
+def test_global_parameters(manifest):
+    args = read_manifest(manifest + ['local l'])
+    params, index = global_parameters(args)
+    names = [p.name for p in params]
+    assert names[:3] == ['rate', 'activation', 'exchange 1 2']
+    assert 'peak 1 l [3]' in names and 'peak 1 l' not in names
+    assert 'scale [2]' in names and 'peak 1 vib' in names
+    assert index.shape == (3, 2 + 4 * 3 + 2)
+    assert (index[:,0] == -1).all()
+    # Shared parameters have one index, local ones one for each spectrum
+    assert len(set(index[:,2])) == 1 and len(set(index[:,-1])) == 3
+
+    with pytest.raises(FitError):
+        global_parameters(read_manifest(manifest + ['local rate']))
+
+
+@pytest.mark.parametrize('njobs', [1, 2])
+def test_global_fit_recovers(manifest, njobs):
+    args = read_manifest(manifest)
+    result = global_fit(args, njobs=njobs)
+    assert result.success and result.rms < 1E-6
+    assert_allclose(k_to_rate(result.values[0], 'THz'), RATE, rtol=1E-4)
+    assert_allclose(result.values[1], ACTIVATION, rtol=1E-3)
+    assert_allclose(result.rates, kinetic_rates(result.values[0],
+                                                result.values[1],
+                                                args.temperatures, 300.0,
+                                                'arrhenius')[0])
+    assert len(result.model) == 3
+    assert_allclose(result.temperatures, TEMPERATURES)
+
+    # Each spectrum's own parameters
+    spectrum = spectrum_args(args, result, 0)
+    assert_allclose(spectrum.k, result.rates[0])
+    assert_allclose(spectrum.vib, [1949.8, 1970.3, 2027.6], atol=1E-4)
+    assert spectrum.rawName == args.spectra[0]
+    assert_allclose(spectrum_args(args, result, None).k, result.values[0])
+
+
+def test_global_fit_errors(manifest):
+    args = read_manifest(manifest)
+    args.xlim = [2100, 2200]
+    with pytest.raises(FitError):
+        global_fit(args)
+    args = read_manifest(manifest)
+    with pytest.raises(FitError):
+        global_fit(args, refine=['activation'], fix=['activation'])
@@ -0,0 +1,116 @@
+from __future__ import print_function, division, absolute_import
+
+# Non-std lib imports
+import pytest
+from numpy import array, concatenate
+from numpy.testing import assert_allclose
+
+# Local imports
+from rapid.common.spectrum import ZMat, spectrum, SpectrumError
+from rapid.common.jacobian import spectrum_jacobian, \
+                                  spectrum_jacobian_batch, ZMat_derivatives
+
+PAIRS = [(0, 1), (1, 2), (0, 3)]
+
+
+def numeric_derivatives(f, x, step=1E-6):
+    '''Return the derivatives of f with respect to each of x by central
+    differences, with a step relative to each of x'''
+    columns = []
+    for i in range(len(x)):
+        h = step * max(abs(x[i]), 1.0)
+        up, down = x.copy(), x.copy()
+        up[i] += h
+        down[i] -= h
+        columns.append(( f(up) - f(down) ) / ( 2 * h ))
+    return array(columns).T
+
+
+def flat_spectrum(x, omega, symmetric=True):
+    '''The intensities and new parameters of a four peak system, from k,
+    the rates in PAIRS, then each peak's parameters, as one vector'''
+    k, rates = x[0], x[1:1+len(PAIRS)]
+    vib, GL, GG, h = x[1+len(PAIRS):].reshape(4, -1)
+    Z = ZMat(len(vib), PAIRS, rates, symmetric)
+    I, params = spectrum(Z, k, vib, GL, GG, h, omega)
+    return concatenate([I] + list(params))
+
+
+@pytest.mark.parametrize('symmetric,rates', [(True, [0.2, 0.3, 0.1]),
+                                             (True, [0.6, 0.7, 0.5]),
+                                             (False, [0.2, 0.3, 0.1])])
+def test_ZMat_derivatives(symmetric, rates):
+    # Also where the rows sum to more than one, so Z is normalized
+    rates = array(rates)
+    dZ = ZMat_derivatives(4, PAIRS, rates, symmetric)
+    f = lambda r: ZMat(4, PAIRS, r, symmetric).ravel()
+    numeric = numeric_derivatives(f, rates).T.reshape(dZ.shape)
+    assert_allclose(dZ, numeric, atol=1E-8)
+
+
+def test_ZMat_derivatives_repeated():
+    # Only the last of a repeated exchange changes Z
+    dZ = ZMat_derivatives(3, [(0, 1), (1, 2), (0, 1)], [0.1, 0.2, 0.3],
+                          True)
+    assert (dZ[0] == 0).all() and abs(dZ[2]).max() > 0
+
+
+@pytest.mark.parametrize('k', [0.5, 5.0, 50.0])
+def test_spectrum_jacobian(random, omega, k):
+    # From slow to fast exchange
+    vib = array([1930.0, 1955.0, 1980.0, 2010.0])
+    GL, GG = random.uniform(2, 6, 4), random.uniform(4, 6, 4)
+    h = random.uniform(0.2, 1, 4)
+    rates = array([0.2, 0.3, 0.1])
+    x = concatenate([[k], rates, vib, GL, GG, h])
+
+    Z = ZMat(4, PAIRS, rates, True)
+    dZ = ZMat_derivatives(4, PAIRS, rates, True)
+    result = spectrum_jacobian(Z, k, vib, GL, GG, h, omega, dZ=dZ)
+    assert len(result.names) == len(x)
+    assert result.names[:2] == ['k', 'exchange 1']
+    assert result.names[-1] == 'heights 4'
+
+    # The values are as from spectrum
+    I, params = spectrum(Z, k, vib, GL, GG, h, omega)
+    assert_allclose(result.intensity, I, atol=1E-12 * abs(I).max())
+    for p, p0 in zip(result.new_params, params):
+        assert_allclose(p, p0, rtol=1E-10)
+
+    # The derivatives are as from finite differences
+    numeric = numeric_derivatives(lambda x: flat_spectrum(x, omega), x)
+    npoints = len(omega)
+    assert_allclose(result.jacobian, numeric[:npoints], rtol=0,
+                    atol=1E-5 * abs(numeric[:npoints]).max())
+    for i, dp in enumerate(result.new_params_jacobian):
+        n = numeric[npoints+4*i:npoints+4*(i+1)]
+        assert_allclose(dp, n, rtol=0, atol=1E-5 * max(abs(n).max(), 1))
+
+
+def test_spectrum_jacobian_batch(random, omega):
+    vib = array([[1930.0, 1955.0, 1980.0, 2010.0],
+                 [1940.0, 1950.0, 1990.0, 2000.0]])
+    GL, GG = random.uniform(2, 6, 4), random.uniform(4, 6, 4)
+    h = random.uniform(0.2, 1, 4)
+    rates = array([0.2, 0.3, 0.1])
+    Z = ZMat(4, PAIRS, rates, True)
+    dZ = ZMat_derivatives(4, PAIRS, rates, True)
+    omegas = [omega, omega[::2]]
+    results = spectrum_jacobian_batch(Z, [1.0, 3.0], vib, GL, GG, h, omegas,
+                                      dZ=dZ)
+    for b, result in enumerate(results):
+        expected = spectrum_jacobian(Z, [1.0, 3.0][b], vib[b], GL, GG, h,
+                                     omegas[b], dZ=dZ)
+        assert_allclose(result.intensity, expected.intensity)
+        assert_allclose(result.jacobian, expected.jacobian, atol=1E-12)
+
+
+def test_spectrum_jacobian_degenerate(omega):
+    # Two identical peaks that don't exchange have the same eigenvalue,
+    # and an exchange between them is not differentiable
+    Z = ZMat(2, [(0, 1)], [0.0], True)
+    dZ = ZMat_derivatives(2, [(0, 1)], [0.0], True)
+    vib, GL, GG, h = [1950.0] * 2, [3.0] * 2, [4.0] * 2, [0.5, 0.5]
+    spectrum_jacobian(Z, 1.0, vib, GL, GG, h, omega)
+    with pytest.raises(SpectrumError):
+        spectrum_jacobian(Z, 1.0, vib, GL, GG, h, omega, dZ=dZ)
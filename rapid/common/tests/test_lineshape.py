@@ -0,0 +1,66 @@
+from __future__ import print_function, division, absolute_import
+
+# Non-std lib imports
+import pytest
+from scipy.special import wofz
+from numpy import concatenate, linspace, logspace
+from numpy.testing import assert_allclose
+
+# Local imports
+from rapid.common.lineshape import KERNELS, lineshape_kernel, exact
+from rapid.common.spectrum import voigt_sum, SpectrumError
+
+# The largest absolute error each kernel claims
+ERRORS = {'exact' : 0.0, 'humlicek' : 5E-5, 'weideman' : 2E-7,
+          'table' : 5E-5}
+
+
+def upper_half_plane():
+    '''A grid over the upper half plane, close to the real axis and on
+    both sides of where the kernels change method'''
+    x = concatenate([linspace(-40, 40, 1601),
+                     [-8, -5.5, 5.5, 7.999, 8, 8.001]])
+    y = concatenate([[0, 1E-8], logspace(-3, 1.6, 200)])
+    return x[None,:] + 1j * y[:,None]
+
+
+@pytest.mark.parametrize('name', sorted(KERNELS))
+def test_kernel_error(name):
+    z = upper_half_plane()
+    w = KERNELS[name](z)
+    assert w.shape == z.shape
+    assert abs(w - wofz(z)).max() <= ERRORS[name]
+
+
+@pytest.mark.parametrize('name', sorted(KERNELS))
+def test_kernel_near_and_far(name):
+    # Points all close to or all far from the origin take other paths
+    for z in (linspace(-1, 1, 11) + 0.5j, linspace(20, 30, 11) + 0.5j):
+        assert abs(KERNELS[name](z) - wofz(z)).max() <= ERRORS[name]
+
+
+def test_lineshape_kernel():
+    assert lineshape_kernel('Exact') is exact
+    custom = lambda z: wofz(z)
+    assert lineshape_kernel(custom) is custom
+    with pytest.raises(KeyError):
+        lineshape_kernel('unknown')
+
+
+@pytest.mark.parametrize('name', sorted(KERNELS))
+def test_voigt_sum_kernel(name):
+    omega = linspace(1850, 2050, 2001)
+    vib = linspace(1900, 2000, 5)
+    HWHM, sigma = linspace(0.5, 3, 5), linspace(3, 0.5, 5)
+    h = linspace(1, 0.2, 5) + 0.1j
+    I0 = voigt_sum(omega, h, vib, HWHM, sigma)
+    I = voigt_sum(omega, h, vib, HWHM, sigma, kernel=name)
+    # The error of w is scaled by each peak's height over its sigma
+    bound = ERRORS[name] * ( abs(h) / sigma ).sum() / 2.5
+    assert_allclose(I, I0, rtol=0, atol=bound)
+
+
+def test_voigt_sum_unknown_kernel():
+    with pytest.raises(SpectrumError):
+        voigt_sum(linspace(0, 1, 5), [1.0], [0.5], [0.1], [0.1],
+                  kernel='unknown')
@@ -0,0 +1,88 @@
+from __future__ import print_function, division, absolute_import
+
+# Non-std lib imports
+import pytest
+from numpy import linspace
+from numpy.testing import assert_allclose
+
+# Local imports
+from rapid.common.model import SpectrumModel
+from rapid.common.spectrum import spectrum
+
+
+def check(model, Z, k, vib, GL, GG, h, omega):
+    '''Check the model against spectrum'''
+    I, params = model.calculate()
+    I0, params0 = spectrum(Z, k, vib, GL, GG, h, omega)
+    assert_allclose(I, I0, rtol=1E-10, atol=1E-12 * abs(I0).max())
+    for p, p0 in zip(params, params0):
+        assert_allclose(p, p0, rtol=1E-10, atol=1E-12)
+
+
+def test_model_stages(random_system, omega):
+    Z, vib, GL, GG, h = random_system(5)
+    model = SpectrumModel(Z, 2.0, vib, GL, GG, h, omega)
+    check(model, Z, 2.0, vib, GL, GG, h, omega)
+    blocks, params = model.blocks, model.new_params
+
+    # The same inputs again change nothing
+    model.update(Z=Z.copy(), k=2.0, vib=list(vib), heights=h)
+    assert model.blocks is blocks and model.new_params is params
+    assert model.intensity is not None
+
+    # The heights only redo the parameters and intensities
+    h = h[::-1].copy()
+    model.update(heights=h)
+    assert model.blocks is blocks and model.new_params is None
+    check(model, Z, 2.0, vib, GL, GG, h, omega)
+
+    # The domain only redoes the intensities
+    params = model.new_params
+    omega = linspace(1900, 2000, 51)
+    model.omega = omega
+    assert model.new_params is params and model.intensity is None
+    check(model, Z, 2.0, vib, GL, GG, h, omega)
+
+    # The rate redoes everything
+    model.k = 20.0
+    assert model.blocks is None
+    check(model, Z, 20.0, vib, GL, GG, h, omega)
+
+
+def test_model_copies_inputs(random_system, omega):
+    # Changing the caller's array in place is noticed
+    Z, vib, GL, GG, h = random_system(4)
+    model = SpectrumModel(Z, 2.0, vib, GL, GG, h, omega)
+    model.calculate()
+    vib[0] += 10
+    model.update(vib=vib)
+    check(model, Z, 2.0, vib, GL, GG, h, omega)
+
+
+def test_model_errors(random_system, omega):
+    Z, vib, GL, GG, h = random_system(3)
+    model = SpectrumModel(Z, 2.0, vib, GL)
+    with pytest.raises(ValueError):
+        model.calculate()
+    with pytest.raises(TypeError):
+        model.update(rate=2.0)
+    model.update(Gamma_Gauss=GG, heights=h, omega=omega)
+    check(model, Z, 2.0, vib, GL, GG, h, omega)
+
+
+def test_model_intensity_at(random_system, omega):
+    Z, vib, GL, GG, h = random_system(4)
+    model = SpectrumModel(Z, 2.0, vib, GL, GG, h, omega)
+    I = model.calculate()[0].copy()
+    coarse = omega[::10]
+    assert_allclose(model.intensity_at(coarse), I[::10])
+    assert_allclose(model.calculate()[0], I)
+
+
+def test_model_parameters(random_system):
+    Z, vib, GL, GG, h = random_system(3)
+    model = SpectrumModel(Z, 2.0, vib, GL)
+    with pytest.raises(ValueError):
+        model.parameters()
+    model.update(Gamma_Gauss=GG, heights=h)
+    assert len(model.parameters()[0]) == 3
@@ -0,0 +1,84 @@
+from __future__ import print_function, division, absolute_import
+
+# Non-std lib imports
+import pytest
+from numpy import linspace, logspace
+from numpy.testing import assert_allclose
+
+# Local imports
+from rapid.common.read_input import read_input, sweep_values, rate_to_k, \
+                                    k_to_rate, ReaderError
+
+# The peaks and exchanges of the template input file
+PEAKS = ['peak 1949.8 0.38 l=5.6 g=1.2',
+         'peak 1970.3 0.35 l=5.6 g=0.9',
+         'peak 2027.6 0.27 l=2.6 g=0.7',
+         'exchange 1 2 1.0']
+
+
+def test_rate_range():
+    args = read_input(['rate 0.1 10 log 5 THz'] + PEAKS)
+    assert args.rate == (0.1, 'thz')
+    assert_allclose(args.k_values, rate_to_k(logspace(-1, 1, 5), 'thz'))
+    assert args.k == args.k_values[0]
+
+    args = read_input(['lifetime 1 4 lin 4'] + PEAKS)
+    assert args.lifetime == (1, 'ps')
+    assert_allclose(args.k_values, rate_to_k(linspace(1, 4, 4), 'ps'))
+
+    args = read_input(['rate 1.54 THz'] + PEAKS)
+    assert args.k_values is None and args.sweeps == []
+
+
+@pytest.mark.parametrize('line', ['rate 0.1 10 THz', 'rate 1 10 cubic 5',
+                                  'rate 1 10 lin five', 'rate -1 10 log 5',
+                                  'rate 1 10 lin 0'])
+def test_rate_range_errors(line):
+    with pytest.raises(ReaderError):
+        read_input([line] + PEAKS)
+
+
+def test_sweep_values():
+    assert_allclose(sweep_values('x', 2.0), [2.0])
+    assert_allclose(sweep_values('x', '1,2,5'), [1, 2, 5])
+    assert_allclose(sweep_values('x', 'lin:1:10:4'), [1, 4, 7, 10])
+    assert_allclose(sweep_values('x', 'log:0.1:10:3'), [0.1, 1, 10])
+    for value in ('1,two', 'lin:1:10', 'log:0:1:5', 'lin:1:2:0'):
+        with pytest.raises(ReaderError):
+            sweep_values('x', value)
+
+
+def test_parameter_sweeps():
+    args = read_input(['rate 1.54 THz',
+                       'peak 1949.8 0.38 l=lin:2:8:4 g=1.2',
+                       'peak 1970.3 0.3,0.4 l=5.6 g=0.9',
+                       'exchange 1 2 0.5,1.0'])
+    # Each parameter holds its first value
+    assert_allclose(args.Gamma_Lorentz, [2, 5.6])
+    assert_allclose(args.heights, [0.38, 0.3])
+    assert_allclose(args.exchange_rates, [0.5])
+    sweeps = dict((name, (attr, index, values))
+                  for name, attr, index, values in args.sweeps)
+    assert sorted(sweeps) == ['exchange 1 2', 'peak 1 l', 'peak 2 height']
+    assert sweeps['peak 1 l'][:2] == ('Gamma_Lorentz', 0)
+    assert_allclose(sweeps['peak 1 l'][2], [2, 4, 6, 8])
+    assert sweeps['peak 2 height'][:2] == ('heights', 1)
+    assert sweeps['exchange 1 2'][:2] == ('exchange_rates', 0)
+    assert args.combine == 'product'
+
+
+def test_zip_lengths():
+    lines = ['rate 1.54 THz', 'sweep zip',
+             'peak 1949.8 0.38 l=lin:2:8:3 g=1.2',
+             'peak 1970.3 0.3,0.4,0.5 l=5.6 g=0.9']
+    assert read_input(lines).combine == 'zip'
+    with pytest.raises(ReaderError):
+        read_input(lines[:-1] + ['peak 1970.3 0.3,0.4 l=5.6 g=0.9'])
+    with pytest.raises(ReaderError):
+        read_input(['rate 1 10 lin 2'] + lines[1:])
+
+
+@pytest.mark.parametrize('unit', ['thz', 'ghz', 'ps', 'fs'])
+def test_rate_units(unit):
+    k = rate_to_k(2.5, unit)
+    assert_allclose(k_to_rate(k, unit), 2.5)
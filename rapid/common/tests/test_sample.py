@@ -0,0 +1,155 @@
+from __future__ import print_function, division, absolute_import
+
+# Non-std lib imports
+import pytest
+from input_reader import ReaderError
+from scipy.stats import norm
+from numpy import array, cov, exp, full, inf, isfinite, isnan, linspace, \
+                  log, nan, trapz, zeros
+from numpy.linalg import inv
+from numpy.random import RandomState
+from numpy.testing import assert_allclose
+
+# Local imports
+from rapid.common.read_input import read_input, rate_to_k
+from rapid.common.fit import fit_spectrum
+from rapid.common.sample import Posterior, ensemble_sampler, \
+                                autocorrelation_time, log_prior
+
+# A correlated Gaussian target
+MEAN = array([1.0, -2.0])
+COVARIANCE = array([[1.0, 0.8], [0.8, 4.0]])
+
+DATA = ['rate 0.5 THz',
+        'peak 1949.8 0.38 l=5.6 g=1.2',
+        'peak 1970.3 0.35 l=5.6 g=0.9',
+        'peak 2027.6 0.27 l=2.6 g=0.7',
+        'exchange 1 2 1.0',
+        'xlim 1900 2050']
+
+
+def gaussian(X):
+    '''The log probability of the target, up to a constant'''
+    d = X - MEAN
+    return -0.5 * ( d.dot(inv(COVARIANCE)) * d ).sum(1)
+
+
+def ar1(random, phi, nsteps, nwalkers):
+    '''An (N x W) AR(1) chain, whose autocorrelation time is
+    (1 + phi) / (1 - phi)'''
+    x = zeros((nsteps, nwalkers))
+    x[0] = random.randn(nwalkers) / ( 1 - phi**2 )**0.5
+    for i in range(1, nsteps):
+        x[i] = phi * x[i-1] + random.randn(nwalkers)
+    return x
+
+
+def test_ensemble_sampler(random):
+    walkers = MEAN + 0.1 * random.randn(32, 2)
+    start = walkers.copy()
+    samples, nsteps = [], 3000
+    for step, (w, logp, accepted) in enumerate(
+            ensemble_sampler(gaussian, walkers, nsteps)):
+        assert_allclose(logp, gaussian(w))
+        if step >= 500:
+            samples.append(w.copy())
+    samples = array(samples).reshape(-1, 2)
+    assert_allclose(samples.mean(0), MEAN, atol=0.15)
+    assert_allclose(cov(samples.T), COVARIANCE, rtol=0.15, atol=0.1)
+    # The stretch move accepts about half of the moves in two dimensions
+    acceptance = accepted / nsteps
+    assert 0.3 < acceptance.mean() < 0.9
+    # The walkers given aren't changed
+    assert (walkers == start).all()
+
+
+def test_ensemble_sampler_seeded():
+    walkers = MEAN + 0.1 * RandomState(0).randn(8, 2)
+    runs = [[w.copy() for w, _, _ in ensemble_sampler(
+                 gaussian, walkers, 20, random=RandomState(5))]
+            for _ in range(2)]
+    assert_allclose(runs[0], runs[1])
+
+
+def test_ensemble_sampler_support():
+    # Walkers never move to where the probability is zero
+    def half(X):
+        logp = gaussian(X)
+        logp[X[:,0] < 1.0] = -inf
+        return logp
+    walkers = array([[1.5, -2.0], [2.0, -1.0], [1.2, -3.0], [3.0, -2.5]])
+    for w, logp, _ in ensemble_sampler(half, walkers, 200,
+                                       random=RandomState(2)):
+        assert ( w[:,0] >= 1.0 ).all() and isfinite(logp).all()
+
+
+@pytest.mark.parametrize('nwalkers', [2, 5])
+def test_ensemble_sampler_walkers(nwalkers):
+    with pytest.raises(ValueError):
+        next(ensemble_sampler(gaussian, zeros((nwalkers, 2)), 1))
+
+
+def test_autocorrelation_time(random):
+    chain = array([ar1(random, 0.8, 20000, 4), ar1(random, 0.0, 20000, 4),
+                   zeros((20000, 4))]).transpose(1, 2, 0)
+    tau = autocorrelation_time(chain)
+    assert_allclose(tau[:2], [9.0, 1.0], rtol=0.1)
+    # A parameter that doesn't change
+    assert isnan(tau[2])
+
+
+def test_log_prior():
+    x = linspace(-1, 12, 27)
+    assert_allclose(log_prior('normal', 2.0, 3.0, x),
+                    norm.logpdf(x, 2.0, 3.0))
+    logp = log_prior('uniform', 1.0, 5.0, x)
+    assert_allclose(logp[( x >= 1 ) & ( x <= 5 )], -log(4.0))
+    assert ( logp[( x < 1 ) | ( x > 5 )] == -inf ).all()
+
+    # The loguniform density integrates to one
+    x = linspace(0.5, 20, 200001)
+    logp = log_prior('loguniform', 1.0, 10.0, x)
+    assert_allclose(trapz(exp(logp), x), 1.0, rtol=1E-3)
+    assert ( logp[x > 10] == -inf ).all()
+
+
+def test_read_priors(input_lines):
+    args = read_input(input_lines + ['prior peak 1 vib normal 1950 2',
+                                     'prior rate loguniform 0.1 10'])
+    assert args.priors == [('peak 1 vib', 'normal', 1950.0, 2.0),
+                           ('rate', 'loguniform', 0.1, 10.0)]
+    assert read_input(input_lines).priors == []
+    for line in ('prior peak 1 vib cauchy 1950 2',
+                 'prior normal 1950',
+                 'prior peak 1 vib normal a 2',
+                 'prior peak 1 vib normal 1950 0',
+                 'prior rate uniform 2 1',
+                 'prior rate loguniform 0 1'):
+        with pytest.raises(ReaderError):
+            read_input(input_lines + [line])
+
+
+def test_posterior(synthetic_raw, random):
+    args = read_input(DATA + ['prior rate uniform 0.2 0.8',
+                              'prior peak 1 vib normal 1949.8 0.5'])
+    args.raw = synthetic_raw(DATA, noise=1E-3)
+    best = fit_spectrum(args, refine=['rate', 'vib', 'baseline', 'scale'])
+    posterior = Posterior(args, best, ['rate', 'vib', 'baseline', 'scale'])
+    assert posterior.ndim == 6
+    x0 = best.values[posterior.index]
+    assert_allclose(posterior.values(x0[None])[0], best.values)
+
+    # The best fit is more probable than a point away from it, and a
+    # rate outside of its prior is impossible
+    X = array([x0, x0, x0])
+    X[1,1] += 1.0
+    X[2,0] = rate_to_k(0.9, 'THz')
+    logp = posterior(X)
+    assert logp[0] > logp[1] and logp[2] == -inf
+
+    # The batch is as each member on its own
+    assert_allclose(logp[:2], [posterior(X[i:i+1])[0] for i in range(2)])
+
+    # Also when the standard errors could not be found
+    walkers, logp = posterior.start(10, full(6, nan), random)
+    assert walkers.shape == (10, 6) and isfinite(logp).all()
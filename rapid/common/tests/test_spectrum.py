@@ -0,0 +1,301 @@
+from __future__ import print_function, division, absolute_import
+
+# Non-std lib imports
+import pytest
+from scipy.linalg import eig, inv
+from scipy.sparse import issparse
+from scipy.special import wofz
+from numpy import allclose, argsort, array, diag, dot, empty, eye, \
+                  linspace, sqrt, stack, zeros
+from numpy.testing import assert_allclose
+
+# Local imports
+from rapid.common.spectrum import ZMat, spectrum, spectrum_batch, \
+                                  eigensystem, exchange_eigensystem, \
+                                  exchange_parameters, \
+                                  closed_form_eigensystem, \
+                                  new_parameters, voigt, voigt_sum, \
+                                  _truncated_voigt_sum, INVSQRT2LOG2_2, \
+                                  SQRT2, SQRT2PI, SQRT2LOG2_2
+
+
+def dense_ZMat(npeaks, peak_exchanges, relative_rates, symmetric):
+    '''Construct the Z matrix one element at a time'''
+    Z = zeros((npeaks, npeaks))
+    if symmetric:
+        for index, rate in zip(peak_exchanges, relative_rates):
+            Z[index[0],index[1]] = rate
+            Z[index[1],index[0]] = rate
+        sums = Z.sum(1)
+        for i in range(npeaks):
+            Z[i,i] = 1 - sums[i]
+        if any(sums > 1):
+            Z /= sums.max()
+    else:
+        for index, rate in zip(peak_exchanges, relative_rates):
+            Z[index[0],index[1]] = rate
+    return Z
+
+
+def dense_spectrum(Z, k, vib, Gamma_Lorentz, Gamma_Gauss, heights, omega):
+    '''The spectrum the dense way, by inverting the eigenvectors and
+    summing over each peak and each pair of peaks in turn'''
+    npeaks = len(vib)
+    N = range(npeaks)
+    K = k * ( Z - eye(npeaks) )
+    A = diag(-1j * vib + 0.5 * Gamma_Lorentz) - K
+    Lambda, S = eig(A)
+    indx = argsort(abs(Lambda.imag))
+    S, Sinv, Lambda = S[:,indx], inv(S[:,indx]), Lambda[indx]
+    sigma = Gamma_Gauss * INVSQRT2LOG2_2
+    Gprime = diag(dot(dot(Sinv, diag(sigma**(-2))), S)).real
+    h = array([sum(heights[a] * S[a,j] * Sinv[j,b] for a in N for b in N)
+               for j in N])
+    peaks, HWHM, sigmas = -Lambda.imag, Lambda.real, 1 / sqrt(Gprime)
+    I = zeros(len(omega))
+    for j in N:
+        z = ( omega - peaks[j] + 1j * HWHM[j] ) / ( SQRT2 * sigmas[j] )
+        I += ( h[j].conjugate() * wofz(z) ).real / ( SQRT2PI * sigmas[j] )
+    return I, (peaks, 2 * HWHM, SQRT2LOG2_2 * sigmas, h.real)
+
+
+@pytest.mark.parametrize('npeaks', [4, 6])
+@pytest.mark.parametrize('k', [0.5, 5.0, 50.0])
+@pytest.mark.parametrize('symmetric', [True, False])
+def test_spectrum_matches_dense(random_system, omega,
+                                npeaks, k, symmetric):
+    Z, vib, GL, GG, h = random_system(npeaks, symmetric=symmetric)
+    I, params = spectrum(Z, k, vib, GL, GG, h, omega)
+    I0, params0 = dense_spectrum(Z, k, vib, GL, GG, h, omega)
+    assert_allclose(I, I0, rtol=1E-8, atol=1E-10 * abs(I0).max())
+    for p, p0 in zip(params, params0):
+        assert_allclose(p, p0, rtol=1E-8, atol=1E-10)
+
+
+def test_new_parameters_heights(random_system):
+    Z, vib, GL, GG, h = random_system(5)
+    A = diag(-1j * vib + 0.5 * GL) - 3.0 * ( Z - eye(5) )
+    Lambda, S, SinvT = eigensystem(A)
+    Sinv = SinvT.T
+    peaks, HWHM, sigmas, heights = new_parameters(Lambda, S, SinvT, GG, h)
+
+    # Each height is the double sum over the input heights
+    N = range(5)
+    for j in N:
+        assert allclose(heights[j], sum(h[a] * S[a,j] * Sinv[j,b]
+                                        for a in N for b in N))
+    # The diagonal of S^{-1} G S gives the widths
+    G = diag(( GG * INVSQRT2LOG2_2 )**(-2))
+    assert_allclose(sigmas, diag(Sinv.dot(G).dot(S)).real**(-0.5))
+    assert_allclose(peaks, -Lambda.imag)
+    assert_allclose(HWHM, Lambda.real)
+    # The heights are conserved
+    assert_allclose(heights.sum(), h.sum())
+
+
+def peak_parameters(random, npeaks):
+    '''Random peak positions, HWHM, sigmas and complex heights'''
+    return (random.uniform(1900, 2000, npeaks),
+            random.uniform(0.5, 4, npeaks), random.uniform(0.5, 4, npeaks),
+            random.uniform(0.2, 1, npeaks) + 0.1j * random.randn(npeaks))
+
+
+@pytest.mark.parametrize('blocksize', [1, 7, 100, 5000, 10**6])
+def test_voigt_sum_blocks(random, omega, blocksize):
+    vib, HWHM, sigma, h = peak_parameters(random, 9)
+    I0 = array([voigt(omega, j, h, vib, HWHM, sigma)
+                for j in range(9)]).sum(0)
+    I = voigt_sum(omega, h, vib, HWHM, sigma, blocksize=blocksize)
+    assert_allclose(I, I0, rtol=1E-12, atol=1E-14)
+
+
+def test_voigt_sum_out(random, omega):
+    vib, HWHM, sigma, h = peak_parameters(random, 3)
+    out = empty(len(omega))
+    out.fill(7.0)
+    I = voigt_sum(omega, h, vib, HWHM, sigma, out=out)
+    assert I is out
+    assert_allclose(out, voigt_sum(omega, h, vib, HWHM, sigma))
+
+
+def test_voigt_sum_empty(random):
+    vib, HWHM, sigma, h = peak_parameters(random, 3)
+    assert voigt_sum(linspace(0, 1, 0), h, vib, HWHM, sigma).shape == (0,)
+    assert not voigt_sum(linspace(0, 1, 5), h[:0], vib[:0], HWHM[:0],
+                         sigma[:0]).any()
+
+
+@pytest.mark.parametrize('npeaks', [2, 3, 5])
+def test_spectrum_batch(random_system, omega, npeaks):
+    systems = [random_system(npeaks) for _ in range(4)]
+    k = array([0.3, 2.0, 20.0, 200.0])
+    Z, vib, GL, GG, h = [stack(x) for x in zip(*systems)]
+    I, params = spectrum_batch(Z, k, vib, GL, GG, h, omega)
+    assert I.shape == (4, len(omega))
+    for b, system in enumerate(systems):
+        I0, params0 = spectrum(system[0], k[b], *(system[1:] + (omega,)))
+        assert_allclose(I[b], I0, rtol=1E-8, atol=1E-10 * abs(I0).max())
+        for p, p0 in zip(params, params0):
+            assert_allclose(p[b], p0, rtol=1E-8, atol=1E-10)
+
+
+def test_spectrum_batch_shared(random_system, omega):
+    # Only the rate changes between the members
+    Z, vib, GL, GG, h = random_system(4)
+    k = array([0.5, 5.0, 50.0])
+    I, params = spectrum_batch(Z, k, vib, GL, GG, h, omega)
+    for b in range(3):
+        I0, _ = spectrum(Z, k[b], vib, GL, GG, h, omega)
+        assert_allclose(I[b], I0, rtol=1E-8, atol=1E-10 * abs(I0).max())
+
+
+def narrow_peaks(random, npeaks, dispersive=0.2):
+    '''Narrow peaks spread over a wide domain, and that domain'''
+    omega = linspace(0, 10000, 20001)
+    vib = random.uniform(-50, 10050, npeaks)
+    HWHM = random.uniform(0.05, 0.2, npeaks)
+    sigma = random.uniform(0.5, 2, npeaks)
+    h = random.uniform(0.2, 1, npeaks) \
+      + dispersive * 1j * random.randn(npeaks)
+    return omega, vib, HWHM, sigma, h
+
+
+# The dispersive part decays slowly, so with it the
+# supports only fall short of the domain at large tol
+@pytest.mark.parametrize('tol, dispersive', [(1E-2, 0.2), (1E-3, 0.2),
+                                             (1E-4, 0.0), (1E-6, 0.0)])
+def test_voigt_sum_truncated(random, tol, dispersive):
+    omega, vib, HWHM, sigma, h = narrow_peaks(random, 200, dispersive)
+    I0 = voigt_sum(omega, h, vib, HWHM, sigma)
+    I = voigt_sum(omega, h, vib, HWHM, sigma, tol=tol, blocksize=5000)
+
+    # The truncated path is the one taken
+    center, scale = vib - 1j * HWHM, SQRT2 * sigma
+    coeff = h.conjugate() / ( SQRT2PI * sigma )
+    out = zeros(len(omega))
+    assert _truncated_voigt_sum(omega, center, scale, coeff, tol, 5000,
+                                wofz, out)
+    assert_allclose(out, I)
+
+    # Each peak is off by at most about tol times the largest amplitude,
+    # and only a few overlap anywhere
+    assert abs(I - I0).max() <= 5 * tol * abs(coeff).max()
+
+
+def test_voigt_sum_truncated_batch(random):
+    omega, vib, HWHM, sigma, h = narrow_peaks(random, 100, 0.0)
+    vib = stack([vib, vib[::-1] + 1.5])
+    I0 = voigt_sum(omega, h, vib, HWHM, sigma)
+    I = voigt_sum(omega, h, vib, HWHM, sigma, tol=1E-5)
+    assert I.shape == (2, len(omega))
+    assert abs(I - I0).max() <= 5E-5 * abs(h / sigma).max() / SQRT2PI
+
+
+def test_voigt_sum_truncated_fallback(random):
+    # Broad peaks cover the domain, and an unsorted domain can't be
+    # truncated, so every point is evaluated as without tol
+    omega, vib, HWHM, sigma, h = narrow_peaks(random, 20)
+    I0 = voigt_sum(omega, h, vib, 1000 * HWHM, sigma)
+    assert_allclose(voigt_sum(omega, h, vib, 1000 * HWHM, sigma, tol=1E-4),
+                    I0, rtol=1E-12, atol=0)
+    I0 = voigt_sum(omega[::-1], h, vib, HWHM, sigma)
+    assert_allclose(voigt_sum(omega[::-1], h, vib, HWHM, sigma, tol=1E-2),
+                    I0, rtol=1E-12, atol=0)
+
+
+# Peaks 0, 3 and 5 exchange, as do 1 and 2, and 4 and 6, and 7 is alone
+COMPONENTS = [(0, 3), (3, 5), (1, 2), (6, 4)]
+
+
+@pytest.mark.parametrize('symmetric', [True, False])
+def test_spectrum_components(random_system, omega,
+                             symmetric):
+    Z, vib, GL, GG, h = random_system(8, COMPONENTS, symmetric)
+    for k in (0.5, 5.0, 50.0):
+        I, params = spectrum(Z, k, vib, GL, GG, h, omega)
+        I0, params0 = dense_spectrum(Z, k, vib, GL, GG, h, omega)
+        assert_allclose(I, I0, rtol=1E-8, atol=1E-10 * abs(I0).max())
+        for p, p0 in zip(params, params0):
+            assert_allclose(p, p0, rtol=1E-8, atol=1E-10)
+
+
+def test_exchange_parameters(random_system):
+    # The blocks give the parameters of the whole matrix, in its order
+    Z, vib, GL, GG, h = random_system(8, COMPONENTS)
+    A = diag(-1j * vib + 0.5 * GL) - 2.0 * ( Z - eye(8) )
+    params = exchange_parameters(A, GG, h)
+    params0 = new_parameters(*eigensystem(A) + (GG, h))
+    for p, p0 in zip(params, params0):
+        assert_allclose(p, p0, rtol=1E-8, atol=1E-10)
+
+
+def test_exchange_eigensystem_blocks(random_system):
+    Z, vib, GL, GG, h = random_system(8, COMPONENTS)
+    A = diag(-1j * vib + 0.5 * GL) - 2.0 * ( Z - eye(8) )
+    blocks = dict((len(indx[0]) if indx.ndim > 1 else 1, (indx, S))
+                  for indx, Lambda, S, SinvT in exchange_eigensystem(A))
+    assert sorted(blocks) == [1, 2, 3]
+    # The isolated peak needs no eigenvectors, and the two pairs
+    # are decomposed together
+    assert blocks[1][0].tolist() == [7] and blocks[1][1] is None
+    assert sorted(map(sorted, blocks[2][0].tolist())) == [[1, 2], [4, 6]]
+    assert blocks[2][1].shape == (2, 2, 2)
+    assert sorted(blocks[3][0].ravel()) == [0, 3, 5]
+
+
+@pytest.mark.parametrize('symmetric', [True, False])
+@pytest.mark.parametrize('rates', [[0.1, 0.2, 0.3, 0.05],
+                                   [0.9, 0.8, 0.3, 0.5]])
+def test_ZMat(symmetric, rates):
+    # The exchange between 0 and 1 is given twice; the last one counts.
+    # The larger rates make the rows sum past one.
+    index = [(0, 1), (1, 2), (2, 3), (1, 0)]
+    Z0 = dense_ZMat(5, index, rates, symmetric)
+    assert_allclose(ZMat(5, index, rates, symmetric), Z0, atol=1E-15)
+    Z = ZMat(5, index, rates, symmetric, sparse=True)
+    assert issparse(Z)
+    assert_allclose(Z.toarray(), Z0, atol=1E-15)
+
+
+def test_spectrum_sparse(random, omega):
+    index = [(i, i + 1) for i in range(0, 12, 2)] + [(3, 4)]
+    rates = random.uniform(0.05, 0.3, len(index))
+    vib = random.uniform(1900, 2000, 12)
+    GL, GG = random.uniform(2, 8, 12), random.uniform(2, 8, 12)
+    h = random.uniform(0.2, 1, 12)
+    Z = ZMat(12, index, rates, True)
+    Zs = ZMat(12, index, rates, True, sparse=True)
+    I0, params0 = spectrum(Z, 3.0, vib, GL, GG, h, omega)
+    I, params = spectrum(Zs, 3.0, vib, GL, GG, h, omega)
+    assert_allclose(I, I0, rtol=1E-10, atol=1E-12 * abs(I0).max())
+    for p, p0 in zip(params, params0):
+        assert_allclose(p, p0, rtol=1E-10, atol=1E-12)
+
+
+@pytest.mark.parametrize('npeaks', [2, 3])
+@pytest.mark.parametrize('k', [0.01, 1.0, 10.0, 1000.0])
+@pytest.mark.parametrize('symmetric', [True, False])
+def test_closed_form_eigensystem(random_system, omega,
+                                 npeaks, k, symmetric):
+    Z, vib, GL, GG, h = random_system(npeaks, symmetric=symmetric)
+    A = diag(-1j * vib + 0.5 * GL) - k * ( Z - eye(npeaks) )
+    Lambda, S, SinvT = closed_form_eigensystem(A)
+    assert_allclose(A.dot(S), S * Lambda, atol=1E-9 * abs(A).max())
+    assert_allclose(SinvT.T.dot(S), eye(npeaks), atol=1E-9)
+    assert ( abs(Lambda.imag[1:]) >= abs(Lambda.imag[:-1]) ).all()
+
+    I, params = spectrum(Z, k, vib, GL, GG, h, omega)
+    I0, params0 = dense_spectrum(Z, k, vib, GL, GG, h, omega)
+    assert_allclose(I, I0, rtol=1E-8, atol=1E-10 * abs(I0).max())
+    for p, p0 in zip(params, params0):
+        assert_allclose(p, p0, rtol=1E-8, atol=1E-10)
+
+
+@pytest.mark.parametrize('npeaks', [2, 3])
+def test_closed_form_eigensystem_degenerate(npeaks):
+    # Equal peaks that don't exchange have equal eigenvalues
+    A = diag([1 - 2000j] * npeaks)
+    assert closed_form_eigensystem(A) is None
+    Lambda, S, SinvT = eigensystem(A)
+    assert_allclose(Lambda, [1 - 2000j] * npeaks)
+    assert_allclose(SinvT.T.dot(S), eye(npeaks), atol=1E-12)
@@ -0,0 +1,141 @@
+from __future__ import print_function, division, absolute_import
+
+# Non-std lib imports
+import pytest
+from scipy.sparse import csr_matrix
+from numpy import argsort, diag, eye, logspace, zeros
+from numpy.testing import assert_allclose
+
+# Local imports
+from rapid.common.spectrum import spectrum, eigensystem
+from rapid.common.sweep import rate_sweep, continue_eigensystem, \
+                              sweep_points, RateSurrogate
+
+
+@pytest.mark.parametrize('npeaks', [2, 3, 5])
+def test_rate_sweep_matches_spectrum(random_system, omega, npeaks):
+    # From slow exchange through coalescence to fast exchange.  Gaussian
+    # widths that differ by much aren't physical in fast exchange.
+    Z, vib, GL, GG, h = random_system(npeaks)
+    GG = 4 + GG / 8
+    k_values = logspace(-2, 3, 40)
+    I, params = rate_sweep(Z, k_values, vib, GL, GG, h, omega)
+    assert I.shape == (40, len(omega))
+    for i, k in enumerate(k_values):
+        I0, params0 = spectrum(Z, k, vib, GL, GG, h, omega)
+        assert_allclose(I[i], I0, rtol=1E-8, atol=1E-10 * abs(I0).max())
+        # The sweep keeps each peak in place rather than sorting them
+        order = argsort(abs(params[0][i]), kind='mergesort')
+        for p, p0 in zip(params, params0):
+            assert_allclose(p[i][order], p0, rtol=1E-7, atol=1E-9)
+
+
+@pytest.mark.parametrize('npeaks', [3, 6])
+def test_continue_eigensystem(random_system, npeaks):
+    Z, vib, GL, GG, h = random_system(npeaks)
+    D = diag(-1j * vib + 0.5 * GL)
+    ZI = Z - eye(npeaks)
+    Lambda, S, SinvT = eigensystem(D - 1.0 * ZI)
+
+    # A small step keeps each eigenvalue in its place
+    A = D - 1.01 * ZI
+    L, S1, SinvT1 = continue_eigensystem(A, Lambda, S, SinvT)
+    assert abs(L - Lambda).max() < 0.1
+    assert_allclose(A.dot(S1), S1 * L, atol=1E-9 * abs(A).max())
+    assert_allclose(SinvT1.T.dot(S1), eye(npeaks), atol=1E-9)
+
+    # A large step is decomposed again, and is still an eigensystem
+    A = D - 500.0 * ZI
+    L, S1, SinvT1 = continue_eigensystem(A, Lambda, S, SinvT)
+    assert_allclose(sorted(abs(L)), sorted(abs(eigensystem(A)[0])),
+                    rtol=1E-10)
+    assert_allclose(A.dot(S1), S1 * L, atol=1E-9 * abs(A).max())
+    assert_allclose(SinvT1.T.dot(S1), eye(npeaks), atol=1E-9)
+
+
+def test_sweep_points():
+    sweeps = [('peak 1 l', 'Gamma_Lorentz', 0, [1.0, 2.0]),
+              ('exchange 1 2', 'exchange_rates', 0, [0.1, 0.2])]
+
+    # Every combination of the other parameters, each with every rate
+    points = sweep_points([1.0, 2.0], sweeps)
+    assert len(points) == 4
+    assert all(list(k) == [1.0, 2.0] for k, settings in points)
+    assert sorted(tuple(value for name, attr, index, value in settings)
+                  for k, settings in points) == [(1.0, 0.1), (1.0, 0.2),
+                                                 (2.0, 0.1), (2.0, 0.2)]
+
+    # The nth value of each, with the nth rate
+    points = sweep_points([1.0, 3.0], sweeps, 'zip')
+    assert [list(k) for k, settings in points] == [[1.0], [3.0]]
+    assert [[value for name, attr, index, value in settings]
+            for k, settings in points] == [[1.0, 0.1], [2.0, 0.2]]
+
+    # A single rate is shared
+    points = sweep_points([5.0], sweeps, 'zip')
+    assert [list(k) for k, settings in points] == [[5.0], [5.0]]
+
+    # Without a sweep there is one point
+    [(k, settings)] = sweep_points([5.0], [])
+    assert list(k) == [5.0] and settings == []
+
+
+def test_surrogate_interpolate(random_system, omega):
+    Z, vib, GL, GG, h = random_system(3)
+    surrogate = RateSurrogate()
+    key = surrogate.key(Z, vib, GL, GG, h, omega)
+    assert surrogate.interpolate(key, 0.5) is None
+
+    assert surrogate.tile(0.5) == -1 and surrogate.tile(1.0) == 0
+    k_values = surrogate.rates(-1)
+    assert len(k_values) == 21
+    assert_allclose(k_values[[0,-1]], [0.1, 1.0])
+    I, params = rate_sweep(Z, k_values, vib, GL, GG, h, omega)
+    surrogate.add(key, -1, I)
+    assert (key, -1) in surrogate and (key, 0) not in surrogate
+
+    # Exact at the rates calculated, and close in between
+    assert_allclose(surrogate.interpolate(key, k_values[7]), I[7])
+    for k in (0.1, 0.123, 0.5, 0.97):
+        I0 = spectrum(Z, k, vib, GL, GG, h, omega)[0]
+        assert_allclose(surrogate.interpolate(key, k), I0, rtol=0,
+                        atol=1E-2 * abs(I0).max())
+    assert surrogate.interpolate(key, 1.0) is None
+    assert surrogate.interpolate('other', 0.5) is None
+
+
+def test_surrogate_key(random_system, omega):
+    Z, vib, GL, GG, h = random_system(3)
+    key = RateSurrogate.key(Z, vib, GL, GG, h, omega)
+    assert RateSurrogate.key(Z.copy(), vib, GL, GG, h, omega) == key
+    assert RateSurrogate.key(csr_matrix(Z), vib, GL, GG, h, omega) == key
+    assert RateSurrogate.key(Z, vib, GL, GG, h, omega[:-1]) != key
+    vib = vib.copy()
+    vib[1] += 0.5
+    assert RateSurrogate.key(Z, vib, GL, GG, h, omega) != key
+
+
+def test_surrogate_memory():
+    I = zeros((21, 100))
+    surrogate = RateSurrogate(maxbytes=2 * I.nbytes)
+    surrogate.add('a', 0, I)
+    surrogate.add('a', 1, I.copy())
+    # Replacing a tile doesn't count it twice
+    surrogate.add('a', 1, I.copy())
+    assert surrogate.nbytes == 2 * I.nbytes
+
+    # The least recently used tile is dropped
+    surrogate.interpolate('a', 5.0)
+    surrogate.add('b', 0, I.copy())
+    assert ('a', 0) in surrogate and ('b', 0) in surrogate
+    assert ('a', 1) not in surrogate
+    assert surrogate.nbytes == 2 * I.nbytes
+
+    surrogate.discard('a', 0)
+    surrogate.discard('a', 0)
+    assert ('a', 0) not in surrogate and surrogate.nbytes == I.nbytes
+
+    # A single tile is kept however large it is
+    surrogate = RateSurrogate(maxbytes=1)
+    surrogate.add('a', 0, I)
+    assert ('a', 0) in surrogate
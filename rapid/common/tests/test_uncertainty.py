@@ -0,0 +1,152 @@
+from __future__ import print_function, division, absolute_import
+
+# Non-std lib imports
+import pytest
+from numpy import array, column_stack, exp, isnan, linspace, nan, ones, \
+                  sqrt
+from numpy.linalg import lstsq
+from numpy.testing import assert_allclose
+
+# Local imports
+from rapid.common.read_input import read_input
+from rapid.common.fit import fit_spectrum, FitResult
+from rapid.common.uncertainty import run_refits, bootstrap_jobs, \
+                                     profile_jobs, profile_rates, \
+                                     standard_errors, percentile_interval, \
+                                     profile_interval
+
+DATA = ['rate 0.5 THz',
+        'peak 1949.8 0.38 l=5.6 g=1.2',
+        'peak 1970.3 0.35 l=5.6 g=0.9',
+        'peak 2027.6 0.27 l=2.6 g=0.7',
+        'exchange 1 2 1.0',
+        'xlim 1900 2050']
+
+
+def line_fit(random, n=50):
+    '''A FitResult of a straight line fit to noisy data, with the offset
+    and slope refined and a third parameter held fixed'''
+    x = linspace(0, 10, n)
+    y = 1.0 + 2.0 * x + random.normal(0, 0.5, n)
+    X = column_stack([ones(n), x])
+    b = lstsq(X, y, rcond=None)[0]
+    return FitResult(['offset', 'slope', 'fixed'], array([b[0], b[1], 3.0]),
+                     None, array([True, True, False]), array([0, 1, 2]),
+                     True, '', 1, None, x, y, X.dot(b), X)
+
+
+@pytest.fixture
+def best(synthetic_raw):
+    '''The arguments and best fit of noisy data'''
+    args = read_input(DATA)
+    args.raw = synthetic_raw(DATA, noise=2E-3)
+    return args, fit_spectrum(args)
+
+
+def test_standard_errors(random):
+    result = line_fit(random)
+    x, n = result.omega, len(result.omega)
+    rss = ( ( result.model - result.data )**2 ).sum()
+    errors = standard_errors(result)
+    # The textbook standard error of the slope
+    assert_allclose(errors[1], sqrt(rss / ( n - 2 ) /
+                                    ( ( x - x.mean() )**2 ).sum()))
+    assert isnan(errors[2])
+
+
+def test_profile_rates(random):
+    result = line_fit(random)._replace(values=array([5.0, 2.0, 3.0]))
+    error = standard_errors(result)[0]
+    rates = profile_rates(result, 9)
+    assert_allclose(rates[[0,4,-1]], [5.0 - 4 * error, 5.0, 5.0 + 4 * error])
+
+    # Without a standard error, a factor of three each way
+    result = result._replace(free=array([False, True, False]))
+    assert_allclose(profile_rates(result, 5)[[0,-1]], [5.0 / 3, 15.0])
+
+    # Only positive rates
+    result = line_fit(random)._replace(values=array([1E-3, 2.0, 3.0]))
+    assert (profile_rates(result, 9) > 0).all()
+
+
+def test_percentile_interval(random):
+    samples = random.normal(0, 1, 100000)
+    samples[::100] = nan
+    assert_allclose(percentile_interval(samples, 0.95), (-1.96, 1.96),
+                    atol=0.03)
+    assert isnan(percentile_interval([nan, nan], 0.95)).all()
+
+
+def test_profile_interval():
+    # A profile whose rise in -2 log likelihood is ((k - 5) / 0.5)^2,
+    # so the 95% interval is 5 -+ 1.96 * 0.5
+    nobs = 100
+    rates = linspace(3, 7, 401)
+    rss = 2.0 * exp(( ( rates - 5 ) / 0.5 )**2 / nobs)
+    assert_allclose(profile_interval(rates, rss, nobs, 0.95),
+                    (5 - 0.98, 5 + 0.98), atol=1E-3)
+
+    # The order doesn't matter, and failed refits are ignored
+    rss[::7] = nan
+    assert_allclose(profile_interval(rates[::-1], rss[::-1], nobs, 0.95),
+                    (5 - 0.98, 5 + 0.98), atol=1E-3)
+
+    # An end not reached is NaN
+    low, high = profile_interval(rates[rates < 5.5], rss[rates < 5.5], nobs,
+                                 0.95)
+    assert_allclose(low, 5 - 0.98, atol=1E-3)
+    assert isnan(high)
+    assert isnan(profile_interval(rates, rss * nan, nobs, 0.95)).all()
+
+
+def test_jobs():
+    assert [job[1] for job in bootstrap_jobs(3, done={1})] == [0, 2]
+    assert profile_jobs([1.0, 2.0, 3.0], done=[0]) == [('profile', 1, 2.0),
+                                                      ('profile', 2, 3.0)]
+
+
+def test_run_refits(best):
+    args, result = best
+    jobs = bootstrap_jobs(3) + profile_jobs([0.9 * result.values[0],
+                                             result.values[0]])
+    refits = sorted(run_refits(args, result, jobs, ('rate', 'vib', 'l')),
+                    key=lambda r: ( r.kind, r.index ))
+    assert [(r.kind, r.index) for r in refits] == [
+        ('bootstrap', 0), ('bootstrap', 1), ('bootstrap', 2),
+        ('profile', 0), ('profile', 1)]
+    assert all(r.success for r in refits)
+
+    # A resample is the same when it is drawn again, in another process
+    again = sorted(run_refits(args, result, bootstrap_jobs(3),
+                              ('rate', 'vib', 'l'), njobs=2),
+                   key=lambda r: r.index)
+    for r, r0 in zip(again, refits[:3]):
+        assert_allclose(r.values, r0.values)
+    assert abs(refits[0].values - refits[1].values).max() > 0
+
+    # A profile holds the rate, and fits no better than the best fit
+    for r in refits[3:]:
+        assert r.values[0] == r.rate
+    best_rss = ( ( result.model - result.data )**2 ).sum()
+    assert refits[3].rss > refits[4].rss
+    assert_allclose(refits[4].rss, best_rss, rtol=1E-6)
+
+
+def test_run_refits_not_calculated(synthetic_raw):
+    # Without exchange the two identical peaks are degenerate, so the
+    # profile can't start at a rate of zero
+    lines = ['rate 0.5 THz',
+             'peak 1950 0.5 l=5 g=1',
+             'peak 1950 0.5 l=5 g=1',
+             'peak 1990 0.3 l=3 g=1',
+             'exchange 1 2 1.0',
+             'xlim 1900 2050']
+    args = read_input(lines)
+    args.raw = synthetic_raw(lines, noise=2E-3)
+    refine = ('height', 'scale')
+    result = fit_spectrum(args, refine=refine)
+    jobs = profile_jobs([0.0, result.values[0]])
+    refits = sorted(run_refits(args, result, jobs, refine),
+                    key=lambda r: r.index)
+    assert not refits[0].success and isnan(refits[0].values).all()
+    assert refits[1].success
@@ -0,0 +1,66 @@
+from __future__ import print_function, division, absolute_import
+
+# Non-std lib imports
+import pytest
+from scipy.linalg import eigvals
+from numpy import arange, diag, eye, linspace, sort
+from numpy.testing import assert_allclose
+
+# Local imports
+from rapid.common.spectrum import ZMat, spectrum
+from rapid.common.window import spectrum_window
+
+
+def chain(random, npeaks):
+    '''A long chain of peaks over a wide range, each exchanging with its
+    neighbours, and a domain over a small part of it'''
+    index = [(i, i + 1) for i in range(npeaks - 1)]
+    Z = ZMat(npeaks, index, random.uniform(0.05, 0.3, npeaks - 1), True)
+    vib = sort(random.uniform(0, 10 * npeaks, npeaks))
+    GL, GG = random.uniform(1, 3, npeaks), random.uniform(1, 3, npeaks)
+    h = random.uniform(0.2, 1, npeaks)
+    omega = linspace(4 * npeaks, 5 * npeaks, 1001)
+    return Z, vib, GL, GG, h, omega
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_spectrum_window(random, sparse):
+    Z, vib, GL, GG, h, omega = chain(random, 300)
+    k = 2.0
+    I0, params0 = spectrum(Z, k, vib, GL, GG, h, omega)
+    Lambda = eigvals(diag(-1j * vib + 0.5 * GL) - k * ( Z - eye(300) ))
+    if sparse:
+        Z = ZMat(300, [(i, i + 1) for i in range(299)],
+                 Z[arange(299),arange(1, 300)], True, sparse=True)
+    I, params, omitted = spectrum_window(Z, k, vib, GL, GG, h, omega,
+                                         nev=20)
+    assert 200 < omitted.count < 300
+    assert len(params[0]) == 300 - omitted.count
+
+    # The peaks that were found are peaks of the full system
+    for p, HWHM in zip(params[0], params[1]):
+        j = abs(params0[0] - p).argmin()
+        assert_allclose([p, HWHM], [params0[0][j], params0[1][j]],
+                        rtol=1E-8)
+    # All peaks near the plot were found, so the spectrum only misses
+    # the tails of those far away, which are below the estimate
+    assert abs(I - I0).max() <= omitted.intensity
+
+    # The omitted eigenvalues are the rest of the full eigenvalues
+    found = -params[0] * 1j + params[1] / 2
+    assert_allclose(omitted.Lambda * omitted.count,
+                    Lambda.sum() - found.sum(), rtol=1E-8)
+    assert_allclose(omitted.height.real, h.sum() - params[3].sum(),
+                    rtol=1E-8)
+    # The peaks known to be omitted are outside of the window
+    outside = vib[omitted.peaks]
+    assert ( ( outside < omega[0] ) | ( outside > omega[-1] ) ).all()
+
+
+def test_spectrum_window_small(random_system, omega):
+    # A small system is calculated whole
+    Z, vib, GL, GG, h = random_system(6)
+    I0, params0 = spectrum(Z, 5.0, vib, GL, GG, h, omega)
+    I, params, omitted = spectrum_window(Z, 5.0, vib, GL, GG, h, omega)
+    assert omitted.count == 0 and omitted.intensity == 0
+    assert_allclose(I, I0)
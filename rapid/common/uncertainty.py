@@ -0,0 +1,183 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+from collections import namedtuple
+from multiprocessing import Pool, cpu_count
+
+# Non-std lib imports
+from scipy.special import erfinv
+from numpy import array, diag, exp, full, isfinite, linspace, log, nan, \
+                  percentile, sqrt
+from numpy.linalg import pinv
+from numpy.random import RandomState
+
+# Local imports
+from rapid.common.spectrum import SpectrumError
+from rapid.common.fit import fit_spectrum, FitError
+
+__all__ = ['run_refits', 'bootstrap_jobs', 'profile_jobs', 'profile_rates',
+           'covariance', 'standard_errors', 'percentile_interval',
+           'profile_interval', 'Refit']
+
+# The result of refitting a bootstrap resample or a point of the profile
+# of the rate.  kind is "bootstrap" or "profile", index is the number of
+# the resample or point, rate is the rate it was fixed at for a profile,
+# values are the fitted values of all the parameters, and rss is the
+# residual sum of squares.  If the refit failed, values and rss are NaN.
+Refit = namedtuple('Refit', 'kind index rate values rss success')
+
+# The problem refit by each worker process of run_refits
+_problem = None
+
+
+def run_refits(args, best, jobs, refine, fix=(), bounds=None, ties=None,
+               seed=0, njobs=1):
+    '''Refit each of the jobs (from bootstrap_jobs and profile_jobs), and
+    yield a Refit for each as it finishes, in no particular order.
+
+    best is the FitResult of fit_spectrum for args with refine, fix,
+    bounds and ties, and each refit starts from it.  A bootstrap refit
+    fits the best model plus its residuals resampled with replacement,
+    drawn from a random generator seeded by seed and its index, so that
+    the same resample is drawn again when a run is resumed.  A profile
+    refit holds the rate fixed.  The refits are run on a pool of njobs
+    processes (0 means one per CPU).
+    '''
+    problem = {'args' : args, 'best' : best, 'seed' : seed,
+               'options' : {'refine' : refine, 'fix' : tuple(fix),
+                            'bounds' : bounds, 'ties' : ties}}
+    njobs = min(njobs if njobs > 0 else cpu_count(), len(jobs))
+    if njobs <= 1:
+        for job in jobs:
+            yield _refit(job, problem)
+        return
+    pool = Pool(njobs, initializer=_initialize, initargs=(problem,))
+    try:
+        for refit in pool.imap_unordered(_refit, jobs):
+            yield refit
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def bootstrap_jobs(nresamples, done=()):
+    '''Return the jobs of nresamples bootstrap refits for run_refits,
+    except those whose index is in done.'''
+    return [('bootstrap', i, nan) for i in range(nresamples)
+            if i not in done]
+
+
+def profile_jobs(rates, done=()):
+    '''Return the jobs of a profile over the rates (in wavenumbers) for
+    run_refits, except those whose index is in done.'''
+    return [('profile', i, rate) for i, rate in enumerate(rates)
+            if i not in done]
+
+
+def profile_rates(best, npoints, width=4):
+    '''Return npoints rates (in wavenumbers) spanning width standard
+    errors on each side of the fitted rate of a FitResult.  If the
+    standard error can't be found, they span a factor of three instead.
+    Only positive rates are kept.'''
+    k = best.values[0]
+    error = nan
+    if best.free[0]:
+        error = standard_errors(best)[0]
+    if isfinite(error) and error > 0:
+        rates = k + linspace(-width, width, npoints) * error
+    else:
+        rates = k * exp(linspace(-log(3), log(3), npoints))
+    return rates[rates > 0]
+
+
+def covariance(result):
+    '''Return the covariance of the refined parameters of a FitResult,
+    estimated from its Jacobian and residuals.'''
+    nobs, nfree = result.jacobian.shape
+    rss = ( ( result.model - result.data )**2 ).sum()
+    J = result.jacobian
+    return pinv(J.T.dot(J)) * rss / max(nobs - nfree, 1)
+
+
+def standard_errors(result):
+    '''Return the standard error of each parameter of a FitResult, which
+    is NaN for those that were not refined.'''
+    errors = full(len(result.values), nan)
+    errors[result.free] = sqrt(diag(covariance(result)))
+    return errors
+
+
+def percentile_interval(values, confidence):
+    '''Return the (low, high) percentile interval of the samples that
+    holds the given fraction of them.  NaN samples are ignored.'''
+    values = array(values, dtype=float)
+    values = values[isfinite(values)]
+    if not len(values):
+        return nan, nan
+    tail = 50 * ( 1 - confidence )
+    return tuple(percentile(values, [tail, 100 - tail]))
+
+
+def profile_interval(rates, rss, nobs, confidence):
+    '''Return the (low, high) interval of the rate from a profile of the
+    residual sum of squares over the rates, from the likelihood ratio
+    test for nobs observations.  The profile should include the best
+    fit.  An end that is not reached within the profile is NaN.'''
+    order = rates.argsort()
+    rates, rss = rates[order], rss[order]
+    keep = isfinite(rss)
+    rates, rss = rates[keep], rss[keep]
+    if not len(rates):
+        return nan, nan
+
+    # The rise in -2 log likelihood, against its chi squared limit
+    # with one degree of freedom
+    rise = nobs * log(rss / rss.min()) - 2 * erfinv(confidence)**2
+
+    def crossing(i, j):
+        '''Where the rise crosses the limit between rates i and j'''
+        return rates[i] + ( rates[j] - rates[i] ) * rise[i] \
+                          / ( rise[i] - rise[j] )
+
+    best = rise.argmin()
+    low = high = nan
+    for i in range(best, 0, -1):
+        if rise[i-1] >= 0:
+            low = crossing(i, i-1)
+            break
+    for i in range(best, len(rates) - 1):
+        if rise[i+1] >= 0:
+            high = crossing(i, i+1)
+            break
+    return low, high
+
+
+def _initialize(problem):
+    '''Keep the problem refit by this worker process'''
+    global _problem
+    _problem = problem
+
+
+def _refit(job, problem=None):
+    '''Refit one job of run_refits, and return the Refit'''
+    if problem is None:
+        problem = _problem
+    kind, index, rate = job
+    args, best = problem['args'], problem['best']
+    options = dict(problem['options'])
+    start = best.values.copy()
+    data = None
+    if kind == 'bootstrap':
+        residuals = best.data - best.model
+        generator = RandomState([problem['seed'], index])
+        choice = generator.randint(0, len(residuals), len(residuals))
+        data = best.model + residuals[choice]
+    else:
+        start[0] = rate
+        options['fix'] = options['fix'] + ('rate',)
+    try:
+        result = fit_spectrum(args, data=data, start=start, **options)
+    except (FitError, SpectrumError):
+        return Refit(kind, index, rate, full(len(start), nan), nan, False)
+    rss = ( ( result.model - result.data )**2 ).sum()
+    return Refit(kind, index, rate, result.values, rss, result.success)
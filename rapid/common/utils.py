@@ -4,25 +4,31 @@ from __future__ import print_function, division, absolute_import
 from sys import stderr
 
 # Non-std. lib imports
-from numpy import where, savetxt, array
+from numpy import where, savetxt, array, nan
 
 
-def write_data(x, y, datafile):
-    '''Writes the normalized data to file.'''
+def write_data(x, y, datafile, header=''):
+    '''Writes the normalized data to file.  If y holds several spectra
+    (one per row), each is written as its own column.  A header may be
+    given to describe the columns.'''
 
     # Write the data to file. 
-    savetxt(str(datafile), array([x, y]).T, fmt='%.1f %.16f')
+    y = array(y, ndmin=2)
+    fmt = ' '.join(['%.1f'] + ['%.16f'] * len(y))
+    savetxt(str(datafile), array([x] + list(y)).T, fmt=fmt, header=header)
 
 
 def numerics(old_params, new_params, out):
     '''Make a nice table of the old and new data'''
 
-    # Extract values
+    # Extract values.  There may be fewer new parameters than
+    # old if only some of the eigenvalues were found.
     N = range(len(old_params[0]))
-    vib = [(old_params[0][i], new_params[0][i]) for i in N]
-    GL  = [(old_params[1][i], new_params[1][i]) for i in N]
-    GG  = [(old_params[2][i], new_params[2][i]) for i in N]
-    h   = [(old_params[3][i], new_params[3][i]) for i in N]
+    new = lambda p, i: p[i] if i < len(p) else nan
+    vib = [(old_params[0][i], new(new_params[0], i)) for i in N]
+    GL  = [(old_params[1][i], new(new_params[1], i)) for i in N]
+    GG  = [(old_params[2][i], new(new_params[2], i)) for i in N]
+    h   = [(old_params[3][i], new(new_params[3], i)) for i in N]
 
     # Write to specified location
     sr = '# {0:15}:{1[0]:^25g}{1[1]:^30g}'
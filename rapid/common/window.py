@@ -0,0 +1,170 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+from collections import namedtuple
+from math import ceil, pi
+
+# Non-std lib imports
+from scipy.sparse import csc_matrix, diags, identity, issparse
+from scipy.sparse.linalg import eigs, ArpackError, ArpackNoConvergence
+from numpy import arange, argsort, asarray, clip, concatenate, einsum, \
+                  linspace, maximum, sort, zeros
+
+# Local imports
+from rapid.common.spectrum import spectrum, new_parameters, voigt_sum, \
+                                  SpectrumError, SQRT2LOG2_2
+
+__all__ = ['spectrum_window', 'Omitted']
+
+# The most eigenvalues to ask for around a single shift
+NEV = 40
+
+# A summary of the eigenvalues that were not computed.  count is how
+# many there are, peaks are the indices of the input peaks whose
+# eigenvalues are certain to lie outside of the searched window, height
+# is their total (complex) height, Lambda is their mean eigenvalue, and
+# intensity is an upper estimate of the largest intensity they would
+# have added inside the window.
+Omitted = namedtuple('Omitted', 'count peaks height Lambda intensity')
+
+
+def spectrum_window(Z, k, vib, Gamma_Lorentz, Gamma_Gauss, heights, omega,
+                    xlim=None, margin=None, nev=NEV, **kwargs):
+    '''Calculate the intensities using only the eigenvalues of A whose
+    peak positions fall inside of a window about the plot.
+
+    The eigenpairs are found with shift-invert Arnoldi iterations
+    (scipy.sparse.linalg.eigs) about a set of shifts spanning the window,
+    each asked for at most about nev eigenvalues.  The window is xlim
+    (by default the range of omega) widened by margin on each side (by
+    default five times the largest total line width).
+
+    Returns the intensity, the new parameters of the eigenvalues that
+    were found, and an Omitted summary of those that were not.  The
+    total height and mean eigenvalue of the omitted peaks follow exactly
+    from the sum rules for the heights and the trace of A.  If nearly
+    every eigenvalue lies inside the window, the full dense spectrum is
+    calculated instead.  Other keyword arguments are passed on to
+    voigt_sum.
+    '''
+    vib = asarray(vib, dtype=float)
+    Gamma_Lorentz = asarray(Gamma_Lorentz, dtype=float)
+    Gamma_Gauss = asarray(Gamma_Gauss, dtype=float)
+    heights = asarray(heights, dtype=float)
+    npeaks = len(vib)
+    if xlim is None:
+        xlim = omega.min(), omega.max()
+    if margin is None:
+        margin = 5 * ( Gamma_Lorentz + Gamma_Gauss ).max()
+    lo, hi = xlim[0] - margin, xlim[1] + margin
+
+    # Construct the sparse A matrix from K
+    Z = csc_matrix(Z) if issparse(Z) else csc_matrix(asarray(Z))
+    K = k * ( Z - identity(npeaks, format='csc') )
+    A = csc_matrix(diags([-1j * vib + 0.5 * Gamma_Lorentz], [0]) - K)
+
+    # Every eigenvalue is in a Gershgorin disc about a diagonal element.
+    # Find the discs that reach into the window.
+    diagonal = A.diagonal()
+    radius = asarray(abs(A).sum(axis=1)).ravel() - abs(diagonal)
+    center = -diagonal.imag
+    inside = ( center + radius >= lo ) & ( center - radius <= hi )
+
+    # Use the dense solver if nearly all eigenvalues may be needed
+    if npeaks < 3 * nev or inside.sum() > npeaks // 2:
+        I, new_params = spectrum(Z, k, vib, Gamma_Lorentz, Gamma_Gauss,
+                                 heights, omega, **kwargs)
+        return I, new_params, Omitted(0, asarray([], dtype=int), 0j, 0j, 0.0)
+
+    # Divide the window into segments each holding about nev / 2 discs,
+    # and put a shift at the middle of each
+    centers = sort(clip(center[inside], lo, hi))
+    nseg = int(ceil(2 * len(centers) / nev))
+    edges = linspace(lo, hi, nseg + 1)
+    edges[1:-1] = centers[arange(1, nseg) * len(centers) // nseg]
+    # The shifts use the average width of the peaks in the window
+    gamma = diagonal.real[inside].mean()
+
+    # A is complex symmetric when Z is, and then the left
+    # eigenvectors are the same as the right ones
+    symmetric = abs(A - A.T).max() == 0
+
+    Lambda, S, SinvT = [], [], []
+    for start, stop in zip(edges[:-1], edges[1:]):
+        count = ( ( center + radius >= start ) &
+                  ( center - radius <= stop ) ).sum()
+        if count == 0:
+            continue
+        nk = min(max(count + count // 2 + 4, 6), npeaks - 2)
+        shift = gamma - 0.5j * ( start + stop )
+        try:
+            l, s = eigs(A, k=nk, sigma=shift, which='LM')
+            if symmetric:
+                y = s
+            else:
+                lt, y = eigs(A.T, k=nk, sigma=shift, which='LM')
+                # Pair each left eigenvector with its right eigenvector
+                pair = abs(l[:,None] - lt[None,:]).argmin(1)
+                good = abs(l - lt[pair]) <= 1E-8 * max(abs(l).max(), 1.0)
+                l, s, y = l[good], s[:,good], y[:,pair[good]]
+        except (ArpackError, ArpackNoConvergence) as e:
+            raise SpectrumError('The partial eigensolve did not converge: '
+                                '{0}'.format(e))
+
+        # Keep only the eigenvalues that belong to this segment, so
+        # that none are counted twice
+        position = -l.imag
+        keep = ( position >= start ) & ( position < stop )
+        l, s, y = l[keep], s[:,keep], y[:,keep]
+        # Scale the left eigenvectors so that their rows form S^{-1}
+        y = y / einsum('ij,ij->j', y, s)
+        Lambda.append(l)
+        S.append(s)
+        SinvT.append(y)
+
+    if Lambda:
+        Lambda = concatenate(Lambda)
+        S = concatenate(S, axis=1)
+        SinvT = concatenate(SinvT, axis=1)
+    else:
+        Lambda = zeros(0, dtype=complex)
+        S = SinvT = zeros((npeaks, 0), dtype=complex)
+
+    # Order the eigenvalues by the imaginary part as the dense path does
+    indx = argsort(abs(Lambda.imag))
+    Lambda, S, SinvT = Lambda[indx], S[:,indx], SinvT[:,indx]
+    peaks, HWHM, sigmas, h = new_parameters(Lambda, S, SinvT,
+                                            Gamma_Gauss, heights)
+    new_params = peaks, 2 * HWHM, SQRT2LOG2_2 * sigmas, h.real
+    I = voigt_sum(omega, h, peaks, HWHM, sigmas, **kwargs)
+
+    return I, new_params, omitted(A, heights, Lambda, h, ~inside,
+                                  xlim[0], xlim[1])
+
+
+def omitted(A, heights, Lambda, h, outside, lo, hi):
+    '''Summarize the eigenvalues of A that are not in Lambda.
+
+    The heights after exchange sum to the sum of the input heights, and
+    the eigenvalues sum to the trace of A, so the total height and mean
+    eigenvalue of the missing peaks are known.  Their largest intensity
+    inside of the window from lo to hi is estimated by placing a
+    Lorentzian at each diagonal element of A outside of the window and
+    adding up the size of their absorptive and dispersive tails at the
+    nearer edge of the window.
+    '''
+    count = A.shape[0] - len(Lambda)
+    if count == 0:
+        return Omitted(0, asarray([], dtype=int), 0j, 0j, 0.0)
+    diagonal = A.diagonal()
+    height = heights.sum() - h.sum()
+    mean = ( diagonal.sum() - Lambda.sum() ) / count
+
+    # The distance from each omitted peak to the window and the
+    # absorptive and dispersive parts of a Lorentzian there
+    position, gamma = -diagonal.imag[outside], abs(diagonal.real[outside])
+    d = maximum(maximum(lo - position, position - hi), 0.0)
+    intensity = ( abs(heights[outside]) * ( gamma + d )
+                  / ( pi * ( d**2 + gamma**2 ) ) ).sum()
+
+    return Omitted(count, outside.nonzero()[0], height, mean, intensity)
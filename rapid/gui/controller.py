@@ -1,17 +1,30 @@
 from __future__ import print_function, division, absolute_import
 
 # Non-std. lib imports
-from PySide.QtCore import Signal, QObject
-from numpy import ndarray, isnan, sum
+from PySide.QtCore import Signal, QObject, QThread, QTimer, QCoreApplication
+from numpy import ndarray, isnan, sum, concatenate, unique
+from input_reader import ReaderError
 
 # Local imports
-from rapid.common import spectrum
+from rapid.common import SpectrumModel, SpectrumError, RateSurrogate, \
+                         rate_sweep, read_record
+from rapid.gui.guicommon import error
 from rapid.gui.peak import PeakModel
 from rapid.gui.exchange import ExchangeModel, NumPeaks
 from rapid.gui.rate import Rate
 from rapid.gui.scale import Scale
 
 
+# How long to wait in milliseconds for more changes before recalculating,
+# so that i.e. typing a number recalculates once and not on each key
+DEBOUNCE = 50
+
+# The spacing in wavenumbers of the quick first plot, and how many
+# points times peaks make a plot slow enough to need one
+COARSE_STEP = 4
+COARSE_WORK = 20000
+
+
 class Controller(QObject):
     '''Class to hold all information about the function'''
 
@@ -23,6 +36,7 @@ class Controller(QObject):
         self.exchange = ExchangeModel(self)
         self.peak = PeakModel(self)
         self.scale = Scale(self)
+        self._makeWorker()
         self._makeConnections()
         self.oldParams = None
         self.newParams = None
@@ -31,6 +45,46 @@ class Controller(QObject):
         self.limits = None
         self.hasPlot = False
 
+    def _makeWorker(self):
+        '''Calculate the spectra on their own thread so the GUI stays
+        responsive.  Each request gets a new generation number, and only
+        the result of the newest is plotted.  Fits take much longer than
+        a spectrum, so they have a thread of their own.'''
+        self.generation = 0
+        self.workerThread = QThread(self)
+        self.worker = SpectrumWorker()
+        self.worker.moveToThread(self.workerThread)
+        self.requestSpectrum.connect(self.worker.calculate)
+        self.worker.finished.connect(self.receiveSpectrum)
+        self.worker.failed.connect(self.spectrumFailed)
+        self.requestTile.connect(self.worker.sweep)
+        self.worker.swept.connect(self.receiveTile)
+        self.workerThread.start()
+
+        self.fitGeneration = 0
+        self.fitThread = QThread(self)
+        self.fitWorker = FitWorker()
+        self.fitWorker.moveToThread(self.fitThread)
+        self.requestFit.connect(self.fitWorker.fit)
+        self.fitWorker.fitted.connect(self.receiveFit)
+        self.fitWorker.fitFailed.connect(self.receiveFitFailure)
+        self.fitThread.start()
+        QCoreApplication.instance().aboutToQuit.connect(self.stopWorker)
+
+        # Wait for a burst of changes to end before recalculating
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(DEBOUNCE)
+        self.timer.timeout.connect(self.requestData)
+
+        # Spectra over a range of rates to interpolate between while the
+        # rate is dragged, for the system being dragged (dragKey)
+        self.surrogate = RateSurrogate()
+        self.dragJob = None
+        self.dragKey = None
+        self.dragRate = None
+        self.pendingTiles = set()
+
     def _makeConnections(self):
         '''Connect the contained widgets'''
 
@@ -44,6 +98,10 @@ class Controller(QObject):
         self.exchange.matrixChanged.connect(self.setDataForPlot)
         self.peak.inputParamsChanged.connect(self.setDataForPlot)
 
+        # Preview the spectrum while the rate is dragged
+        self.rate.dragStarted.connect(self.startDrag)
+        self.rate.rateDragged.connect(self.previewRate)
+
         # Change the plot scale
         self.scale.scaleChanged.connect(self.changeScale)
 
@@ -70,42 +128,184 @@ class Controller(QObject):
         self.exchange.resizeMatrix(self.numpeaks.numPeaks)
 
     def setDataForPlot(self):
-        '''Assembles the data for plotting, calculates the spectrum, then emits'''
+        '''Recalculate the spectrum once the changes stop coming'''
+        self.timer.start()
+
+    def requestData(self):
+        '''Assembles the data for plotting and asks the worker to
+        calculate the spectrum'''
+        job = self.makeJob()
+        if job is None:
+            return
+
+        # Anything still being calculated is now out of date.  The
+        # worker skips requests that are out of date before starting
+        # them, and the results of those already started are dropped.
+        self.generation += 1
+        self.worker.latest = job['generation'] = self.generation
+        self.requestSpectrum.emit(job)
+
+    def makeJob(self):
+        '''Return the current inputs as a request for the worker, or None
+        if they are incomplete'''
 
         # Assemble values
         omega = self.scale.getDomain()
         npeaks = self.numpeaks.getNumPeaks()
         k = self.rate.getConvertedRate()
         Z = self.exchange.getMatrix()
-        self.oldParams = self.peak.getParams()
-        vib, GL, GG, h = self.oldParams
+        params = self.peak.getParams()
+        vib, GL, GG, h = params
         # Don's plot if there is some error
         if k == 0 or k is None:
-            return
+            return None
         elif npeaks != len(vib) or isnan(sum(vib)):
-            return
+            return None
         elif npeaks != len(GL) or isnan(sum(GL)):
-            return
+            return None
         elif npeaks != len(GG) or isnan(sum(GG)):
-            return
+            return None
         elif npeaks != len(h) or isnan(sum(h)):
-            return
+            return None
         elif npeaks != len(Z):
-            return
+            return None
         elif len(omega) == 0:
+            return None
+
+        # The matrix and domain are copied since the GUI changes them
+        # in place
+        return {'generation' : self.generation,
+                'omega' : omega.copy(),
+                'Z' : Z.copy(),
+                'k' : k,
+                'params' : params,
+                'rateParams' : self.rate.getParams(),
+                'exchangeParams' : self.exchange.getParams(npeaks),
+                'limits' : self.scale.getScale()}
+
+    def fitRawData(self, raw):
+        '''Ask the worker to fit the current parameters to the raw data.
+        Returns why the fit could not be started, or None if it was.'''
+        job = self.makeJob()
+        if job is None:
+            return 'Cannot fit.. the parameters are incomplete'
+
+        # Describe the current state as an input file would
+        rate, unit = job['rateParams']
+        rates, indx, sym = job['exchangeParams']
+        xmin, xmax, reverse = job['limits']
+        lr = 'lifetime' if unit in ('s', 'ns', 'ps', 'fs') else 'rate'
+        record = {lr : [float(rate), unit],
+                  'peak' : [[float(p), float(h), {'l' : float(l),
+                                                  'g' : float(g)}]
+                            for p, l, g, h in zip(*job['params'])],
+                  'exchange' : [[i+1, j+1, float(r)]
+                                for (i, j), r in zip(indx, rates)],
+                  'nosym' : not sym,
+                  'xlim' : [int(xmin), int(xmax)]}
+        try:
+            args = read_record(record)
+        except ReaderError as r:
+            return 'Cannot fit.. {0}'.format(r)
+        args.raw = raw
+        # A fit still waiting to start is replaced by this one
+        self.fitGeneration += 1
+        self.fitWorker.latest = self.fitGeneration
+        self.requestFit.emit(self.fitGeneration, args)
+        return None
+
+    def receiveFit(self, generation, args):
+        '''Pass on the fitted parameters of the newest fit'''
+        if generation == self.fitGeneration:
+            self.fitFinished.emit(args)
+
+    def receiveFitFailure(self, generation, message):
+        '''Pass on why the newest fit failed'''
+        if generation == self.fitGeneration:
+            self.fitFailed.emit(message)
+
+    def startDrag(self):
+        '''Get ready to preview the spectrum as the rate is dragged'''
+        self.dragJob = self.makeJob()
+        if self.dragJob is None:
+            self.dragKey = None
+            return
+        vib, GL, GG, h = self.dragJob['params']
+        self.dragKey = self.surrogate.key(self.dragJob['Z'], vib, GL, GG, h,
+                                          self.dragJob['omega'])
+        self.dragRate = None
+        # Results still on their way are out of date, and the tiles of
+        # this drag are out of date once the next spectrum is requested
+        self.generation += 1
+        self.worker.latest = self.dragJob['generation'] = self.generation
+        self.requestTiles(self.dragJob['k'])
+
+    def previewRate(self, k):
+        '''Plot the spectrum at a rate being dragged through, interpolated
+        from spectra calculated beforehand.  The exact spectrum follows
+        once the drag ends.'''
+        if self.dragKey is None or k <= 0:
+            return
+        self.dragRate = k
+        I = self.surrogate.interpolate(self.dragKey, k)
+        if I is not None:
+            self.plotSpectrum.emit(self.dragJob['omega'], I)
+        self.requestTiles(k)
+
+    def requestTiles(self, k):
+        '''Ask the worker for the spectra of the tile of rates around k,
+        and of its neighbours so that they are ready before needed'''
+        tile = self.surrogate.tile(k)
+        for t in (tile, tile - 1, tile + 1):
+            key = self.dragKey, t
+            if key in self.surrogate or key in self.pendingTiles:
+                continue
+            self.pendingTiles.add(key)
+            self.requestTile.emit(self.dragJob, self.dragKey, t,
+                                  self.surrogate.rates(t))
+
+    def receiveTile(self, key, tile, I):
+        '''Keep the spectra of a tile of rates, and plot from it if the
+        rate being dragged is in it'''
+        self.pendingTiles.discard((key, tile))
+        if I is None:
             return
-        else:
-            self.hasPlot = True
-        # Calculate spectrum
-        I, self.newParams = spectrum(Z, k, vib, GL, GG, h, omega)
+        self.surrogate.add(key, tile, I)
+        k = self.dragRate
+        if ( key == self.dragKey and k is not None and
+             self.surrogate.tile(k) == tile and self.rate.isDragging() ):
+            self.plotSpectrum.emit(self.dragJob['omega'],
+                                   self.surrogate.interpolate(key, k))
+
+    def receiveSpectrum(self, job, omega, I, newParams):
+        '''Plot a calculated spectrum, unless it is out of date.  For
+        large systems a quick spectrum on a coarse domain comes first,
+        then the spectrum on the full domain replaces it.'''
+        if job['generation'] != self.generation:
+            return
+
         # Send spectrum to plotter and new parameters to peak
         self.plotSpectrum.emit(omega, I)
-        self.peak.setNewParams(*self.newParams)
+        self.peak.setNewParams(*newParams)
 
         # Store data for later
-        self.rateParams = self.rate.getParams()
-        self.exchangeParams = self.exchange.getParams(npeaks)
-        self.limits = self.scale.getScale()
+        self.hasPlot = True
+        self.oldParams = job['params']
+        self.newParams = newParams
+        self.rateParams = job['rateParams']
+        self.exchangeParams = job['exchangeParams']
+        self.limits = job['limits']
+
+    def spectrumFailed(self, generation, message):
+        '''Show why the newest spectrum could not be calculated'''
+        if generation == self.generation:
+            error.showMessage(message)
+
+    def stopWorker(self):
+        '''Stop the worker threads before the application quits'''
+        for thread in (self.workerThread, self.fitThread):
+            thread.quit()
+            thread.wait()
 
     def changeScale(self, recalculate):
         '''Emit the new scale to use after re-plotting with new domain'''
@@ -121,5 +321,145 @@ class Controller(QObject):
     # Plot the data
     plotSpectrum = Signal(ndarray, ndarray)
 
+    # Ask the worker for a spectrum
+    requestSpectrum = Signal(object)
+
+    # Ask the worker for the spectra of a tile of rates
+    requestTile = Signal(object, str, int, ndarray)
+
+    # Ask the fit worker to fit the parameters to raw data
+    requestFit = Signal(int, object)
+
+    # The fitted parameters, as from read_input, or why the fit failed
+    fitFinished = Signal(object)
+    fitFailed = Signal(str)
+
     # Change the scale
     newXLimits = Signal(int, int, bool)
+
+
+class SpectrumWorker(QObject):
+    '''Calculates spectra on a thread of its own'''
+
+    def __init__(self):
+        '''Initialize the worker.  It has no parent so that it can be
+        moved to its thread.'''
+        super(SpectrumWorker, self).__init__()
+        # Caches the stages of the calculation between re-plots
+        self.model = SpectrumModel()
+        # The generation of the newest request, set by the controller
+        self.latest = 0
+
+    #######
+    # SLOTS
+    #######
+
+    def calculate(self, job):
+        '''Calculate the spectrum for one request, only redoing the parts
+        that have changed, then emit'''
+
+        # Don't start on a request that has already been replaced
+        if job['generation'] != self.latest:
+            return
+        vib, GL, GG, h = job['params']
+        omega = job['omega']
+        self.model.update(Z=job['Z'], k=job['k'], vib=vib, Gamma_Lorentz=GL,
+                          Gamma_Gauss=GG, heights=h, omega=omega)
+        try:
+            # For a large system, first send a quick spectrum on a coarse
+            # domain.  The full one uses the same eigensystem.
+            if len(omega) * len(vib) >= COARSE_WORK:
+                newParams = self.model.parameters()
+                coarse = coarse_domain(omega, newParams[0])
+                self.finished.emit(job, coarse,
+                                   self.model.intensity_at(coarse), newParams)
+                # Stop here if the request has been replaced meanwhile
+                if job['generation'] != self.latest:
+                    return
+            I, newParams = self.model.calculate()
+        except SpectrumError as se:
+            self.failed.emit(job['generation'], str(se))
+            return
+        # The model reuses its output array on the next calculation
+        self.finished.emit(job, omega, I.copy(), newParams)
+
+    def sweep(self, job, key, tile, k_values):
+        '''Calculate the spectra of a system at each of a tile of rates,
+        then emit'''
+        # Don't start on a tile of a drag that has ended
+        if job['generation'] != self.latest:
+            self.swept.emit(key, tile, None)
+            return
+        vib, GL, GG, h = job['params']
+        try:
+            I, newParams = rate_sweep(job['Z'], k_values, vib, GL, GG, h,
+                                      job['omega'])
+        except SpectrumError:
+            I = None
+        self.swept.emit(key, tile, I)
+
+    #########
+    # SIGNALS
+    #########
+
+    # The spectra of a tile of rates, or None if they were not calculated
+    swept = Signal(str, int, object)
+
+    # A spectrum, its domain and its new parameters
+    finished = Signal(object, ndarray, ndarray, object)
+
+    # A spectrum could not be calculated
+    failed = Signal(int, str)
+
+
+class FitWorker(QObject):
+    '''Fits the parameters to raw data on a thread of its own'''
+
+    def __init__(self):
+        '''Initialize the worker.  It has no parent so that it can be
+        moved to its thread.'''
+        super(FitWorker, self).__init__()
+        # The generation of the newest request, set by the controller
+        self.latest = 0
+
+    #######
+    # SLOTS
+    #######
+
+    def fit(self, generation, args):
+        '''Fit the parameters read by read_input to their raw data, then
+        emit them'''
+        # Don't start on a request that has already been replaced
+        if generation != self.latest:
+            return
+        # Fitting needs SciPy's optimizers, so it is imported when needed
+        from rapid.common.fit import fit_spectrum, set_parameters, FitError
+        try:
+            result = fit_spectrum(args)
+        except (FitError, SpectrumError) as e:
+            self.fitFailed.emit(generation, str(e))
+            return
+        if not result.success:
+            self.fitFailed.emit(generation, 'The fit did not converge: '
+                                            '{0}'.format(result.message))
+            return
+        set_parameters(args, result)
+        self.fitted.emit(generation, args)
+
+    #########
+    # SIGNALS
+    #########
+
+    # The fitted parameters, or why the fit failed
+    fitted = Signal(int, object)
+    fitFailed = Signal(int, str)
+
+
+def coarse_domain(omega, peaks):
+    '''Return every COARSE_STEP wavenumbers of omega, along with the
+    peak centres inside it so that the coarse plot keeps their heights'''
+    step = omega[1] - omega[0] if len(omega) > 1 else COARSE_STEP
+    stride = max(int(round(COARSE_STEP / abs(step))), 1)
+    peaks = peaks.real
+    inside = peaks[(peaks > omega.min()) & (peaks < omega.max())]
+    return unique(concatenate([omega[::stride], omega[-1:], inside]))
@@ -2,16 +2,26 @@ from __future__ import print_function, division, absolute_import
 
 # Std. lib imports
 from sys import argv, stderr
+from os import environ
+from time import time
 
 # Non-std. lib import
+from PySide.QtCore import QEvent, QObject, QTimer
 from PySide.QtGui import QApplication
 
 # Local imports
 from rapid.pyqtgraph import Qt
 
 
-def run_gui():
-    '''Start the event loop to calculate spectra interactively'''
+def run_gui(start=None):
+    '''Start the event loop to calculate spectra interactively.
+
+    If $RAPID_FIRST_FRAME is set, the time from start (by default,
+    now) until the window is first drawn is printed to standard error,
+    and if it is "exit" the GUI then closes, so that startup can be
+    timed.
+    '''
+    start = time() if start is None else start
 
     # Start the actual event loop
     app = QApplication(argv)
@@ -20,6 +30,33 @@ def run_gui():
     from .mainwindow import MainWindow  # Need to import after QApplication
                                         # is created.
     window = MainWindow()
+    if environ.get('RAPID_FIRST_FRAME'):
+        timer = FirstFrame(start, environ['RAPID_FIRST_FRAME'] == 'exit')
+        window.installEventFilter(timer)
     window.show()
     window.raise_()
     return app.exec_()
+
+
+class FirstFrame(QObject):
+    '''Report the time until the window it is installed on is first drawn'''
+
+    def __init__(self, start, quit=False):
+        super(FirstFrame, self).__init__()
+        self.start = start
+        self.quit = quit
+
+    def eventFilter(self, obj, event):
+        '''Wait for the first paint event'''
+        if event.type() == QEvent.Paint:
+            obj.removeEventFilter(self)
+            # The frame is on screen once this event has been handled
+            QTimer.singleShot(0, self.report)
+        return False
+
+    def report(self):
+        '''Print the time taken, and close if asked to'''
+        print('RAPID: first frame after {0:.3f} s'.format(time() - self.start),
+              file=stderr)
+        if self.quit:
+            QApplication.instance().quit()
@@ -9,7 +9,6 @@ from PySide.QtCore import Signal, QObject, Qt, QRegExp
 from PySide.QtGui import QGroupBox, QVBoxLayout, QHBoxLayout, QLabel, \
                         QLineEdit, QComboBox, QStringListModel, QCheckBox, \
                         QGridLayout, QDoubleValidator, QRadioButton
-from numpy.testing import assert_approx_equal
 from numpy import zeros, vstack, ndenumerate, ndindex, ndarray
 
 # Local imports
@@ -14,8 +14,7 @@ from numpy import loadtxt, array
 from input_reader import ReaderError
 
 # Local imports
-from rapid.pyqtgraph import PlotCurveItem
-from rapid.pyqtgraph import plot as pgplot
+from rapid.pyqtgraph.graphicsItems.PlotCurveItem import PlotCurveItem
 from rapid.common import save_script, read_input, ZMat, write_data
 from rapid.gui.plot import Plot
 from rapid.gui.rate import RateView
@@ -136,6 +135,10 @@ class MainWindow(QMainWindow):
         # If the plot is clicked, send info to the scale widget
         self.plot.pointPicked.connect(self.scale.setSelection)
 
+        # Show the fitted parameters when a fit is done
+        self.control.fitFinished.connect(self.showFit)
+        self.control.fitFailed.connect(self.fitFailed)
+
     def _makeMenu(self):
         '''Makes the menu bar for this widget'''
         # Get the menu bar object
@@ -191,6 +194,15 @@ class MainWindow(QMainWindow):
         exp.setToolTip('Export calculated data to a file for use elsewhere')
         self.fileMenu.addAction(exp)
 
+        # Fit action
+        self.fitAction = QAction('&Fit to raw data', self)
+        self.fitAction.setShortcut(QKeySequence('Ctrl+F'))
+        self.fitAction.triggered.connect(self.fitRawData)
+        self.fitAction.setToolTip('Refine the rate and the peak parameters '
+                                  'so that the calculated data matches the '
+                                  'raw data')
+        self.fileMenu.addAction(self.fitAction)
+
         # Make script action
         scr = QAction('Make Sc&ript', self)
         scr.setShortcut(QKeySequence('Ctrl+R'))
@@ -244,9 +256,23 @@ class MainWindow(QMainWindow):
                               'number of peaks')
             return
         self.exchange.setNumPeaks(npeaks)
+        self.setParameters(args)
+
+        # Plot raw data if it exists
+        if args.raw is not None:
+            self.rawName = args.rawName
+            self.plot.setRawData(args.raw)
+            self.plot.plotRawData()
+            self.clear.setEnabled(True)
+
+        # Set the limits
+        self.scale.setValue(args.xlim[0], args.xlim[1], args.reverse)
+
+    def setParameters(self, args):
+        '''Show the exchange, rate and peaks read by read_input, and plot'''
 
         # Set the exchange
-        matrix = ZMat(npeaks, args.exchanges, args.exchange_rates,
+        matrix = ZMat(len(args.num), args.exchanges, args.exchange_rates,
                       args.symmetric_exchange)
         self.exchange.setMatrixSymmetry(args.symmetric_exchange)
         self.exchange.setMatrix(matrix)
@@ -266,15 +292,27 @@ class MainWindow(QMainWindow):
         # Plot this data
         self.control.setDataForPlot()
 
-        # Plot raw data if it exists
-        if args.raw is not None:
-            self.rawName = args.rawName
-            self.plot.setRawData(args.raw)
-            self.plot.plotRawData()
-            self.clear.setEnabled(True)
+    def fitRawData(self):
+        '''Fit the parameters to the raw data'''
+        if self.plot.rawData is None:
+            error.showMessage('Cannot fit.. there is no raw data to fit to')
+            return
+        message = self.control.fitRawData(self.plot.rawData)
+        if message is not None:
+            error.showMessage(message)
+            return
+        # One fit at a time
+        self.fitAction.setEnabled(False)
 
-        # Set the limits
-        self.scale.setValue(args.xlim[0], args.xlim[1], args.reverse)
+    def showFit(self, args):
+        '''Show the fitted parameters'''
+        self.fitAction.setEnabled(True)
+        self.setParameters(args)
+
+    def fitFailed(self, message):
+        '''Show why the fit failed'''
+        self.fitAction.setEnabled(True)
+        error.showMessage(message)
 
     def saveToInput(self):
         '''Save current settings to current input file if available'''
@@ -324,7 +362,9 @@ class MainWindow(QMainWindow):
         printer.setOutputFileName(self.pdfName)
         printer.setCreator('RAPID')
 
-        # Send to the plot for printing
+        # Send to the plot for printing.  The plot window is only
+        # needed here, so it is imported here.
+        from rapid.pyqtgraph import plot as pgplot
         p = QPainter()
         p.begin(printer)
         x, y = self.plot.calculatedData()
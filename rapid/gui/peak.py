@@ -257,8 +257,9 @@ class PeakModel(QObject):
             self.newGG[i]    = vals[2]
             self.newh[i]     = vals[3]
 
-        # Now broadcast results
-        self.newParams.emit(p, GL, GG, h)
+        # Now broadcast results.  The spectrum returns arrays,
+        # but the signal carries lists.
+        self.newParams.emit(list(p), list(GL), list(GG), list(h))
 
     def changePeakNum(self, npeaks):
         '''Change the number of peaks'''
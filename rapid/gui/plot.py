@@ -7,7 +7,8 @@ from numpy import array
 from random import random
 
 # Local imports
-from rapid.pyqtgraph import PlotWidget, ViewBox
+from rapid.pyqtgraph.widgets.PlotWidget import PlotWidget
+from rapid.pyqtgraph.graphicsItems.ViewBox import ViewBox
 from rapid.common import normalize, clip
 from rapid.gui.guicommon import error
 
@@ -103,7 +104,12 @@ class Plot(PlotWidget):
         except ValueError:  # Occurs on startup
             return
         self.data.setData(x, y)
-        self.replot()
+        # The spectrum arrives after the raw data is first plotted,
+        # so clip the raw data again to the spectrum's domain
+        if self.rawData is not None:
+            self.plotRawData()
+        else:
+            self.replot()
 
     def clearRawData(self):
         '''Clear the raw data'''
@@ -117,8 +123,6 @@ class Plot(PlotWidget):
         self.getPlotItem().setXRange(min, max)
         x, y = self.calculatedData()
         self.plotCalculatedData(x, y)
-        if self.rawData is not None:
-            self.plotRawData()
 
     def catchSelection(self, point):
         '''Catch a point and re-emit'''
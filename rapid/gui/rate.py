@@ -1,14 +1,13 @@
 from __future__ import print_function, division, absolute_import
 
 # Std. lib imports
-from math import pi
+from math import pi, log10
 
 # Non-std. lib imports 
-from PySide.QtCore import Signal, QObject
+from PySide.QtCore import Signal, QObject, Qt
 from PySide.QtGui import QGroupBox, QHBoxLayout, QVBoxLayout, QLabel, \
                         QComboBox, QRadioButton, QStringListModel, \
-                        QLineEdit, QDoubleValidator, QGridLayout
-from numpy.testing import assert_approx_equal
+                        QLineEdit, QDoubleValidator, QGridLayout, QSlider
 
 # Local imports
 from rapid.gui.guicommon import error
@@ -16,6 +15,11 @@ from rapid.gui.guicommon import toolTipText as ttt
 
 HZ2WAVENUM = 1 / ( 100 * 2.99792458E8 * 2 * pi )
 
+# The slider covers 10^SLIDER_MIN to 10^SLIDER_MAX of the current unit,
+# with SLIDER_STEPS steps per decade
+SLIDER_MIN, SLIDER_MAX = -3, 3
+SLIDER_STEPS = 100
+
 
 class Rate(QObject):
     '''Class to hold all information about the function'''
@@ -27,6 +31,7 @@ class Rate(QObject):
         self.lunits = QStringListModel('s ns ps fs'.split(' '))
         self.runits = QStringListModel('Hz GHz THz PHz'.split(' '))
         self.method = ''
+        self.dragging = False
 
     def setConverter(self, unit):
         '''Sets the function to perform rate conversion to cm^{-1}'''
@@ -67,11 +72,26 @@ class Rate(QObject):
     # SLOTS
     #######
 
+    def isDragging(self):
+        '''Returns whether the rate is being dragged'''
+        return self.dragging
+
     def setRate(self, rate):
         '''Sets the rate and emits the result'''
         self.rate = rate
+        self.dragging = False
         self.rateChanged.emit()
 
+    def startDrag(self):
+        '''Announce that the rate is about to be dragged'''
+        self.dragging = True
+        self.dragStarted.emit()
+
+    def dragRate(self, rate):
+        '''Emit a rate that is being dragged through, in wavenumbers.
+        The rate itself is set once the drag ends.'''
+        self.rateDragged.emit(self.converter(rate))
+
     #########
     # SIGNALS
     #########
@@ -79,6 +99,10 @@ class Rate(QObject):
     # The rate changed
     rateChanged = Signal()
 
+    # The rate is being dragged
+    dragStarted = Signal()
+    rateDragged = Signal(float)
+
 #/\/\/\/\/\/\/\
 # The rate view
 #/\/\/\/\/\/\/\
@@ -116,6 +140,14 @@ class RateView(QGroupBox):
         self.unit.setToolTip(ttt('Selects the input unit for the rate '
                                  'or lifetime'))
 
+        # Slider to drag the value through a log scale
+        self.slider = QSlider(Qt.Horizontal, self)
+        self.slider.setRange(SLIDER_MIN * SLIDER_STEPS,
+                             SLIDER_MAX * SLIDER_STEPS)
+        self.slider.setToolTip(ttt('Drag to change the rate or lifetime. '
+                                   'The plot follows approximately while '
+                                   'dragging, and exactly once released'))
+
     def initUI(self):
         '''Lays out the widgets'''
         radios = QVBoxLayout()
@@ -126,6 +158,7 @@ class RateView(QGroupBox):
         rate.addWidget(self.unit, 1, 2)
         rate.addWidget(QLabel("Value: "), 2, 1)
         rate.addWidget(self.rate_value, 2, 2)
+        rate.addWidget(self.slider, 3, 1, 1, 2)
         total = QHBoxLayout()
         total.addLayout(radios)
         total.addStretch()
@@ -149,6 +182,13 @@ class RateView(QGroupBox):
         # If the unit changes, update rate
         self.unit.currentIndexChanged.connect(self.updateUnit)
 
+        # Dragging the slider previews the rate, and releasing it (or
+        # moving it with the keyboard) sets the rate
+        self.slider.sliderPressed.connect(self.model.startDrag)
+        self.slider.sliderMoved.connect(self.dragRate)
+        self.slider.sliderReleased.connect(self.emitSliderRate)
+        self.slider.valueChanged.connect(self.sliderValueChanged)
+
     def setModel(self, model):
         '''Attaches models to the views'''
         self.model = model
@@ -198,11 +238,40 @@ class RateView(QGroupBox):
             rate = self.model.rate
         except AttributeError:
             return
+        self.showRate(rate)
+        # Move the slider to match without emitting anything
+        if rate > 0:
+            self.slider.blockSignals(True)
+            self.slider.setValue(int(round(log10(rate) * SLIDER_STEPS)))
+            self.slider.blockSignals(False)
+
+    def showRate(self, rate):
+        '''Show a rate in the text box'''
         if 0.1 > rate or rate > 100:
             self.rate_value.setText('{0:.3E}'.format(rate))
         else:
             self.rate_value.setText('{0:.3F}'.format(rate))
 
+    def sliderRate(self, value=None):
+        '''Return the rate at a slider position (by default, its own)'''
+        value = self.slider.value() if value is None else value
+        return 10**(value / SLIDER_STEPS)
+
+    def dragRate(self, value):
+        '''Show and preview the rate while the slider is dragged'''
+        rate = self.sliderRate(value)
+        self.showRate(rate)
+        self.model.dragRate(rate)
+
+    def emitSliderRate(self):
+        '''Set the rate where the slider was released'''
+        self.model.setRate(self.sliderRate())
+
+    def sliderValueChanged(self, value):
+        '''Set the rate when the slider is moved other than by dragging'''
+        if not self.slider.isSliderDown():
+            self.model.setRate(self.sliderRate(value))
+
     def emitRate(self):
         '''Converts the text to a float and emits'''
         # Do nothing if there is no number
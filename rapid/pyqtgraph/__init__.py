@@ -183,82 +183,120 @@ if __version__ is None and not hasattr(sys, 'frozen') and sys.version_info[0] ==
 #importAll('widgets', globals(), locals(),
           #excludes=['MatplotlibWidget', 'RawImageWidget', 'RemoteGraphicsView'])
 
-from .graphicsItems.VTickGroup import * 
-from .graphicsItems.GraphicsWidget import * 
-from .graphicsItems.ScaleBar import * 
-from .graphicsItems.PlotDataItem import * 
-from .graphicsItems.GraphItem import * 
-from .graphicsItems.TextItem import * 
-from .graphicsItems.GraphicsLayout import * 
-from .graphicsItems.UIGraphicsItem import * 
-from .graphicsItems.GraphicsObject import * 
-from .graphicsItems.PlotItem import * 
-from .graphicsItems.ROI import * 
-from .graphicsItems.InfiniteLine import * 
-from .graphicsItems.HistogramLUTItem import * 
-from .graphicsItems.GridItem import * 
-from .graphicsItems.GradientLegend import * 
-from .graphicsItems.GraphicsItem import * 
-from .graphicsItems.BarGraphItem import * 
-from .graphicsItems.ViewBox import * 
-from .graphicsItems.ArrowItem import * 
-from .graphicsItems.ImageItem import * 
-from .graphicsItems.AxisItem import * 
-from .graphicsItems.LabelItem import * 
-from .graphicsItems.CurvePoint import * 
-from .graphicsItems.GraphicsWidgetAnchor import * 
-from .graphicsItems.PlotCurveItem import * 
-from .graphicsItems.ButtonItem import * 
-from .graphicsItems.GradientEditorItem import * 
-from .graphicsItems.MultiPlotItem import * 
-from .graphicsItems.ErrorBarItem import * 
-from .graphicsItems.IsocurveItem import * 
-from .graphicsItems.LinearRegionItem import * 
-from .graphicsItems.FillBetweenItem import * 
-from .graphicsItems.LegendItem import * 
-from .graphicsItems.ScatterPlotItem import * 
-from .graphicsItems.ItemGroup import * 
-
-from .widgets.MultiPlotWidget import * 
-from .widgets.ScatterPlotWidget import * 
-from .widgets.ColorMapWidget import * 
-from .widgets.FileDialog import * 
-from .widgets.ValueLabel import * 
-from .widgets.HistogramLUTWidget import * 
-from .widgets.CheckTable import * 
-from .widgets.BusyCursor import * 
-from .widgets.PlotWidget import * 
-from .widgets.ComboBox import * 
-from .widgets.GradientWidget import * 
-from .widgets.DataFilterWidget import * 
-from .widgets.SpinBox import * 
-from .widgets.JoystickButton import * 
-from .widgets.GraphicsLayoutWidget import * 
-from .widgets.TreeWidget import * 
-from .widgets.PathButton import * 
-from .widgets.VerticalLabel import * 
-from .widgets.FeedbackButton import * 
-from .widgets.ColorButton import * 
-from .widgets.DataTreeWidget import * 
-from .widgets.GraphicsView import * 
-from .widgets.LayoutWidget import * 
-from .widgets.TableWidget import * 
-from .widgets.ProgressDialog import *
-
-from .imageview import *
+## RAPID: The graphics items and widgets are imported the first time they
+## are used rather than here, since importing all of them makes the GUI
+## slow to start and RAPID needs only a few.  _LAZY_MODULES lists the names
+## that each module used to add here with "from module import *".
+_LAZY_MODULES = (
+    ('graphicsItems.VTickGroup', ['VTickGroup']),
+    ('graphicsItems.GraphicsWidget', ['GraphicsWidget']),
+    ('graphicsItems.ScaleBar', ['ScaleBar']),
+    ('graphicsItems.PlotDataItem', ['PlotDataItem', 'dataType', 'isSequence']),
+    ('graphicsItems.GraphItem', ['GraphItem']),
+    ('graphicsItems.TextItem', ['TextItem']),
+    ('graphicsItems.GraphicsLayout', ['GraphicsLayout']),
+    ('graphicsItems.UIGraphicsItem', ['UIGraphicsItem']),
+    ('graphicsItems.GraphicsObject', ['GraphicsObject']),
+    ('graphicsItems.PlotItem', ['PlotItem']),
+    ('graphicsItems.ROI', ['ROI', 'TestROI', 'RectROI', 'EllipseROI',
+                           'CircleROI', 'PolygonROI', 'LineROI',
+                           'MultiLineROI', 'MultiRectROI', 'LineSegmentROI',
+                           'PolyLineROI', 'SpiralROI', 'CrosshairROI']),
+    ('graphicsItems.InfiniteLine', ['InfiniteLine']),
+    ('graphicsItems.HistogramLUTItem', ['HistogramLUTItem']),
+    ('graphicsItems.GridItem', ['GridItem']),
+    ('graphicsItems.GradientLegend', ['GradientLegend']),
+    ('graphicsItems.GraphicsItem', ['GraphicsItem']),
+    ('graphicsItems.BarGraphItem', ['BarGraphItem']),
+    ('graphicsItems.ViewBox', ['ViewBox']),
+    ('graphicsItems.ArrowItem', ['ArrowItem']),
+    ('graphicsItems.ImageItem', ['ImageItem']),
+    ('graphicsItems.AxisItem', ['AxisItem']),
+    ('graphicsItems.LabelItem', ['LabelItem']),
+    ('graphicsItems.CurvePoint', ['CurvePoint', 'CurveArrow']),
+    ('graphicsItems.GraphicsWidgetAnchor', ['GraphicsWidgetAnchor']),
+    ('graphicsItems.PlotCurveItem', ['PlotCurveItem']),
+    ('graphicsItems.ButtonItem', ['ButtonItem']),
+    ('graphicsItems.GradientEditorItem', ['TickSliderItem',
+                                          'GradientEditorItem']),
+    ('graphicsItems.MultiPlotItem', ['MultiPlotItem']),
+    ('graphicsItems.ErrorBarItem', ['ErrorBarItem']),
+    ('graphicsItems.IsocurveItem', ['IsocurveItem']),
+    ('graphicsItems.LinearRegionItem', ['LinearRegionItem']),
+    ('graphicsItems.FillBetweenItem', ['FillBetweenItem']),
+    ('graphicsItems.LegendItem', ['LegendItem']),
+    ('graphicsItems.ScatterPlotItem', ['ScatterPlotItem', 'SpotItem']),
+    ('graphicsItems.ItemGroup', ['ItemGroup']),
+
+    ('widgets.MultiPlotWidget', ['MultiPlotWidget']),
+    ('widgets.ScatterPlotWidget', ['ScatterPlotWidget']),
+    ('widgets.ColorMapWidget', ['ColorMapWidget']),
+    ('widgets.FileDialog', ['FileDialog']),
+    ('widgets.ValueLabel', ['ValueLabel']),
+    ('widgets.HistogramLUTWidget', ['HistogramLUTWidget']),
+    ('widgets.CheckTable', ['CheckTable']),
+    ('widgets.BusyCursor', ['BusyCursor']),
+    ('widgets.PlotWidget', ['PlotWidget']),
+    ('widgets.ComboBox', ['ComboBox']),
+    ('widgets.GradientWidget', ['GradientWidget']),
+    ('widgets.DataFilterWidget', ['DataFilterWidget']),
+    ('widgets.SpinBox', ['SpinBox']),
+    ('widgets.JoystickButton', ['JoystickButton']),
+    ('widgets.GraphicsLayoutWidget', ['GraphicsLayoutWidget']),
+    ('widgets.TreeWidget', ['TreeWidget', 'TreeWidgetItem']),
+    ('widgets.PathButton', ['PathButton']),
+    ('widgets.VerticalLabel', ['VerticalLabel']),
+    ('widgets.FeedbackButton', ['FeedbackButton']),
+    ('widgets.ColorButton', ['ColorButton']),
+    ('widgets.DataTreeWidget', ['DataTreeWidget']),
+    ('widgets.GraphicsView', ['GraphicsView']),
+    ('widgets.LayoutWidget', ['LayoutWidget']),
+    ('widgets.TableWidget', ['TableWidget']),
+    ('widgets.ProgressDialog', ['ProgressDialog']),
+
+    ('imageview', ['ImageView']),
+    ('graphicsWindows', ['GraphicsWindow', 'TabWindow', 'PlotWindow',
+                         'ImageWindow']),
+    ('colormap', ['ColorMap']),
+)
+_LAZY = dict((name, module) for module, names in _LAZY_MODULES
+             for name in names)
+
+## These are cheap, and share their names with their modules, so that
+## importing the module later would hide the name
 from .WidgetGroup import *
+from .SignalProxy import *
 from .Point import Point
 from .Vector import Vector
 from .SRTTransform import SRTTransform
 from .Transform3D import Transform3D
 from .SRTTransform3D import SRTTransform3D
 from .functions import *
-from .graphicsWindows import *
-from .SignalProxy import *
-from .colormap import *
 from .ptime import time
 from .Qt import isQObjectAlive
 
+import importlib
+
+def _load(name):
+    """Import the module that defines *name* and return *name* from it."""
+    module = importlib.import_module('.' + _LAZY[name], __name__)
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+if sys.version_info < (3, 7):
+    ## Modules can't define __getattr__, so import everything now
+    for _name in _LAZY:
+        _load(_name)
+else:
+    def __getattr__(name):
+        if name in _LAZY:
+            return _load(name)
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+    def __dir__():
+        return sorted(set(globals()) | set(_LAZY))
+
 
 ##############################################################
 ## PyQt and PySide both are prone to crashing on exit. 
@@ -274,7 +312,11 @@ def cleanup():
     if not getConfigOption('exitCleanup'):
         return
     
-    ViewBox.quit()  ## tell ViewBox that it doesn't need to deregister views anymore.
+    ## tell ViewBox that it doesn't need to deregister views anymore.
+    ## (RAPID: only if it was ever imported)
+    viewbox = sys.modules.get(__name__ + '.graphicsItems.ViewBox.ViewBox')
+    if viewbox is not None:
+        viewbox.ViewBox.quit()
     
     ## Workaround for Qt exit crash:
     ## ALL QGraphicsItems must have a scene before they are deleted.
@@ -367,6 +409,7 @@ def plot(*args, **kargs):
         else:
             dataArgs[k] = kargs[k]
         
+    from .graphicsWindows import PlotWindow
     w = PlotWindow(**pwArgs)
     if len(args) > 0 or len(dataArgs) > 0:
         w.plot(*args, **dataArgs)
@@ -383,6 +426,7 @@ def image(*args, **kargs):
     All other arguments are used to show data. (see :func:`ImageView.setImage() <pyqtgraph.ImageView.setImage>`)
     """
     mkQApp()
+    from .graphicsWindows import ImageWindow
     w = ImageWindow(*args, **kargs)
     images.append(w)
     w.show()
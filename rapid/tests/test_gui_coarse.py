@@ -0,0 +1,59 @@
+from __future__ import print_function, division, absolute_import
+
+# Non-std lib imports
+import pytest
+from numpy import array, diff, linspace
+from numpy.testing import assert_allclose
+
+pytest.importorskip('PySide')
+
+# Local imports
+from rapid.common.spectrum import spectrum
+from rapid.gui.controller import SpectrumWorker, coarse_domain, \
+                                 COARSE_STEP, COARSE_WORK
+
+
+def test_coarse_domain():
+    omega = linspace(1900, 2050, 1501)
+    peaks = array([1949.83, 1970.31, 2100.0]) + 0.5j
+    coarse = coarse_domain(omega, peaks)
+    # Every COARSE_STEP wavenumbers, the end, and the peaks inside
+    assert coarse[0] == omega[0] and coarse[-1] == omega[-1]
+    assert 1949.83 in coarse and 1970.31 in coarse
+    assert 2100.0 not in coarse
+    assert (diff(coarse) > 0).all() and diff(coarse).max() <= COARSE_STEP
+    assert len(coarse) < 150 / COARSE_STEP + 5
+
+    # A domain coarser than the step is kept whole
+    omega = linspace(1900, 2050, 11)
+    assert_allclose(coarse_domain(omega, peaks[:0]), omega)
+
+
+def test_coarse_first(job):
+    worker = SpectrumWorker()
+    finished = []
+    worker.finished.connect(lambda *args: finished.append(args))
+    job['omega'] = linspace(1900, 2050, COARSE_WORK // 3 + 1)
+    worker.latest = job['generation']
+    worker.calculate(job)
+
+    # The coarse spectrum comes first, then the full one
+    [(_, coarse, I_coarse, _), (_, omega, I, _)] = finished
+    assert len(coarse) < len(omega) // 10
+    vib, GL, GG, h = job['params']
+    for x, y in ((coarse, I_coarse), (omega, I)):
+        assert_allclose(y, spectrum(job['Z'], job['k'], vib, GL, GG, h, x)[0])
+
+
+def test_coarse_replaced(job):
+    # A request replaced while its coarse spectrum is plotted stops
+    worker = SpectrumWorker()
+    finished = []
+    def replace(*args):
+        finished.append(args)
+        worker.latest += 1
+    worker.finished.connect(replace)
+    job['omega'] = linspace(1900, 2050, COARSE_WORK // 3 + 1)
+    worker.latest = job['generation']
+    worker.calculate(job)
+    assert len(finished) == 1
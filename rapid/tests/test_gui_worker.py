@@ -0,0 +1,64 @@
+from __future__ import print_function, division, absolute_import
+
+# Non-std lib imports
+import pytest
+from numpy.testing import assert_allclose
+
+pytest.importorskip('PySide')
+
+# Local imports
+from rapid.common.spectrum import spectrum
+from rapid.gui.controller import SpectrumWorker, FitWorker
+
+
+def connect(signal):
+    '''Return a list that collects the arguments of each emission of a
+    signal'''
+    emitted = []
+    signal.connect(lambda *args: emitted.append(args))
+    return emitted
+
+
+def test_calculate(job):
+    worker = SpectrumWorker()
+    finished = connect(worker.finished)
+    job['generation'] = 2
+
+    # A request that has been replaced is skipped
+    worker.latest = 3
+    worker.calculate(job)
+    assert finished == []
+
+    worker.latest = 2
+    worker.calculate(job)
+    [(j, omega, I, newParams)] = finished
+    assert j is job
+    vib, GL, GG, h = job['params']
+    I0, params0 = spectrum(job['Z'], job['k'], vib, GL, GG, h, job['omega'])
+    assert_allclose(omega, job['omega'])
+    assert_allclose(I, I0)
+    for p, p0 in zip(newParams, params0):
+        assert_allclose(p, p0)
+
+    # The emitted spectrum isn't changed by the next calculation
+    I = I.copy()
+    job = dict(job, k=10 * job['k'])
+    worker.calculate(job)
+    assert_allclose(finished[0][2], I)
+
+
+def test_sweep_stale(job):
+    worker = SpectrumWorker()
+    swept = connect(worker.swept)
+    worker.latest = 2
+    worker.sweep(job, 'key', 0, [1.0, 10.0])
+    # The controller is told, so that it may request the tile again
+    assert swept == [('key', 0, None)]
+
+
+def test_fit_stale():
+    worker = FitWorker()
+    fitted, failed = connect(worker.fitted), connect(worker.fitFailed)
+    worker.latest = 2
+    worker.fit(1, None)
+    assert fitted == [] and failed == []
@@ -0,0 +1,62 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+import sys
+from os.path import abspath, dirname, pathsep
+from os import environ
+from subprocess import check_output
+
+# Non-std lib imports
+import pytest
+
+# Local imports
+import rapid.common
+import rapid.cl
+
+HEAVY = "sorted(m for m in ('numpy', 'scipy', 'matplotlib') if m in " \
+        "sys.modules)"
+
+
+def run(code):
+    '''Run code in a fresh Python and return what it prints'''
+    env = dict(environ)
+    root = dirname(dirname(dirname(abspath(__file__))))
+    env['PYTHONPATH'] = pathsep.join([root] + sys.path)
+    return check_output([sys.executable, '-c', code],
+                        env=env).decode('utf-8').strip()
+
+
+def test_import_is_light():
+    assert run('import sys, rapid, rapid.common, rapid.cl; '
+               'print({0})'.format(HEAVY)) == '[]'
+
+
+@pytest.mark.parametrize('option', ['--version', '--help'])
+def test_command_line_is_light(option):
+    code = ('import sys\n'
+            'sys.argv = ["rapid", "{0}"]\n'
+            'from rapid.__main__ import main\n'
+            'try:\n'
+            '    main()\n'
+            'except SystemExit:\n'
+            '    pass\n'
+            'print({1})'.format(option, HEAVY))
+    assert run(code).splitlines()[-1] == '[]'
+
+
+@pytest.mark.parametrize('package', [rapid, rapid.common, rapid.cl])
+def test_exports(package):
+    for name in package.__all__:
+        assert callable(getattr(package, name))
+        assert name in dir(package)
+    with pytest.raises(AttributeError):
+        package.not_exported
+
+
+def test_function_beats_module():
+    # Importing a submodule must not replace the function of its name
+    import rapid.common.spectrum
+    import rapid.common.sweep
+    from rapid.common.spectrum import spectrum
+    assert rapid.common.spectrum is spectrum
+    assert callable(rapid.common.rate_sweep)
@@ -0,0 +1,74 @@
+from __future__ import print_function, division, absolute_import
+
+# Std. lib imports
+import ast
+import sys
+import warnings
+from glob import glob
+from os import environ
+from os.path import abspath, dirname, exists, join, pathsep
+from subprocess import check_output
+
+# Non-std lib imports
+import pytest
+
+ROOT = dirname(dirname(dirname(abspath(__file__))))
+PYQTGRAPH = join(ROOT, 'rapid', 'pyqtgraph')
+
+
+def lazy_modules():
+    '''Return _LAZY_MODULES from the bundled pyqtgraph's __init__,
+    without importing it (which needs Qt)'''
+    with open(join(PYQTGRAPH, '__init__.py')) as fl:
+        tree = ast.parse(fl.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and \
+           [t.id for t in node.targets] == ['_LAZY_MODULES']:
+            return ast.literal_eval(node.value)
+    raise AssertionError('_LAZY_MODULES is missing')
+
+
+def defined_names(module):
+    '''Return the names defined at the top level of a module of the
+    bundled pyqtgraph, or of any module in it if it is a package'''
+    path = join(PYQTGRAPH, *module.split('.'))
+    files = [path + '.py'] if exists(path + '.py') \
+            else glob(join(path, '*.py'))
+    names = set()
+    for name in files:
+        with open(name) as fl, warnings.catch_warnings():
+            # The bundled sources have old-style escapes in docstrings
+            warnings.simplefilter('ignore', DeprecationWarning)
+            body = ast.parse(fl.read()).body
+        for node in body:
+            if isinstance(node, (ast.ClassDef, ast.FunctionDef)):
+                names.add(node.name)
+            elif isinstance(node, ast.Assign):
+                names.update(t.id for t in node.targets
+                             if isinstance(t, ast.Name))
+    return names
+
+
+def test_lazy_table():
+    # Each name is defined by the module it is loaded from, and only
+    # one module gives each name
+    seen = set()
+    for module, names in lazy_modules():
+        assert set(names) <= defined_names(module), module
+        assert not seen & set(names)
+        seen.update(names)
+    assert {'PlotWidget', 'ViewBox', 'PlotCurveItem'} <= seen
+
+
+def test_lazy_import():
+    pytest.importorskip('PySide')
+    env = dict(environ)
+    env['PYTHONPATH'] = pathsep.join([ROOT] + sys.path)
+    code = ('import sys\n'
+            'import rapid.pyqtgraph as pg\n'
+            'print("rapid.pyqtgraph.imageview" in sys.modules)\n'
+            'print(pg.PlotWidget.__name__, "PlotWidget" in dir(pg))\n'
+            'print("rapid.pyqtgraph.imageview" in sys.modules)\n')
+    output = check_output([sys.executable, '-c', code], env=env)
+    assert output.decode('utf-8').split() == ['False', 'PlotWidget', 'True',
+                                              'False']
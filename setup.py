@@ -28,7 +28,7 @@ try:
 except IOError:
     LONG_DESCRIPTION = DESCRIPTION
 
-required = ['argparse', 'input_reader >=1.2.2', 'numpy >=1.7',
+required = ['argparse', 'input_reader >=1.2.2', 'numpy >=1.15',
             'matplotlib', 'scipy', 'PySide']
 
 # Define the build